@@ -0,0 +1 @@
+"""Endpoint benchmarks, run with `python -m benchmarks`"""
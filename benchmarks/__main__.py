@@ -0,0 +1,219 @@
+"""Benchmark the app's endpoints against local stand-ins for all upstreams
+
+Starts fake upstreams, points the app at them, and reports throughput and p50/p95/p99 latency per endpoint as
+JSON. Run from the repository root:
+
+    uv run python -m benchmarks --mode uvicorn --concurrency 32 --requests 2000 --output bench.json
+
+A previous report can be given with --baseline to include the relative change of each scenario.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import yaml
+
+from tests.upstreams import TokenSigner, upstream_app
+
+from .load import Scenario, free_port, run, serve
+
+AUDIENCE = "ibidem.no:deploy"
+REPOSITORY = "benchmark/repo"
+NAMESPACES = ["default", "staging", "production", "monitoring"]
+ICON_NAME = "benchmark_icon"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, in uvicorn mode")
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests per scenario")
+    parser.add_argument("--tokens", type=int, default=200, help="Number of distinct OIDC tokens to cycle through")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="Added latency of fake upstreams, in ms")
+    parser.add_argument("--scenario", action="append", help="Only run the named scenarios")
+    parser.add_argument("--baseline", type=Path, help="Earlier report to compare against")
+    parser.add_argument("--output", type=Path, help="Write the report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def scenarios(signer: TokenSigner, token_count: int) -> list[Scenario]:
+    tokens = [signer.sign(REPOSITORY) for _ in range(token_count)]
+
+    def token_bodies():
+        return ({"token": token} for token in itertools.cycle(tokens))
+
+    return [
+        Scenario("token", "POST", "/api/v1/token/", token_bodies),
+        Scenario("kubeconfig", "POST", "/api/v1/token/kubeconfig", token_bodies),
+        Scenario("batch", "POST", "/api/v1/token/batch", token_bodies),
+        Scenario("batch_kubeconfig", "POST", "/api/v1/token/batch/kubeconfig", token_bodies),
+        Scenario("weather", "GET", "/api/v1/weather/"),
+        Scenario("icon", "GET", f"/api/v1/weather/icon/{ICON_NAME}"),
+        Scenario("dietpi", "GET", "/api/v1/suc/dietpi", expected_status=302),
+    ]
+
+
+def app_environment(upstream: str, workdir: Path) -> dict[str, str]:
+    """Settings pointing the app at the fake upstreams"""
+    subjects = workdir / "deploy_subjects.yaml"
+    subjects.write_text(
+        yaml.safe_dump(
+            {
+                "deploy_subjects": [
+                    {
+                        "repository": REPOSITORY,
+                        "targets": [
+                            {"namespace": namespace, "service_account": "benchmark"} for namespace in NAMESPACES
+                        ],
+                    }
+                ]
+            }
+        )
+    )
+    kubeconfig = workdir / "kubeconfig"
+    kubeconfig.write_text(
+        yaml.safe_dump(
+            {
+                "apiVersion": "v1",
+                "kind": "Config",
+                "current-context": "benchmark",
+                "clusters": [{"name": "benchmark", "cluster": {"server": upstream}}],
+                "contexts": [{"name": "benchmark", "context": {"cluster": "benchmark", "user": "benchmark"}}],
+                "users": [{"name": "benchmark", "user": {"token": "benchmark"}}],
+            }
+        )
+    )
+    resolvers = [{"name": "dietpi", "parser": "dietpi", "url": f"{upstream}/dietpi/version"}]
+    return {
+        "MODE": "Release",
+        "OIDC_AUDIENCE": AUDIENCE,
+        "JWKS_URL": f"{upstream}/.well-known/jwks",
+        "NOWCAST_URL": f"{upstream}/weatherapi/nowcast/2.0/complete",
+        "ICON_BASE_URL": f"{upstream}/weathericons",
+        "FORECAST_LOCATION__LATITUDE": "59.9",
+        "FORECAST_LOCATION__LONGTITUDE": "10.7",
+        "SUC_RESOLVERS": json.dumps(resolvers),
+        "DEPLOY_SUBJECTS_PATH": str(subjects),
+        "KUBECONFIG": str(kubeconfig),
+        # Every scenario hammers a single repository
+        "TOKEN_RATE_LIMIT": "0",
+    }
+
+
+@contextlib.asynccontextmanager
+async def inprocess_app(env: dict[str, str]):
+    os.environ.update(env)
+    from ibidem.ibidem_api.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            yield client
+
+
+@contextlib.asynccontextmanager
+async def uvicorn_app(env: dict[str, str], concurrency: int, workers: int):
+    port = free_port()
+    # Started the way the app is deployed, so the server settings apply
+    server_env = {"BIND_ADDRESS": "127.0.0.1", "PORT": str(port), "WORKERS": str(workers)}
+    command = [sys.executable, "-m", "ibidem.ibidem_api"]
+    process = await asyncio.create_subprocess_exec(
+        *command, env={**os.environ, **env, **server_env}, stdout=asyncio.subprocess.DEVNULL
+    )
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            yield client
+    finally:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(httpx.HTTPError):
+            resp = await client.get("/_/ready")
+            if resp.status_code == 200:
+                return
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"App was not ready within {timeout}s")
+
+
+def compare(report: dict, baseline: dict):
+    """Add the relative change from the baseline of throughput and latency percentiles to each scenario"""
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        change = {"throughput_rps": _change(before["throughput_rps"], result["throughput_rps"])}
+        for percentile in ("p50", "p95", "p99"):
+            change[percentile] = _change(before["latency_ms"][percentile], result["latency_ms"][percentile])
+        result["change_from_baseline"] = change
+    report["baseline_commit"] = baseline.get("commit")
+
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return round((after - before) / before, 4)
+
+
+def _commit() -> str | None:
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    return None
+
+
+async def main(args) -> dict:
+    signer = TokenSigner(AUDIENCE)
+    upstream_port = free_port()
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    selected = [s for s in scenarios(signer, args.tokens) if not args.scenario or s.name in args.scenario]
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "workers": args.workers if args.mode == "uvicorn" else 1,
+        "requests": args.requests,
+        "upstream_latency_ms": args.upstream_latency,
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        env = app_environment(upstream, Path(workdir))
+        app = inprocess_app(env) if args.mode == "inprocess" else uvicorn_app(env, args.concurrency, args.workers)
+        async with serve(upstream_app(signer, args.upstream_latency / 1000), upstream_port), app as client:
+            await wait_until_ready(client)
+            for scenario in selected:
+                result = await run(client, scenario, args.requests, args.concurrency, args.warmup)
+                report["scenarios"][scenario.name] = result.summary()
+    if args.baseline:
+        compare(report, json.loads(args.baseline.read_text()))
+    return report
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    output = json.dumps(asyncio.run(main(arguments)), indent=2)
+    if arguments.output:
+        arguments.output.write_text(output + "\n")
+    else:
+        print(output)
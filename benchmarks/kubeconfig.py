@@ -0,0 +1,67 @@
+"""Per-request cost of serializing a kubeconfig, building the models every time versus filling in a template
+
+The model approach is what the endpoint did before templates: build the models, and let FastAPI encode them to a
+JSON response. Run from the repository root:
+
+    uv run python -m benchmarks.kubeconfig --iterations 20000
+"""
+
+import argparse
+import json
+import secrets
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from ibidem.ibidem_api.api.v1.token.kubeconfig import KubeConfigTemplate
+from ibidem.ibidem_api.api.v1.token.models import KubeConfig
+
+from .load import MICROSECONDS, percentile
+
+SERVER = "https://kubernetes.example.com:6443"
+
+
+def models_json(ca_crt: bytes, token: str) -> bytes:
+    config = KubeConfig.make(ca_crt, token, SERVER)
+    return JSONResponse(jsonable_encoder(config, by_alias=True)).body
+
+
+def models_orjson(ca_crt: bytes, token: str) -> bytes:
+    config = KubeConfig.make(ca_crt, token, SERVER)
+    return ORJSONResponse(jsonable_encoder(config, by_alias=True)).body
+
+
+def measure(render, iterations: int) -> dict:
+    tokens = [secrets.token_urlsafe(600) for _ in range(64)]
+    latencies = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        render(token)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_us": percentile(latencies, 50, MICROSECONDS),
+        "p99_us": percentile(latencies, 99, MICROSECONDS),
+        "mean_us": round(sum(latencies) / iterations * MICROSECONDS, 3),
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.kubeconfig", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--ca-size", type=int, default=1200, help="Size of the CA certificate, in bytes")
+    args = parser.parse_args(argv)
+    ca_crt = secrets.token_bytes(args.ca_size)
+    template = KubeConfigTemplate.make(ca_crt, SERVER)
+    return {
+        "models_json": measure(lambda token: models_json(ca_crt, token), args.iterations),
+        "models_orjson": measure(lambda token: models_orjson(ca_crt, token), args.iterations),
+        "template_json": measure(lambda token: template.render("application/json", token), args.iterations),
+        "template_yaml": measure(lambda token: template.render("application/yaml", token), args.iterations),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
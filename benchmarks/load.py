@@ -0,0 +1,114 @@
+"""Drives scenarios against the app at a fixed concurrency, and summarises their latency"""
+
+import asyncio
+import contextlib
+import itertools
+import socket
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+import httpx
+import uvicorn
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    bodies: Optional[Callable[[], Iterator[dict]]] = None
+    expected_status: int = 200
+
+
+@dataclass
+class Result:
+    latencies: list[float] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": len(self.latencies) + sum(self.errors.values()),
+            "errors": self.errors,
+            "throughput_rps": round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "latency_ms": {
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "p99": percentile(ordered, 99),
+                "mean": round(statistics.fmean(ordered) * 1000, 3) if ordered else None,
+                "max": round(ordered[-1] * 1000, 3) if ordered else None,
+            },
+        }
+
+
+MILLISECONDS = 1000
+MICROSECONDS = 1_000_000
+
+
+def percentile(ordered: list[float], rank_percent: int, unit: int = MILLISECONDS) -> Optional[float]:
+    """Nearest-rank percentile of sorted latencies in seconds, converted to `unit` per second"""
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, round(rank_percent / 100 * len(ordered)) - 1))
+    return round(ordered[rank] * unit, 3)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def serve(app, port: int, **config):
+    """Serve an app with uvicorn on localhost, passing any other `config` on to uvicorn"""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off", **config)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield
+    finally:
+        server.should_exit = True
+        await task
+
+
+async def run(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int, warmup: int) -> Result:
+    """Send `requests` requests for a scenario from `concurrency` concurrent workers, after `warmup` unmeasured ones
+
+    Only responses with the expected status count towards latency, everything else is counted as an error."""
+    bodies = scenario.bodies() if scenario.bodies else itertools.repeat(None)
+    await _drive(client, scenario, bodies, warmup, concurrency, Result())
+    result = Result()
+    start = time.perf_counter()
+    await _drive(client, scenario, bodies, requests, concurrency, result)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def _drive(client, scenario: Scenario, bodies: Iterator, requests: int, concurrency: int, result: Result):
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            body = next(bodies)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(scenario.method, scenario.path, json=body)
+            except httpx.HTTPError as e:
+                _count(result, type(e).__name__)
+                continue
+            if resp.status_code == scenario.expected_status:
+                result.latencies.append(time.perf_counter() - start)
+            else:
+                _count(result, str(resp.status_code))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def _count(result: Result, error: str):
+    result.errors[error] = result.errors.get(error, 0) + 1
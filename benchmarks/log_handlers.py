@@ -0,0 +1,103 @@
+"""Cost of logging on the event loop during a burst of token requests, per handler setup
+
+Every simulated request logs what the token endpoint logs for a valid request. The time each logging call blocks
+the caller is measured, writing to a fast stream and to a stream with a fixed delay per write, standing in for a
+backpressured log collector. Run from the repository root:
+
+    uv run python -m benchmarks.log_handlers --requests 5000 --write-delay 1
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from uvicorn.logging import DefaultFormatter
+
+from ibidem.ibidem_api.core.log_conf import QueueStreamHandler, RateLimitFilter
+
+from .load import MICROSECONDS, percentile
+
+FORMAT = "[%(asctime)s|%(levelprefix)s] %(message)s [%(name)s|%(threadName)s]"
+
+
+class SlowStream:
+    """Writes to /dev/null, taking `delay` seconds per write"""
+
+    def __init__(self, delay: float):
+        self._delay = delay
+        self._devnull = open(os.devnull, "w")
+
+    def write(self, data: str):
+        time.sleep(self._delay)
+        self._devnull.write(data)
+
+    def flush(self):
+        self._devnull.flush()
+
+    def close(self):
+        self._devnull.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def handlers(stream) -> dict[str, logging.Handler]:
+    stream_handler = logging.StreamHandler(stream)
+    queue_handler = QueueStreamHandler(stream, queue_size=100000)
+    limited_handler = QueueStreamHandler(stream, queue_size=100000)
+    # Rate limiting is off by default, so the benchmark sets a limit
+    limited_handler.addFilter(RateLimitFilter(rate=10.0, burst=50))
+    for handler in (stream_handler, queue_handler, limited_handler):
+        handler.setFormatter(DefaultFormatter(FORMAT, use_colors=False))
+    return {"stream": stream_handler, "queue": queue_handler, "queue_rate_limited": limited_handler}
+
+
+def burst(handler: logging.Handler, requests: int) -> dict:
+    log = logging.getLogger("ibidem.ibidem_api.api.v1.token")
+    log.handlers[:] = [handler]
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        repository = f"org/repo-{i % 50}"
+        call_start = time.perf_counter()
+        log.info("Received valid token for repository: %r", repository)
+        log.info("Created k8s token for service account %r in namespace %r", f"deploy-{i % 50}", "default")
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    handler.close()
+    latencies.sort()
+    return {
+        "requests": requests,
+        "burst_ms": round(elapsed * 1000, 3),
+        "per_request_us": {
+            "p50": percentile(latencies, 50, MICROSECONDS),
+            "p99": percentile(latencies, 99, MICROSECONDS),
+            "max": percentile(latencies, 100, MICROSECONDS),
+        },
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.log_handlers", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--write-delay", type=float, default=1.0, help="Delay per write of the slow stream, in ms")
+    args = parser.parse_args(argv)
+    report = {}
+    for stream_name, make_stream in (
+        ("fast_stream", lambda: open(os.devnull, "w")),
+        ("slow_stream", lambda: SlowStream(args.write_delay / 1000)),
+    ):
+        with make_stream() as stream:
+            report[stream_name] = {name: burst(handler, args.requests) for name, handler in handlers(stream).items()}
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
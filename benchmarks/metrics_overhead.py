@@ -0,0 +1,101 @@
+"""Overhead of the metrics middleware on a trivial route
+
+Calls an app with one route that returns a small JSON document directly over ASGI, with no server or client in
+between, with and without MetricsMiddleware in front of it. The difference in latency is what recording request
+metrics costs each request. Metrics are kept in process memory, as with a single worker. Run from the repository
+root:
+
+    uv run python -m benchmarks.metrics_overhead --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.core.metrics import MetricsMiddleware
+
+from .load import MICROSECONDS, percentile
+
+
+def trivial_app(metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/things/{name}")
+    async def thing(name: str):
+        return {"name": name}
+
+    if metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def call(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"Unexpected status {status} for {path}")
+
+
+async def measure(app, requests: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await call(app, f"/things/{i}")
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await call(app, f"/things/{i}")
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_us": percentile(latencies, 50, MICROSECONDS),
+        "p99_us": percentile(latencies, 99, MICROSECONDS),
+        "mean_us": round(sum(latencies) / len(latencies) * MICROSECONDS, 3),
+    }
+
+
+async def compare(requests: int, warmup: int) -> dict:
+    report = {
+        "without_metrics": await measure(trivial_app(metrics=False), requests, warmup),
+        "with_metrics": await measure(trivial_app(metrics=True), requests, warmup),
+    }
+    report["overhead_us"] = {
+        key: round(report["with_metrics"][key] - report["without_metrics"][key], 3) for key in ("p50_us", "mean_us")
+    }
+    return report
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.metrics_overhead", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    args = parser.parse_args(argv)
+    return asyncio.run(compare(args.requests, args.warmup))
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
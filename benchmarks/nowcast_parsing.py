@@ -0,0 +1,84 @@
+"""Time and peak memory of parsing a met.no nowcast document, in full and only the steps that are used
+
+The full parse validates the whole document into the forecast models, which is what the weather endpoint did for
+every request before forecasts were prefetched. The partial parses decode and validate only the first steps of
+the timeseries step by step, one step for the current weather, and 24 for a forecast series. The fetch case is
+what each nowcast fetch does, deriving the current weather and a series of the configured number of steps.
+Documents are read from the fixtures directory, and follow the format of nowcast 2.0 responses from api.met.no.
+Run from the repository root:
+
+    uv run python -m benchmarks.nowcast_parsing --fixture benchmarks/fixtures/nowcast_oslo.json
+"""
+
+import argparse
+import functools
+import json
+import pathlib
+import time
+import tracemalloc
+
+from ibidem.ibidem_api.api.v1.weather.models import METJSONForecast
+from ibidem.ibidem_api.api.v1.weather.nowcast import parse_forecast, parse_time_steps
+from ibidem.ibidem_api.core.config import Settings
+
+from .load import MICROSECONDS, percentile
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+
+
+def full_parse(raw: bytes):
+    forecast = METJSONForecast.model_validate(json.loads(raw))
+    return forecast.properties.timeseries[0]
+
+
+def partial_parse(count: int, raw: bytes):
+    return parse_time_steps(raw, count)[0]
+
+
+def measure(parse, raw: bytes, iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse(raw)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    tracemalloc.start()
+    try:
+        parse(raw)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "p50_us": percentile(latencies, 50, MICROSECONDS),
+        "p99_us": percentile(latencies, 99, MICROSECONDS),
+        "mean_us": round(sum(latencies) / len(latencies) * MICROSECONDS, 3),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.nowcast_parsing", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixture", type=pathlib.Path, nargs="+", default=sorted(FIXTURES.glob("nowcast_*.json")))
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument(
+        "--series-steps",
+        type=int,
+        default=Settings.model_fields["forecast_series_steps"].default,
+        help="Number of steps in the forecast series",
+    )
+    args = parser.parse_args(argv)
+    report = {}
+    for path in args.fixture:
+        raw = path.read_bytes()
+        report[path.name] = {
+            "size_kib": round(len(raw) / 1024, 1),
+            "full": measure(full_parse, raw, args.iterations),
+            "first_step": measure(functools.partial(partial_parse, 1), raw, args.iterations),
+            "series": measure(functools.partial(partial_parse, 24), raw, args.iterations),
+            "fetch": measure(functools.partial(parse_forecast, series_steps=args.series_steps), raw, args.iterations),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
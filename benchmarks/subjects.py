@@ -0,0 +1,86 @@
+"""Cost of matching a token's claims to a deploy subject, as the number of subjects grows
+
+Half of the subjects are exact repositories, and half are `org/*` patterns, spread over many organisations. The
+index is compared with scanning every subject in order, which is what matching amounts to without it. Run from
+the repository root:
+
+    uv run python -m benchmarks.subjects --subjects 100 1000 10000
+"""
+
+import argparse
+import fnmatch
+import functools
+import json
+import random
+import time
+
+from ibidem.ibidem_api.api.v1.token.subjects import SubjectIndex
+from ibidem.ibidem_api.core.config import DeploySubject
+
+from .load import MICROSECONDS, percentile
+
+
+def make_subjects(count: int) -> list[DeploySubject]:
+    subjects = []
+    for i in range(count):
+        org = f"org-{i // 20}"
+        repository = f"{org}/repo-{i}" if i % 2 else f"{org}-{i}/*"
+        subjects.append(DeploySubject(repository=repository, namespace=f"ns-{i}", service_account="deployer"))
+    return subjects
+
+
+def make_claims(subjects: list[DeploySubject], count: int) -> list[dict]:
+    claims = []
+    for subject in random.Random(0).choices(subjects, k=count):
+        repository = subject.repository.replace("*", "app")
+        claims.append({"repository": repository, "ref": "refs/heads/main"})
+    return claims
+
+
+def scan(subjects: list[DeploySubject], claims: dict):
+    for subject in subjects:
+        if fnmatch.fnmatchcase(claims["repository"], subject.repository) and fnmatch.fnmatchcase(
+            claims["ref"], subject.ref
+        ):
+            return subject
+    return None
+
+
+def measure(match, claims: list[dict]) -> dict:
+    latencies = []
+    for item in claims:
+        start = time.perf_counter()
+        subject = match(item)
+        latencies.append(time.perf_counter() - start)
+        if subject is None:
+            raise RuntimeError(f"No subject for {item['repository']}")
+    latencies.sort()
+    return {
+        "p50_us": percentile(latencies, 50, MICROSECONDS),
+        "p99_us": percentile(latencies, 99, MICROSECONDS),
+        "mean_us": round(sum(latencies) / len(latencies) * MICROSECONDS, 3),
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.subjects", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subjects", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args(argv)
+    report = {}
+    for count in args.subjects:
+        subjects = make_subjects(count)
+        claims = make_claims(subjects, args.lookups)
+        start = time.perf_counter()
+        index = SubjectIndex(subjects)
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        report[str(count)] = {
+            "index_build_ms": build_ms,
+            "index": measure(index.match, claims),
+            "scan": measure(functools.partial(scan, subjects), claims),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
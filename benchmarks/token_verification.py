@@ -0,0 +1,63 @@
+"""Cost of verifying a GitHub OIDC token, compared to finding it among the already verified tokens
+
+A miss decodes the token, verifies its signature and validates its claims. A hit only digests the token and looks
+it up in the cache of verified tokens. Run from the repository root:
+
+    uv run python -m benchmarks.token_verification --iterations 2000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from joserfc.jwk import RSAKey
+
+from ibidem.ibidem_api.api.v1.token import _verified_claims, verified_tokens
+from ibidem.ibidem_api.api.v1.token.keyset import StaticKeySet
+from tests.upstreams import TokenSigner
+
+from .load import MICROSECONDS, percentile
+
+AUDIENCE = "ibidem.no:deploy"
+
+
+async def measure(tokens: list[str], keyset: StaticKeySet, iterations: int, cached: bool) -> dict:
+    cache = verified_tokens()
+    for token in tokens:
+        await _verified_claims(token, keyset)
+    latencies = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        if not cached:
+            cache.clear()
+        start = time.perf_counter()
+        await _verified_claims(token, keyset)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_us": percentile(latencies, 50, MICROSECONDS),
+        "p99_us": percentile(latencies, 99, MICROSECONDS),
+        "mean_us": round(sum(latencies) / iterations * MICROSECONDS, 3),
+    }
+
+
+async def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.token_verification", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--tokens", type=int, default=64, help="Number of distinct tokens to cycle through")
+    args = parser.parse_args(argv)
+    signer = TokenSigner(AUDIENCE)
+    keyset = StaticKeySet(RSAKey.import_key(signer.jwks()["keys"][0]))
+    tokens = [signer.sign("benchmark/repo") for _ in range(args.tokens)]
+    # Tokens are valid from the second they were signed
+    await asyncio.sleep(1)
+    verify = await measure(tokens, keyset, args.iterations, cached=False)
+    cache_hit = await measure(tokens, keyset, args.iterations, cached=True)
+    return {"verify": verify, "cache_hit": cache_hit, "speedup": round(verify["mean_us"] / cache_hit["mean_us"], 1)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main()), indent=2))
@@ -0,0 +1,107 @@
+"""Latency of weather upstream requests with a new HTTP client per request, and with one shared client
+
+Before the shared client, every request to a weather route built its own client, paying a new connection and TLS
+handshake to met.no. The stand-in serves over TLS with a self-signed certificate, so both are included. The
+response cache in front of the client is left out, as it is the same in both setups. Run from the repository
+root:
+
+    uv run python -m benchmarks.weather_client --requests 500 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from tests.upstreams import TokenSigner, upstream_app
+
+from .load import free_port, percentile, serve
+
+ICON_PATH = "/weathericons/benchmark.png"
+
+
+def self_signed_certificate(directory: Path) -> tuple[Path, Path]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return cert_path, key_path
+
+
+async def measure(get, requests: int, concurrency: int) -> dict:
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            resp = await get()
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        },
+    }
+
+
+async def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.weather_client", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = self_signed_certificate(Path(directory))
+        port = free_port()
+        url = f"https://127.0.0.1:{port}{ICON_PATH}"
+        app = upstream_app(TokenSigner("benchmark"))
+        async with serve(app, port, ssl_certfile=str(cert_path), ssl_keyfile=str(key_path)):
+
+            async def client_per_request():
+                async with httpx.AsyncClient(verify=str(cert_path)) as client:
+                    return await client.get(url)
+
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(verify=str(cert_path), http2=True, limits=limits) as shared:
+                return {
+                    "client_per_request": await measure(client_per_request, args.requests, args.concurrency),
+                    "shared_client": await measure(lambda: shared.get(url), args.requests, args.concurrency),
+                }
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main()), indent=2))
@@ -0,0 +1,111 @@
+"""Load test of the weather stream with many subscribers connected at once
+
+Serves the weather stream route with uvicorn, connects `--subscribers` Server-Sent Events clients, and then
+publishes `--updates` weather changes. Reports how long it took for every subscriber to connect and receive the
+current weather, the fan-out latency from publishing an update until each subscriber has read it, and how many
+subscribers were dropped for falling behind or missed updates. The subscribers share the event loop with the
+server, so latencies include the time to read the event on every connection. Run from the repository root:
+
+    uv run python -m benchmarks.weather_stream --subscribers 1000 --updates 20
+"""
+
+import argparse
+import asyncio
+import decimal
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.api.v1 import weather
+from ibidem.ibidem_api.api.v1.weather.models import WeatherResponse
+from ibidem.ibidem_api.api.v1.weather.stream import WeatherBroadcaster
+
+from .load import free_port, percentile, serve
+
+
+def stream_app(broadcaster: WeatherBroadcaster) -> FastAPI:
+    app = FastAPI()
+    app.include_router(weather.router, prefix="/api/v1/weather")
+    app.dependency_overrides[weather.broadcaster] = lambda: broadcaster
+    return app
+
+
+class Subscriber:
+    """One stream client, recording when each weather event arrived"""
+
+    def __init__(self):
+        self.connected = asyncio.Event()
+        self.received: dict[str, float] = {}
+
+    async def run(self, client: httpx.AsyncClient, url: str):
+        async with client.stream("GET", url) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                arrived = time.perf_counter()
+                temperature = json.loads(line.removeprefix("data: "))["temperature"]
+                self.received[str(decimal.Decimal(temperature))] = arrived
+                self.connected.set()
+
+
+async def measure(subscribers: int, updates: int, interval: float, queue_size: int) -> dict:
+    broadcaster = WeatherBroadcaster(queue_size=queue_size, max_subscribers=subscribers, heartbeat_interval=15)
+    broadcaster.publish(WeatherResponse(icon_name="clearsky_day", temperature=decimal.Decimal(-1)))
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/v1/weather/stream"
+    clients = [Subscriber() for _ in range(subscribers)]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with serve(stream_app(broadcaster), port), httpx.AsyncClient(limits=limits, timeout=None) as client:
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber.run(client, url)) for subscriber in clients]
+        await asyncio.gather(*(subscriber.connected.wait() for subscriber in clients))
+        connect_s = time.perf_counter() - start
+
+        published = {}
+        for update in range(updates):
+            temperature = decimal.Decimal(update)
+            published[str(temperature)] = time.perf_counter()
+            broadcaster.publish(WeatherResponse(icon_name="clearsky_day", temperature=temperature))
+            await asyncio.sleep(interval)
+
+        broadcaster.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = []
+    missed = 0
+    for subscriber in clients:
+        for temperature, sent in published.items():
+            arrived = subscriber.received.get(temperature)
+            if arrived is None:
+                missed += 1
+            else:
+                latencies.append(arrived - sent)
+    latencies.sort()
+    return {
+        "subscribers": subscribers,
+        "connect_all_ms": round(connect_s * 1000, 1),
+        "fan_out_latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "max": round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+        "dropped_subscribers": broadcaster.dropped,
+        "missed_events": missed,
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.weather_stream", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between updates")
+    parser.add_argument("--queue-size", type=int, default=4, help="Events queued per subscriber before dropping it")
+    args = parser.parse_args(argv)
+    return asyncio.run(measure(args.subscribers, args.updates, args.interval, args.queue_size))
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(), indent=2))
@@ -5,5 +5,8 @@ from . import v1
 tags_metadata = []
 tags_metadata.extend(v1.tags_metadata)
 
+lifespans = []
+lifespans.extend(v1.lifespans)
+
 router = APIRouter()
 router.include_router(v1.router, prefix="/v1")
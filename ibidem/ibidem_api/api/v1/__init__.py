@@ -7,6 +7,8 @@ from . import weather
 tags_metadata = []
 tags_metadata.extend(suc.tags_metadata)
 
+lifespans = [suc.lifespan, token.lifespan, weather.lifespan]
+
 router = APIRouter()
 router.include_router(suc.router, prefix="/suc")
 router.include_router(token.router, prefix="/token")
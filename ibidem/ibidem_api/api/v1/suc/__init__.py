@@ -0,0 +1,115 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, status, Request
+from fastapi.responses import RedirectResponse, JSONResponse
+
+from ibidem.ibidem_api.api.v1.suc.versions import VersionScheduler
+from ibidem.ibidem_api.core.admission import route_policy
+from ibidem.ibidem_api.core.config import get_settings, subscribe
+from ibidem.ibidem_api.core.metrics import register_cache
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health, register_component
+from ibidem.ibidem_api.core.shared_cache import shared_cache
+
+LOG = logging.getLogger(__name__)
+
+tags_metadata = [
+    {
+        "name": "suc",
+        "description": "Endpoints to be used with the Rancher [system-update-controller](https://github.com/rancher/system-upgrade-controller)",
+    }
+]
+
+router = APIRouter(
+    tags=["suc"],
+)
+
+_scheduler: Optional[VersionScheduler] = None
+
+
+@asynccontextmanager
+async def lifespan():
+    global _scheduler
+    settings = get_settings()
+    _scheduler = VersionScheduler(
+        retry_interval=settings.suc_retry_interval,
+        jitter=settings.suc_poll_jitter,
+        timeout=settings.suc_timeout,
+        shared=shared_cache(),
+    )
+    await _scheduler.start(settings.suc_resolvers)
+    try:
+        yield
+    finally:
+        await _scheduler.stop()
+        _scheduler = None
+
+
+def version_scheduler() -> VersionScheduler:
+    return _scheduler
+
+
+def _update_resolvers(settings):
+    if _scheduler is not None:
+        _scheduler.configure(settings.suc_resolvers)
+
+
+subscribe(["suc_resolvers"], _update_resolvers)
+
+register_cache("suc_versions", lambda: _scheduler.stats if _scheduler is not None else None)
+
+
+async def _warm_up_versions():
+    if _scheduler is not None:
+        await _scheduler.warm_up()
+
+
+def _versions_status() -> ComponentStatus:
+    if _scheduler is None:
+        return ComponentStatus(Health.DOWN)
+    return _scheduler.status()
+
+
+register_component("suc_versions", _warm_up_versions, _versions_status)
+
+
+@router.get(
+    "/{resolver}",
+    response_class=RedirectResponse,
+    status_code=status.HTTP_302_FOUND,
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "No such resolver",
+            "model": str,
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Version is not available from upstream",
+            "model": str,
+        },
+    },
+)
+@route_policy(bypass=True)
+async def resolve(req: Request, resolver: str, scheduler: Annotated[VersionScheduler, Depends(version_scheduler)]):
+    """Version redirect for a configured resolver, such as `dietpi`
+
+    Redirects to a URL with the current version as the last component of the path, such that it can be used
+    by suc. Versions are polled in the background, and the last known version is used if the upstream is
+    unavailable."""
+    if resolver not in scheduler:
+        return JSONResponse(f"No resolver named {resolver}", status_code=status.HTTP_404_NOT_FOUND)
+    current = await scheduler.get(resolver)
+    if current is None:
+        return JSONResponse(
+            f"Failed to get version information for {resolver}",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    target = req.url_for("resolver_version", resolver=resolver, version=current.version)
+    return str(target)
+
+
+@router.get("/{resolver}/{version}", status_code=status.HTTP_200_OK)
+@route_policy(bypass=True)
+async def resolver_version(resolver: str, version: str):
+    """This endpoint is not actually used, but is here to create a target URL for SUC"""
+    return {"version": version}
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Optional
+
+import httpx
+
+from ibidem.ibidem_api.core.cache import CacheStats
+from ibidem.ibidem_api.core.config import SucResolver
+from ibidem.ibidem_api.core.deadline import DeadlineTransport
+from ibidem.ibidem_api.core.metrics import InstrumentedTransport
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health
+from ibidem.ibidem_api.core.shared_cache import SharedCache
+
+LOG = logging.getLogger(__name__)
+
+ParseFunction = Callable[[httpx.Response, dict[str, str]], str]
+
+PARSERS: dict[str, ParseFunction] = {}
+
+
+def parser(name: str):
+    """Register a function that parses a version from an upstream response, for use by resolvers"""
+
+    def register(fn: ParseFunction) -> ParseFunction:
+        PARSERS[name] = fn
+        return fn
+
+    return register
+
+
+def parse_version(data: str) -> str:
+    """Parse the `major.minor.patch` version from a DietPi version file"""
+    fields = {}
+    for line in data.splitlines(keepends=False):
+        name, sep, value = line.partition("=")
+        if sep:
+            fields[name.strip()] = value.strip()
+    try:
+        major = int(fields["G_REMOTE_VERSION_CORE"])
+        minor = int(fields.get("G_REMOTE_VERSION_SUB", 0))
+        patch = int(fields.get("G_REMOTE_VERSION_RC", 0))
+    except KeyError:
+        raise ValueError("DietPi version file has no G_REMOTE_VERSION_CORE")
+    return f"{major}.{minor}.{patch}"
+
+
+def _json_object(resp: httpx.Response) -> dict:
+    data = resp.json()
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data
+
+
+@parser("dietpi")
+def parse_dietpi(resp: httpx.Response, options: dict[str, str]) -> str:
+    return parse_version(resp.text)
+
+
+@parser("github_release")
+def parse_github_release(resp: httpx.Response, options: dict[str, str]) -> str:
+    """Tag of a release from the GitHub releases API, such as `/repos/{owner}/{repo}/releases/latest`
+
+    The option `strip_prefix` is removed from the start of the tag, if present."""
+    tag = _json_object(resp).get("tag_name")
+    if not tag or not isinstance(tag, str):
+        raise ValueError("GitHub release has no tag_name")
+    return tag.removeprefix(options.get("strip_prefix", ""))
+
+
+@parser("k3s_channel")
+def parse_k3s_channel(resp: httpx.Response, options: dict[str, str]) -> str:
+    """Latest version in a channel from the k3s channel server, `https://update.k3s.io/v1-release/channels`
+
+    The channel is given by the option `channel`, and defaults to `stable`."""
+    channel = options.get("channel", "stable")
+    items = _json_object(resp).get("data", [])
+    if not isinstance(items, list):
+        raise ValueError("k3s channels have no list of data")
+    for item in items:
+        if isinstance(item, dict) and item.get("id") == channel and isinstance(item.get("latest"), str):
+            return item["latest"]
+    raise ValueError(f"k3s channel {channel!r} not found")
+
+
+@parser("regex")
+def parse_regex(resp: httpx.Response, options: dict[str, str]) -> str:
+    """First match of the option `pattern` in a text response, or its first group if it has any"""
+    pattern = options.get("pattern")
+    if not pattern:
+        raise ValueError("The regex parser requires a pattern option")
+    match = re.search(pattern, resp.text, re.MULTILINE)
+    if match is None:
+        raise ValueError(f"Pattern {pattern!r} not found")
+    return match.group(1) if match.groups() else match.group(0)
+
+
+@dataclass(frozen=True)
+class ResolvedVersion:
+    version: str
+    fetched_at: float
+    revision: int
+    etag: Optional[str] = None
+
+
+class VersionResolver:
+    """Resolves the current version of one upstream, as declared by its configuration"""
+
+    def __init__(self, config: SucResolver, parse: ParseFunction):
+        self.config = config
+        self._parse = parse
+        self.lock = asyncio.Lock()
+        self.last_attempt = float("-inf")
+
+    async def resolve(self, client: httpx.AsyncClient, previous: Optional[ResolvedVersion]) -> ResolvedVersion:
+        """Fetch the version, revalidating the previous version with its ETag if there is one"""
+        headers = {}
+        if previous is not None and previous.etag:
+            headers["if-none-match"] = previous.etag
+        resp = await client.get(self.config.url, headers=headers)
+        now = time.time()
+        if resp.status_code == httpx.codes.NOT_MODIFIED and previous is not None:
+            return ResolvedVersion(previous.version, now, previous.revision, previous.etag)
+        resp.raise_for_status()
+        version = self._parse(resp, self.config.options)
+        if previous is None or version != previous.version:
+            revision = previous.revision + 1 if previous is not None else 1
+            LOG.info("Version of %s is %s (revision %d)", self.config.name, version, revision)
+        else:
+            revision = previous.revision
+        return ResolvedVersion(version, now, revision, resp.headers.get("etag"))
+
+
+class VersionScheduler:
+    """Polls all configured resolvers concurrently, and keeps their latest versions in a shared cache
+
+    Each resolver is polled every `interval` seconds from its configuration, spread out by a random `jitter` fraction
+    of the interval so upstreams are not hit in lockstep. Requests are only ever answered from the cache. If a poll
+    fails, the last known version is kept, and the poll is retried after `retry_interval`.
+
+    With a shared cache, a version resolved by another worker less than half an interval ago is used instead.
+    """
+
+    def __init__(
+        self, retry_interval: float, jitter: float, timeout: float = 10.0, shared: Optional[SharedCache] = None
+    ):
+        self._retry_interval = retry_interval
+        self._shared = shared
+        self._jitter = jitter
+        self._timeout = timeout
+        self._resolvers: dict[str, VersionResolver] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._cache: dict[str, ResolvedVersion] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = CacheStats()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resolvers
+
+    async def start(self, configs: Iterable[SucResolver]):
+        transport = InstrumentedTransport(DeadlineTransport(httpx.AsyncHTTPTransport()))
+        self._client = httpx.AsyncClient(timeout=self._timeout, follow_redirects=True, transport=transport)
+        self.configure(configs)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def configure(self, configs: Iterable[SucResolver]):
+        """Replace the set of resolvers, keeping the cached versions of those whose configuration is unchanged"""
+        wanted = {}
+        for config in configs:
+            parse = PARSERS.get(config.parser)
+            if parse is None:
+                LOG.error("Unknown parser %r for version resolver %s", config.parser, config.name)
+                continue
+            wanted[config.name] = (config, parse)
+        for name in list(self._resolvers):
+            if name not in wanted or wanted[name][0] != self._resolvers[name].config:
+                self._remove(name)
+        for name, (config, parse) in wanted.items():
+            if name not in self._resolvers:
+                self._resolvers[name] = resolver = VersionResolver(config, parse)
+                if self._client is not None:
+                    self._tasks[name] = asyncio.create_task(self._poll(resolver))
+
+    def _remove(self, name: str):
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+        del self._resolvers[name]
+        self._cache.pop(name, None)
+
+    def cached(self, name: str) -> Optional[ResolvedVersion]:
+        return self._cache.get(name)
+
+    async def warm_up(self):
+        await asyncio.gather(*(self.get(name) for name in list(self._resolvers)))
+        missing = [name for name in self._resolvers if name not in self._cache]
+        if missing:
+            raise RuntimeError(f"No version for {', '.join(missing)}")
+
+    def status(self) -> ComponentStatus:
+        """Down if no resolver has a version, degraded if only some of them have"""
+        missing = [name for name in self._resolvers if name not in self._cache]
+        versions = list(self._cache.values())
+        oldest = min((version.fetched_at for version in versions), default=None)
+        if not missing:
+            return ComponentStatus(Health.OK, oldest)
+        detail = f"No version for {', '.join(missing)}"
+        return ComponentStatus(Health.DEGRADED if versions else Health.DOWN, oldest, detail)
+
+    async def get(self, name: str) -> Optional[ResolvedVersion]:
+        """The last known version from the named resolver, resolving it first if there is none yet
+
+        Resolving is attempted at most once every `retry_interval` seconds, so a failing upstream is not hammered
+        by requests while there is no version."""
+        version = self._cache.get(name)
+        resolver = self._resolvers.get(name)
+        if version is not None:
+            self.stats.hits += 1
+        elif resolver is not None:
+            self.stats.misses += 1
+            async with resolver.lock:
+                if name not in self._cache and time.monotonic() - resolver.last_attempt >= self._retry_interval:
+                    await self._try_resolve(resolver)
+            version = self._cache.get(name)
+        return version
+
+    async def _try_resolve(self, resolver: VersionResolver) -> bool:
+        name = resolver.config.name
+        resolver.last_attempt = time.monotonic()
+        try:
+            version = await self._resolve(resolver)
+        except Exception:
+            # Whatever the upstream or shared cache throws at us, polling goes on with the last known version
+            LOG.error("Failed to resolve version of %s from %r", name, resolver.config.url, exc_info=True)
+            return False
+        if self._resolvers.get(name) is resolver:
+            self._cache[name] = version
+        return True
+
+    async def _resolve(self, resolver: VersionResolver) -> ResolvedVersion:
+        previous = self._cache.get(resolver.config.name)
+        if self._shared is None:
+            return await resolver.resolve(self._client, previous)
+
+        async def fetch():
+            version = await resolver.resolve(self._client, previous)
+            return json.dumps(asdict(version)).encode(), version.fetched_at + 2 * resolver.config.interval
+
+        data = await self._shared.get_or_fetch(
+            "suc_versions",
+            resolver.config.model_dump_json(),
+            fetch,
+            max_age=resolver.config.interval / 2,
+            lease_timeout=self._timeout,
+        )
+        return ResolvedVersion(**json.loads(data))
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    async def _poll(self, resolver: VersionResolver):
+        await asyncio.sleep(random.uniform(0, self._jitter * resolver.config.interval))
+        while True:
+            async with resolver.lock:
+                ok = await self._try_resolve(resolver)
+            await asyncio.sleep(self._jittered(resolver.config.interval if ok else self._retry_interval))
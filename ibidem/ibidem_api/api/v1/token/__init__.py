@@ -1,21 +1,40 @@
+import asyncio
+import hashlib
+import json
 import logging
+import math
+import time
+from contextlib import asynccontextmanager
 from functools import cache
 from pathlib import Path
+from typing import Annotated, Optional
 
 import httpx
 import joserfc.errors
-from fastapi import APIRouter, Depends, HTTPException, status
-from joserfc import jwt
-from joserfc.jwk import KeySet
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from joserfc import jws, jwt
 from joserfc.jwt import JWTClaimsRegistry
 from joserfc.rfc7518.oct_key import OctKey
-from lightkube import Client
+from lightkube import AsyncClient, KubeConfig as LightkubeConfig
+from lightkube.config.client_adapter import verify_cluster
 from lightkube.models.authentication_v1 import TokenRequestSpec
 from lightkube.models.meta_v1 import ObjectMeta
 from lightkube.resources.core_v1 import ServiceAccountToken
 
-from .models import KubeConfig, TokenRequest, TokenResponse
-from ibidem.ibidem_api.core.config import DeploySubject, Mode, settings
+from .keyset import GITHUB_JWKS_URL, KeySetCache, StaticKeySet
+from .kubeconfig import KUBECONFIG_ENCODERS, KubeConfigTemplate
+from .models import BatchTokenResponse, KubeConfig, TargetToken, TokenRequest, TokenResponse
+from .subjects import SubjectIndex
+from ibidem.ibidem_api.core.admission import ConcurrencyLimiter, Overloaded
+from ibidem.ibidem_api.core.cache import LRUCache, SingleFlight
+from ibidem.ibidem_api.core.config import DeployTarget, Mode, get_settings, subscribe
+from ibidem.ibidem_api.core.deadline import DeadlineTransport
+from ibidem.ibidem_api.core.metrics import REJECTED_REQUESTS, InstrumentedTransport, register_cache
+from ibidem.ibidem_api.core.negotiation import negotiate
+from ibidem.ibidem_api.core.ratelimit import TokenBucketLimiter
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health, register_component
+from ibidem.ibidem_api.core.shared_cache import shared_cache
 
 LOG = logging.getLogger(__name__)
 
@@ -32,44 +51,154 @@ router = APIRouter(
 )
 
 CA_CRT_PATH = Path("/var/run/secrets/kubernetes.io/serviceaccount/ca.crt")
+TOKEN_AUDIENCES = ()
 CLAIMS = dict(
     iss={
         "essential": True,
         "value": "https://token.actions.githubusercontent.com",
     },
-    aud={
-        "essential": True,
-        "value": "ibidem.no:deploy",
-    },
     repository={
         "essential": True,
     },
     ref={
         "essential": True,
-        "value": "refs/heads/main",
     },
 )
 
 
 @cache
 def github_keyset():
+    settings = get_settings()
     if settings.mode == Mode.DEBUG:
         # Default key used on jwt.io
-        return OctKey.import_key("a-string-secret-at-least-256-bits-long")
-    resp = httpx.get("https://token.actions.githubusercontent.com/.well-known/jwks")
-    resp.raise_for_status()
-    key_set = KeySet.import_key_set(resp.json())
-    return key_set
+        return StaticKeySet(OctKey.import_key("a-string-secret-at-least-256-bits-long"))
+    return KeySetCache(
+        settings.jwks_url or GITHUB_JWKS_URL,
+        ttl=settings.jwks_refresh_interval,
+        min_refetch_interval=settings.jwks_min_refetch_interval,
+        shared=shared_cache(),
+    )
 
 
 @cache
 def kube():
-    return Client()
+    settings = get_settings()
+    config = LightkubeConfig.from_env().get()
+    # A single HTTP/2 connection pool to the API server, shared by all token requests
+    transport = httpx.AsyncHTTPTransport(
+        verify=verify_cluster(config.cluster, config.user, config.abs_file),
+        http2=True,
+        limits=httpx.Limits(max_connections=settings.kube_max_connections),
+    )
+    transport = InstrumentedTransport(DeadlineTransport(transport), "kubernetes")
+    return AsyncClient(config, timeout=httpx.Timeout(settings.kube_timeout), transport=transport)
+
+
+@cache
+def kube_calls() -> ConcurrencyLimiter:
+    """Caps the number of concurrent calls to the Kubernetes API"""
+    settings = get_settings()
+    return ConcurrencyLimiter(settings.kube_max_in_flight, settings.kube_max_queued, settings.kube_queue_timeout)
+
+
+@cache
+def repository_limiter() -> TokenBucketLimiter:
+    """Rate limits of token requests, keyed by the verified repository"""
+    settings = get_settings()
+    return TokenBucketLimiter(
+        settings.token_rate_limit, settings.token_rate_limit_burst, shares=settings.worker_processes
+    )
+
+
+@cache
+def client_limiter() -> TokenBucketLimiter:
+    """Rate limits of token requests that fail verification, keyed by client address"""
+    settings = get_settings()
+    return TokenBucketLimiter(
+        settings.token_client_rate_limit, settings.token_client_rate_limit_burst, shares=settings.worker_processes
+    )
+
+
+@cache
+def issued_tokens():
+    """Cache of issued service account tokens, or None if disabled"""
+    settings = get_settings()
+    if settings.token_cache_size > 0:
+        return LRUCache(settings.token_cache_size)
+    return None
+
+
+_token_requests = SingleFlight()
+
+
+@cache
+def claims_registry():
+    aud = {"essential": True, "value": get_settings().oidc_audience}
+    return JWTClaimsRegistry(aud=aud, **CLAIMS)
+
+
+@cache
+def verified_tokens():
+    """Claims of tokens that have already been verified, keyed by digest of the token"""
+    return LRUCache(get_settings().verified_token_cache_size)
+
+
+@cache
+def used_token_ids():
+    """Token ids (jti) seen when replay protection is enabled"""
+    return LRUCache(get_settings().token_replay_cache_size)
 
 
 @cache
 def subjects():
-    return {subject.repository: subject for subject in settings.deploy_subjects}
+    return SubjectIndex(get_settings().deploy_subjects)
+
+
+def _reload_subjects(_settings):
+    subjects.cache_clear()
+    LOG.info("Indexed %d deploy subjects", len(subjects()))
+
+
+def _reload_claims(_settings):
+    claims_registry.cache_clear()
+    verified_tokens().clear()
+
+
+subscribe(["deploy_subjects"], _reload_subjects)
+subscribe(["oidc_audience"], _reload_claims)
+subscribe(["verified_token_cache_size"], lambda _settings: verified_tokens.cache_clear())
+subscribe(["token_replay_cache_size"], lambda _settings: used_token_ids.cache_clear())
+subscribe(["token_cache_size"], lambda _settings: issued_tokens.cache_clear())
+subscribe(["kube_max_in_flight", "kube_max_queued", "kube_queue_timeout"], lambda _settings: kube_calls.cache_clear())
+subscribe(
+    ["token_rate_limit", "token_rate_limit_burst", "mode", "workers"],
+    lambda _settings: repository_limiter.cache_clear(),
+)
+subscribe(
+    ["token_client_rate_limit", "token_client_rate_limit_burst", "mode", "workers"],
+    lambda _settings: client_limiter.cache_clear(),
+)
+
+register_cache("jwks", lambda: github_keyset().stats)
+register_cache("issued_tokens", lambda: issued_tokens().stats if issued_tokens() is not None else None)
+register_cache("verified_tokens", lambda: verified_tokens().stats)
+register_cache("used_token_ids", lambda: used_token_ids().stats)
+
+
+def _release_mode() -> bool:
+    return get_settings().mode == Mode.RELEASE
+
+
+async def _warm_up_kube():
+    kube()
+
+
+def _kube_status() -> ComponentStatus:
+    return ComponentStatus(Health.OK if kube.cache_info().currsize else Health.DOWN)
+
+
+register_component("jwks", lambda: github_keyset().warm_up(), lambda: github_keyset().status(), _release_mode)
+register_component("kubernetes", _warm_up_kube, _kube_status, _release_mode)
 
 
 @cache
@@ -80,33 +209,75 @@ def ca_crt() -> bytes:
     return b""
 
 
-@router.post("/kubeconfig", status_code=status.HTTP_200_OK)
+def client_address(request: Request) -> str:
+    return request.client.host if request.client is not None else ""
+
+
+@cache
+def kubeconfig_template() -> KubeConfigTemplate:
+    return KubeConfigTemplate.make(ca_crt(), get_settings().advertised_cluster_address)
+
+
+subscribe(["advertised_cluster_address"], lambda _settings: kubeconfig_template.cache_clear())
+
+
+@asynccontextmanager
+async def lifespan():
+    keyset = github_keyset()
+    await keyset.start()
+    try:
+        yield
+    finally:
+        await keyset.stop()
+        if kube.cache_info().currsize:
+            await kube().close()
+            kube.cache_clear()
+
+
+@router.post(
+    "/kubeconfig",
+    status_code=status.HTTP_200_OK,
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "model": KubeConfig,
+            "content": {media_type: {} for media_type in KUBECONFIG_ENCODERS},
+        },
+    },
+)
 async def kubeconfig(
     data: TokenRequest,
-    keyset: KeySet = Depends(github_keyset),
-    kube: Client = Depends(kube),
-    subjects: dict[str, DeploySubject] = Depends(subjects),
-    ca_crt: str = Depends(ca_crt),
-) -> KubeConfig:
-    subject = await _validate_subject(data, keyset, subjects)
+    keyset: KeySetCache = Depends(github_keyset),
+    kube: AsyncClient = Depends(kube),
+    subjects: SubjectIndex = Depends(subjects),
+    client: str = Depends(client_address),
+    template: KubeConfigTemplate = Depends(kubeconfig_template),
+    accept: Annotated[Optional[str], Header()] = None,
+):
+    """Accept a JWT token and return a kubeconfig with a new kubernetes token
+
+    The kubeconfig is JSON, or YAML if requested in the Accept header."""
+    subject = await _validate_subject(data, keyset, subjects, client)
     k8s_token = await _get_k8s_token(kube, subject.service_account, subject.namespace)
     LOG.info(
         "Created k8s token for service account %r in namespace %r",
         subject.service_account,
         subject.namespace,
     )
-    return KubeConfig.make(ca_crt, k8s_token, settings.advertised_cluster_address)
+    media_type = negotiate(accept, KUBECONFIG_ENCODERS)
+    return Response(template.render(media_type, k8s_token), media_type=media_type, headers={"vary": "accept"})
 
 
 @router.post("/", status_code=status.HTTP_200_OK)
 async def token(
     data: TokenRequest,
-    keyset: KeySet = Depends(github_keyset),
-    kube: Client = Depends(kube),
-    subjects: dict[str, DeploySubject] = Depends(subjects),
+    keyset: KeySetCache = Depends(github_keyset),
+    kube: AsyncClient = Depends(kube),
+    subjects: SubjectIndex = Depends(subjects),
+    client: str = Depends(client_address),
 ) -> TokenResponse:
     """Accept a JWT token and return a new kubernetes token"""
-    subject = await _validate_subject(data, keyset, subjects)
+    subject = await _validate_subject(data, keyset, subjects, client)
     k8s_token = await _get_k8s_token(kube, subject.service_account, subject.namespace)
     return TokenResponse(
         token=k8s_token,
@@ -115,16 +286,123 @@ async def token(
     )
 
 
-async def _validate_subject(data, keyset, subjects):
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_502_BAD_GATEWAY: {"model": BatchTokenResponse, "description": "No token was issued"}},
+)
+async def batch(
+    data: TokenRequest,
+    keyset: KeySetCache = Depends(github_keyset),
+    kube: AsyncClient = Depends(kube),
+    subjects: SubjectIndex = Depends(subjects),
+    client: str = Depends(client_address),
+) -> BatchTokenResponse:
+    """Accept a JWT token and return a new kubernetes token for every target of the repository
+
+    Tokens are requested concurrently. Targets that could not get a token have an error instead, and if no target
+    got a token, the response status is 502."""
+    subject = await _validate_subject(data, keyset, subjects, client)
+    response = BatchTokenResponse(tokens=await _get_k8s_tokens(kube, subject.targets))
+    if not any(target.token is not None for target in response.tokens):
+        return ORJSONResponse(response.model_dump(), status_code=status.HTTP_502_BAD_GATEWAY)
+    return response
+
+
+@router.post(
+    "/batch/kubeconfig",
+    status_code=status.HTTP_200_OK,
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "model": KubeConfig,
+            "content": {media_type: {} for media_type in KUBECONFIG_ENCODERS},
+        },
+        status.HTTP_502_BAD_GATEWAY: {"description": "No token was issued"},
+    },
+)
+async def batch_kubeconfig(
+    data: TokenRequest,
+    keyset: KeySetCache = Depends(github_keyset),
+    kube: AsyncClient = Depends(kube),
+    subjects: SubjectIndex = Depends(subjects),
+    client: str = Depends(client_address),
+    template: KubeConfigTemplate = Depends(kubeconfig_template),
+    accept: Annotated[Optional[str], Header()] = None,
+):
+    """Accept a JWT token and return a kubeconfig with a context for every target of the repository
+
+    Contexts are named `namespace/service_account`, and the first target is the current context. Targets that
+    could not get a token are left out, and listed in the X-Failed-Targets header. The kubeconfig is JSON, or YAML
+    if requested in the Accept header."""
+    subject = await _validate_subject(data, keyset, subjects, client)
+    tokens = await _get_k8s_tokens(kube, subject.targets)
+    issued = [target for target in tokens if target.token is not None]
+    if not issued:
+        errors = [target.model_dump() for target in tokens]
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=errors)
+    media_type = negotiate(accept, KUBECONFIG_ENCODERS)
+    headers = {"vary": "accept"}
+    if len(issued) < len(tokens):
+        failed = (target for target in tokens if target.token is None)
+        headers["x-failed-targets"] = ", ".join(f"{target.namespace}/{target.service_account}" for target in failed)
+    return Response(template.render_contexts(media_type, issued), media_type=media_type, headers=headers)
+
+
+async def _validate_subject(data, keyset, subjects, client):
+    # Clients are only limited by the requests that fail verification, as runners may share addresses
+    retry_after = client_limiter().retry_after(client)
+    if retry_after:
+        LOG.warning("Rate limited client %s after failed verifications", client)
+        raise _rate_limited("client", retry_after)
+    try:
+        claims = await _verified_claims(data.token, keyset)
+        if get_settings().token_replay_protection:
+            await _check_replay(claims)
+    except HTTPException:
+        client_limiter().acquire(client)
+        raise
+    LOG.info("Received valid token for repository: %r", claims["repository"])
+    subject = subjects.match(claims)
+    rate, burst = (subject.rate_limit, subject.rate_limit_burst) if subject is not None else (None, None)
+    retry_after = repository_limiter().acquire(claims["repository"], rate, burst)
+    if retry_after:
+        LOG.warning("Rate limited repository %r", claims["repository"])
+        raise _rate_limited("repository", retry_after)
+    if subject is None:
+        LOG.error("No subject found for repository: %r with ref %r", claims["repository"], claims["ref"])
+        raise HTTPException(status_code=404, detail="Repository not found")
+    return subject
+
+
+def _rate_limited(limiter: str, retry_after: float) -> HTTPException:
+    REJECTED_REQUESTS.labels(limiter, "rate_limited").inc()
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"retry-after": str(math.ceil(retry_after))},
+    )
+
+
+async def _verified_claims(compact_token, keyset):
+    digest = hashlib.sha256(compact_token.encode()).digest()
+    claims = verified_tokens().get(digest)
+    if claims is not None:
+        return claims
+
     try:
-        token = jwt.decode(data.token, key=keyset)
+        header = jws.extract_compact(compact_token.encode()).headers()
+        key = await keyset.get(header.get("kid"))
+        token = jwt.decode(compact_token, key=key)
     except ValueError as e:
         LOG.error("Error while decoding token", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
+    except joserfc.errors.JoseError as e:
+        LOG.warning("Received token that failed verification: %s", e)
+        raise HTTPException(status_code=401, detail="Token could not be verified")
 
-    claims_registry = JWTClaimsRegistry(**CLAIMS)
     try:
-        claims_registry.validate(token.claims)
+        claims_registry().validate(token.claims)
     except joserfc.errors.ExpiredTokenError:
         LOG.warning("Received expired token for repository: %r", token.claims["repository"])
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -144,18 +422,108 @@ async def _validate_subject(data, keyset, subjects):
         )
         LOG.info("Token claims: %r", token.claims)
         raise HTTPException(status_code=400, detail=str(e))
-    LOG.info("Received valid token for repository: %r", token.claims["repository"])
-    subject = subjects.get(token.claims["repository"])
-    if subject is None:
-        LOG.error("No subject found for repository: %r", token.claims["repository"])
-        raise HTTPException(status_code=404, detail="Repository not found")
-    return subject
+    verified_tokens().set(digest, token.claims, token.claims.get("exp"))
+    return token.claims
+
+
+async def _check_replay(claims):
+    jti = claims.get("jti")
+    if jti is None:
+        LOG.error("Received token without jti for repository: %r", claims["repository"])
+        raise HTTPException(status_code=400, detail="Token has no jti claim")
+    used_tokens = used_token_ids()
+    replayed = used_tokens.get(jti) is not None
+    if not replayed:
+        used_tokens.set(jti, True, claims.get("exp"))
+        # A token used with another worker is only known to the shared cache
+        shared = shared_cache()
+        replayed = shared is not None and not await shared.add_once("used_token_ids", jti, claims.get("exp"))
+    if replayed:
+        LOG.warning("Received replayed token for repository: %r", claims["repository"])
+        raise HTTPException(status_code=401, detail="Token has already been used")
 
 
 async def _get_k8s_token(kube, name, namespace):
+    tokens = issued_tokens()
+    if tokens is None:
+        token_status = await _create_k8s_token(kube, name, namespace)
+        return token_status.token
+    key = (namespace, name, TOKEN_AUDIENCES)
+    token = tokens.get(key)
+    if token is not None:
+        LOG.debug("Reusing cached token for service account %r in namespace %r", name, namespace)
+        return token
+    return await _token_requests.do(key, lambda: _create_cached_k8s_token(tokens, key, kube, name, namespace))
+
+
+async def _get_k8s_tokens(kube, targets: list[DeployTarget]) -> list[TargetToken]:
+    return await asyncio.gather(*(_get_target_token(kube, target) for target in targets))
+
+
+async def _get_target_token(kube, target: DeployTarget) -> TargetToken:
+    result = TargetToken(namespace=target.namespace, service_account=target.service_account)
+    try:
+        result.token = await _get_k8s_token(kube, target.service_account, target.namespace)
+    except HTTPException as e:
+        result.error = e.detail
+    except httpx.HTTPError as e:
+        LOG.error(
+            "Failed to create token for service account %r in namespace %r",
+            target.service_account,
+            target.namespace,
+            exc_info=True,
+        )
+        result.error = str(e)
+    return result
+
+
+async def _create_cached_k8s_token(tokens, key, kube, name, namespace):
+    shared = shared_cache()
+    if shared is None:
+        token, reuse_until = await _issue_reusable_k8s_token(kube, name, namespace)
+    else:
+        # Tokens issued by other workers are reused too, and only one worker requests a missing token
+
+        async def fetch():
+            fetched = await _issue_reusable_k8s_token(kube, name, namespace)
+            return json.dumps(fetched).encode(), fetched[1]
+
+        shared_key = f"{namespace}/{name}/{','.join(TOKEN_AUDIENCES)}"
+        data = await shared.get_or_fetch("issued_tokens", shared_key, fetch, lease_timeout=get_settings().kube_timeout)
+        token, reuse_until = json.loads(data)
+    tokens.set(key, token, reuse_until)
+    return token
+
+
+async def _issue_reusable_k8s_token(kube, name, namespace) -> tuple[str, float]:
+    """A new token, and the time until which it may be reused"""
+    issued_at = time.time()
+    token_status = await _create_k8s_token(kube, name, namespace)
+    lifetime = token_status.expirationTimestamp.timestamp() - issued_at
+    return token_status.token, issued_at + lifetime * get_settings().token_cache_reuse_fraction
+
+
+async def _create_k8s_token(kube, name, namespace):
+    settings = get_settings()
     service_account_token = ServiceAccountToken(
         metadata=ObjectMeta(name=name, namespace=namespace),
-        spec=TokenRequestSpec(audiences=[]),
+        spec=TokenRequestSpec(
+            audiences=list(TOKEN_AUDIENCES),
+            expirationSeconds=settings.token_expiration_seconds,
+        ),
     )
-    service_account_token = kube.create(service_account_token, name=name, namespace=namespace)
-    return service_account_token.status.token
+    try:
+        async with kube_calls().slot(), asyncio.timeout(settings.kube_timeout):
+            service_account_token = await kube.create(service_account_token, name=name, namespace=namespace)
+    except Overloaded as e:
+        LOG.warning("Too many Kubernetes calls to create token for service account %r: %s", name, e)
+        REJECTED_REQUESTS.labels("kubernetes", "overloaded").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many token requests in progress",
+            headers={"retry-after": "1"},
+        )
+    except (TimeoutError, httpx.TimeoutException):
+        LOG.error("Timed out creating token for service account %r in namespace %r", name, namespace)
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Timed out creating token")
+    return service_account_token.status
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from joserfc.jwk import KeySet, Key
+
+from ibidem.ibidem_api.core.cache import SingleFlight
+from ibidem.ibidem_api.core.deadline import DeadlineTransport
+from ibidem.ibidem_api.core.metrics import InstrumentedTransport
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health
+from ibidem.ibidem_api.core.shared_cache import Fetched, SharedCache
+
+LOG = logging.getLogger(__name__)
+
+GITHUB_JWKS_URL = "https://token.actions.githubusercontent.com/.well-known/jwks"
+
+
+@dataclass
+class KeySetStats:
+    hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+
+class StaticKeySet:
+    """Key set with a single fixed key, used in debug mode"""
+
+    def __init__(self, key: Key):
+        self._key = key
+        self.stats = KeySetStats()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def warm_up(self):
+        pass
+
+    def status(self) -> ComponentStatus:
+        return ComponentStatus(Health.OK, detail="Static debug key")
+
+    async def get(self, kid: Optional[str]) -> Key:
+        self.stats.hits += 1
+        return self._key
+
+
+class KeySetCache:
+    """Cache of the GitHub JWKS, indexed by key id
+
+    The key set is fetched during warm-up, and refreshed in the background every `ttl` seconds.
+    A token signed with an unknown key id triggers a single refetch, but never more often than every
+    `min_refetch_interval` seconds. The refetch runs detached from the requests waiting for it, so a request
+    giving up does not cancel it.
+
+    With a shared cache, a key set fetched by another worker less than `min_refetch_interval` seconds ago is
+    used instead of fetching it again.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float,
+        min_refetch_interval: float,
+        timeout: float = 10.0,
+        shared: Optional[SharedCache] = None,
+    ):
+        self._url = url
+        self._shared = shared
+        self._ttl = ttl
+        self._min_refetch_interval = min_refetch_interval
+        self._timeout = timeout
+        self._keys: dict[str, Key] = {}
+        self._last_attempt = float("-inf")
+        self._lock = asyncio.Lock()
+        self._refetches = SingleFlight()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats = KeySetStats()
+
+    async def start(self):
+        transport = InstrumentedTransport(DeadlineTransport(httpx.AsyncHTTPTransport()), "github_jwks")
+        self._client = httpx.AsyncClient(timeout=self._timeout, transport=transport)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def warm_up(self):
+        async with self._lock:
+            if not self._keys and not await self._try_refresh():
+                raise RuntimeError(self.last_error)
+
+    def status(self) -> ComponentStatus:
+        """Down until keys have been fetched, and degraded while refreshing them fails"""
+        if not self._keys:
+            return ComponentStatus(Health.DOWN, detail=self.last_error or "No keys fetched yet")
+        if self.last_error is not None:
+            return ComponentStatus(Health.DEGRADED, self.refreshed_at, self.last_error)
+        return ComponentStatus(Health.OK, self.refreshed_at)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, kid: Optional[str]) -> Key:
+        key = self._keys.get(kid)
+        if key is not None:
+            self.stats.hits += 1
+            return key
+        self.stats.misses += 1
+        # Requests with an unknown key id share one refetch, which is not cut short by their deadlines
+        if None in self._refetches or time.monotonic() - self._last_attempt >= self._min_refetch_interval:
+            LOG.info("Unknown key id %r, refreshing key set", kid)
+            await self._refetches.do(None, self._refetch)
+        key = self._keys.get(kid)
+        if key is None:
+            raise ValueError(f"Unknown key id: {kid!r}")
+        return key
+
+    async def refresh(self):
+        if self._shared is None:
+            data, _ = await self._fetch()
+        else:
+            data = await self._shared.get_or_fetch(
+                "jwks", self._url, self._fetch, max_age=self._min_refetch_interval, lease_timeout=self._timeout
+            )
+        key_set = KeySet.import_key_set(json.loads(data))
+        self._keys = {key.kid: key for key in key_set.keys}
+        self.refreshed_at = time.time()
+        self.last_error = None
+        self.stats.refreshes += 1
+        LOG.debug("Refreshed key set with key ids %r", list(self._keys))
+
+    async def _fetch(self) -> Fetched:
+        resp = await self._client.get(self._url)
+        resp.raise_for_status()
+        return resp.content, time.time() + self._ttl
+
+    async def _refetch(self):
+        async with self._lock:
+            # The key set may have been refreshed by the refresh loop while waiting for the lock
+            if time.monotonic() - self._last_attempt >= self._min_refetch_interval:
+                await self._try_refresh()
+
+    async def _try_refresh(self) -> bool:
+        self._last_attempt = time.monotonic()
+        try:
+            await self.refresh()
+        except Exception as e:
+            # Anything from a malformed key set to a failing shared cache, the background refresh must keep going
+            self.stats.refresh_errors += 1
+            self.last_error = f"Refresh failed: {e}"
+            LOG.error("Failed to refresh key set from %r", self._url, exc_info=True)
+            return False
+        return True
+
+    def _next_refresh_in(self) -> float:
+        if self.refreshed_at is None or self.last_error is not None:
+            return self._min_refetch_interval
+        return self.refreshed_at + self._ttl - time.time()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(max(self._next_refresh_in(), 0))
+            async with self._lock:
+                # The key set may have been refreshed by warm-up or an unknown key id while sleeping
+                if self.refreshed_at is None or self.last_error is not None or self._next_refresh_in() <= 0:
+                    await self._try_refresh()
@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+import orjson
+import yaml
+
+from .models import KubeConfig, TargetToken
+
+TOKEN_PLACEHOLDER = "kubeconfig-token-placeholder"
+CONTEXT_PLACEHOLDER = "kubeconfig-context-placeholder"
+CONTEXTS_PLACEHOLDER = "kubeconfig-contexts-placeholder"
+USERS_PLACEHOLDER = "kubeconfig-users-placeholder"
+
+KUBECONFIG_ENCODERS = {
+    "application/json": orjson.dumps,
+    "application/yaml": lambda config: yaml.safe_dump(config, sort_keys=False).encode("utf-8"),
+}
+
+
+def _split(media_type: str, content: bytes, placeholders: tuple[str, ...]) -> tuple[bytes, ...]:
+    """Split encoded content around each of the placeholders, in order"""
+    parts = []
+    for placeholder in placeholders:
+        # JSON quotes the placeholder, YAML leaves it as a plain scalar
+        for marker in (orjson.dumps(placeholder), placeholder.encode("utf-8")):
+            if content.count(marker) == 1:
+                part, _, content = content.partition(marker)
+                parts.append(part)
+                break
+        else:
+            raise ValueError(f"Placeholder {placeholder} not found exactly once in {media_type} kubeconfig")
+    parts.append(content)
+    return tuple(parts)
+
+
+@dataclass(frozen=True)
+class KubeConfigTemplate:
+    """A kubeconfig encoded once per media type, with only the token left to fill in
+
+    Everything but the token only depends on the configuration, so it is rendered once per configuration snapshot,
+    split around a placeholder for the token. Kubeconfigs with a context per target are split the same way, around
+    the current context and the lists of contexts and users.
+    """
+
+    parts: dict[str, tuple[bytes, bytes]]
+    context_parts: dict[str, tuple[bytes, bytes, bytes, bytes]]
+
+    @classmethod
+    def make(cls, ca_crt: bytes, server: str) -> "KubeConfigTemplate":
+        config = KubeConfig.make(ca_crt, TOKEN_PLACEHOLDER, server).model_dump(by_alias=True)
+        contexts_config = {
+            **config,
+            "current-context": CONTEXT_PLACEHOLDER,
+            "contexts": CONTEXTS_PLACEHOLDER,
+            "users": USERS_PLACEHOLDER,
+        }
+        parts = {}
+        context_parts = {}
+        for media_type, encode in KUBECONFIG_ENCODERS.items():
+            parts[media_type] = _split(media_type, encode(config), (TOKEN_PLACEHOLDER,))
+            context_parts[media_type] = _split(
+                media_type, encode(contexts_config), (CONTEXT_PLACEHOLDER, CONTEXTS_PLACEHOLDER, USERS_PLACEHOLDER)
+            )
+        return cls(parts, context_parts)
+
+    def render(self, media_type: str, token: str) -> bytes:
+        # A JSON string is also a valid double-quoted YAML scalar
+        prefix, suffix = self.parts[media_type]
+        return prefix + orjson.dumps(token) + suffix
+
+    def render_contexts(self, media_type: str, tokens: list[TargetToken]) -> bytes:
+        """Same as `KubeConfig.make_contexts`, for tokens that were issued"""
+        # JSON arrays are valid YAML flow sequences too
+        names = [f"{token.namespace}/{token.service_account}" for token in tokens]
+        contexts = [
+            {"context": {"cluster": "default", "namespace": token.namespace, "user": name}, "name": name}
+            for name, token in zip(names, tokens)
+        ]
+        users = [{"name": name, "user": {"token": token.token}} for name, token in zip(names, tokens)]
+        prefix, clusters, between, suffix = self.context_parts[media_type]
+        return (
+            prefix + orjson.dumps(names[0]) + clusters + orjson.dumps(contexts) + between + orjson.dumps(users) + suffix
+        )
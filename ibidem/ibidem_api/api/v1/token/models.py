@@ -15,6 +15,19 @@ class TokenResponse(BaseModel):
     namespace: str
 
 
+class TargetToken(BaseModel):
+    """Token for one target of a batch request, or the reason it could not be issued"""
+
+    namespace: str
+    service_account: str
+    token: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchTokenResponse(BaseModel):
+    tokens: list[TargetToken]
+
+
 def to_kebab(s: str) -> str:
     return to_snake(s).replace("_", "-")
 
@@ -103,3 +116,43 @@ class KubeConfig(BaseModel):
                 )
             ],
         )
+
+    @classmethod
+    def make_contexts(cls, ca_crt, server, tokens: list[TargetToken]) -> "KubeConfig":
+        """A kubeconfig with a context and user per issued token, named `namespace/service_account`
+
+        The first token's context is the current context."""
+        b64_ca_crt = base64.b64encode(ca_crt).decode("utf-8")
+        names = [f"{token.namespace}/{token.service_account}" for token in tokens]
+        return cls(
+            current_context=names[0],
+            clusters=[
+                KubeConfigCluster(
+                    cluster=KubeConfigClusterInner(
+                        certificate_authority_data=b64_ca_crt,
+                        server=server,
+                    ),
+                    name="default",
+                )
+            ],
+            contexts=[
+                KubeConfigContext(
+                    context=KubeConfigContextInner(
+                        cluster="default",
+                        namespace=token.namespace,
+                        user=name,
+                    ),
+                    name=name,
+                )
+                for name, token in zip(names, tokens)
+            ],
+            users=[
+                KubeConfigUser(
+                    name=name,
+                    user=KubeConfigUserInner(
+                        token=token.token,
+                    ),
+                )
+                for name, token in zip(names, tokens)
+            ],
+        )
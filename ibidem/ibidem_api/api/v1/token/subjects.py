@@ -0,0 +1,77 @@
+import fnmatch
+from typing import Any, Iterable, Optional
+
+from ibidem.ibidem_api.core.config import DeploySubject
+
+WILDCARDS = "*?["
+
+
+def _literal_prefix(pattern: str) -> str:
+    for i, c in enumerate(pattern):
+        if c in WILDCARDS:
+            return pattern[:i]
+    return pattern
+
+
+class _Node:
+    __slots__ = ("children", "subjects")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.subjects: list[DeploySubject] = []
+
+
+class SubjectIndex:
+    """Index of deploy subjects, matched against the claims of a token
+
+    Repositories are either exact names, or patterns such as `org/*`. Patterns are stored in a trie keyed on their
+    literal prefix, so looking up a repository only walks its own characters, regardless of the number of subjects.
+    Exact matches take precedence over patterns, and longer prefixes over shorter ones. Among the candidates for a
+    repository, the first one whose ref and environment patterns match the claims is selected.
+    """
+
+    def __init__(self, subjects: Iterable[DeploySubject]):
+        self._exact: dict[str, list[DeploySubject]] = {}
+        self._root = _Node()
+        self._size = 0
+        for subject in subjects:
+            self._size += 1
+            prefix = _literal_prefix(subject.repository)
+            if prefix == subject.repository:
+                self._exact.setdefault(subject.repository, []).append(subject)
+                continue
+            node = self._root
+            for c in prefix:
+                node = node.children.setdefault(c, _Node())
+            node.subjects.append(subject)
+
+    def __len__(self):
+        return self._size
+
+    def candidates(self, repository: str) -> list[DeploySubject]:
+        found = []
+        node = self._root
+        for c in repository:
+            if node.subjects:
+                found.append(node.subjects)
+            node = node.children.get(c)
+            if node is None:
+                break
+        else:
+            if node.subjects:
+                found.append(node.subjects)
+        result = list(self._exact.get(repository, ()))
+        for subjects in reversed(found):
+            result.extend(s for s in subjects if fnmatch.fnmatchcase(repository, s.repository))
+        return result
+
+    def match(self, claims: dict[str, Any]) -> Optional[DeploySubject]:
+        for subject in self.candidates(claims["repository"]):
+            if not fnmatch.fnmatchcase(claims.get("ref", ""), subject.ref):
+                continue
+            if subject.environment is not None and not fnmatch.fnmatchcase(
+                claims.get("environment") or "", subject.environment
+            ):
+                continue
+            return subject
+        return None
@@ -1,23 +1,37 @@
+import asyncio
+import decimal
 import logging
-import tempfile
-from pathlib import Path
-from typing import Annotated
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
-from hishel.httpx import AsyncCacheClient
+import httpx
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from hishel.httpx import AsyncCacheClient, AsyncCacheTransport
 
 from ibidem.ibidem_api import get_version
-from ibidem.ibidem_api.api.v1.weather.models import WeatherResponse, METJSONForecast
-from ibidem.ibidem_api.core.config import settings
+from ibidem.ibidem_api.api.v1.weather.icons import ICON_BASE_URL, IconCache
+from ibidem.ibidem_api.api.v1.weather.models import ForecastSeriesResponse, WeatherResponse
+from ibidem.ibidem_api.api.v1.weather.nowcast import (
+    NOWCAST_URL,
+    SERIES_ENCODERS,
+    CachedForecast,
+    ForecastCells,
+    NowcastPrefetcher,
+)
+from ibidem.ibidem_api.api.v1.weather.render import IconFormat, IconRenderer
+from ibidem.ibidem_api.api.v1.weather.stream import WeatherBroadcaster
+from ibidem.ibidem_api.core.admission import route_policy
+from ibidem.ibidem_api.core.config import get_settings, subscribe
+from ibidem.ibidem_api.core.deadline import DeadlineTransport
+from ibidem.ibidem_api.core.metrics import InstrumentedTransport, register_cache
+from ibidem.ibidem_api.core.negotiation import negotiate
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health, register_component
+from ibidem.ibidem_api.core.shared_cache import shared_cache
 
 LOG = logging.getLogger(__name__)
 
-ICON_BASE_URL = "https://raw.githubusercontent.com/metno/weathericons/refs/heads/main/weather/png"
-ICON_BASE_DIRECTORY = Path(tempfile.gettempdir()) / "weather_icons"
-
-NOWCAST_URL = "https://api.met.no/weatherapi/nowcast/2.0/complete"
-
 tags_metadata = [
     {
         "name": "weather",
@@ -29,45 +43,290 @@ router = APIRouter(
     tags=["weather"],
 )
 
+# Icons are rendered to this size when a raw format is requested without a size
+ICON_SIZE = 200
+
 
-async def http_client():
+_http_client: Optional[AsyncCacheClient] = None
+_nowcast: Optional[NowcastPrefetcher] = None
+_forecast_cells: Optional[ForecastCells] = None
+_icons: Optional[IconCache] = None
+_renderer: Optional[IconRenderer] = None
+_broadcaster: Optional[WeatherBroadcaster] = None
+
+
+@asynccontextmanager
+async def lifespan():
+    global _http_client, _nowcast, _forecast_cells, _icons, _renderer, _broadcaster
+    settings = get_settings()
     headers = {"user-agent": f"ibidem-api/{get_version()} +https://github.com/mortenlj/ibidem-api"}
-    async with AsyncCacheClient(follow_redirects=True, headers=headers) as client:
-        yield client
+    limits = httpx.Limits(
+        max_connections=settings.weather_max_connections,
+        max_keepalive_connections=settings.weather_max_keepalive_connections,
+    )
+    # Upstream metrics are recorded below the HTTP cache, so only requests that actually leave the app are counted
+    transport = AsyncCacheTransport(
+        next_transport=InstrumentedTransport(DeadlineTransport(httpx.AsyncHTTPTransport(http2=True, limits=limits))),
+    )
+    executor = ProcessPoolExecutor(max_workers=settings.icon_render_workers)
+    async with AsyncCacheClient(
+        follow_redirects=True,
+        headers=headers,
+        transport=transport,
+        timeout=httpx.Timeout(settings.weather_timeout),
+    ) as client:
+        _http_client = client
+        _nowcast = NowcastPrefetcher(
+            client,
+            settings.forecast_location,
+            min_interval=settings.forecast_min_refresh_interval,
+            max_interval=settings.forecast_max_refresh_interval,
+            retry_interval=settings.forecast_retry_interval,
+            series_steps=settings.forecast_series_steps,
+            url=settings.nowcast_url or NOWCAST_URL,
+            shared=shared_cache(),
+        )
+        _forecast_cells = ForecastCells(
+            client,
+            grid_size=settings.forecast_grid_size,
+            altitude_grid_size=settings.forecast_altitude_grid_size,
+            maxsize=settings.forecast_cell_cache_size,
+            ttl=settings.forecast_cell_ttl,
+            series_steps=settings.forecast_series_steps,
+            url=settings.nowcast_url or NOWCAST_URL,
+            shared=shared_cache(),
+        )
+        _icons = IconCache(client, settings.icon_cache_size, base_url=settings.icon_base_url or ICON_BASE_URL)
+        _renderer = IconRenderer(_icons, executor, settings.rendered_icon_cache_size)
+        _broadcaster = WeatherBroadcaster(
+            queue_size=settings.weather_stream_queue_size,
+            max_subscribers=settings.weather_stream_max_subscribers,
+            heartbeat_interval=settings.weather_stream_heartbeat_interval,
+        )
+        _nowcast.add_listener(lambda forecast: _broadcaster.publish(forecast.weather))
+        await _nowcast.start()
+        try:
+            yield
+        finally:
+            await _nowcast.stop()
+            _broadcaster.close()
+            _broadcaster = None
+            executor.shutdown(cancel_futures=True)
+            _nowcast = None
+            _forecast_cells = None
+            _icons = None
+            _renderer = None
+            _http_client = None
+
+
+def http_client() -> AsyncCacheClient:
+    """The HTTP client shared by all weather routes for the lifetime of the app"""
+    return _http_client
+
+
+def nowcast() -> NowcastPrefetcher:
+    return _nowcast
+
+
+def forecast_cells() -> ForecastCells:
+    return _forecast_cells
+
+
+def broadcaster() -> WeatherBroadcaster:
+    return _broadcaster
+
+
+def icons() -> IconCache:
+    return _icons
+
+
+def icon_renderer() -> IconRenderer:
+    return _renderer
+
+
+def _update_forecast_location(settings):
+    if _nowcast is not None:
+        _nowcast.set_location(settings.forecast_location)
+
+
+subscribe(["forecast_location"], _update_forecast_location)
+
+register_cache("forecast_cells", lambda: _forecast_cells.stats if _forecast_cells is not None else None)
+register_cache("icons", lambda: _icons.stats if _icons is not None else None)
+register_cache("rendered_icons", lambda: _renderer.stats if _renderer is not None else None)
+
+
+async def _warm_up_forecast():
+    if _nowcast is not None:
+        await _nowcast.get()
+
+
+def _forecast_status() -> ComponentStatus:
+    if _nowcast is None or _nowcast.location is None:
+        return ComponentStatus(Health.OK, detail="No forecast location configured")
+    forecast = _nowcast.current
+    if forecast is None:
+        return ComponentStatus(Health.DOWN)
+    if forecast.stale:
+        return ComponentStatus(Health.DEGRADED, forecast.fetched_at, "Forecast is stale")
+    return ComponentStatus(Health.OK, forecast.fetched_at)
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def weather(http_client: Annotated[AsyncCacheClient, Depends(http_client)]) -> WeatherResponse:
-    params = {
-        "lat": round(settings.forecast_location.latitude, 4),
-        "lon": round(settings.forecast_location.longtitude, 4),
-        "altitude": settings.forecast_location.altitude,
+async def _warm_up_icons():
+    archive_path = get_settings().icon_archive_path
+    if _icons is not None and archive_path is not None:
+        await asyncio.to_thread(_icons.prewarm, archive_path)
+
+
+register_component("forecast", _warm_up_forecast, _forecast_status)
+register_component("icons", _warm_up_icons, lambda: ComponentStatus(Health.OK))
+
+
+async def current_forecast(
+    nowcast: Annotated[NowcastPrefetcher, Depends(nowcast)],
+    cells: Annotated[ForecastCells, Depends(forecast_cells)],
+    lat: Annotated[Optional[decimal.Decimal], Query(ge=-90, le=90)] = None,
+    lon: Annotated[Optional[decimal.Decimal], Query(ge=-180, le=180)] = None,
+    altitude: Optional[decimal.Decimal] = None,
+) -> CachedForecast:
+    """Forecast for the configured location, or for the given coordinates"""
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Both lat and lon must be given")
+    try:
+        if lat is None:
+            forecast = await nowcast.get()
+        else:
+            forecast = await cells.get(cells.snap(lat, lon, altitude))
+    except (httpx.HTTPError, ValueError):
+        LOG.error("Failed to fetch nowcast", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Forecast is not available")
+    if forecast is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No forecast location configured")
+    return forecast
+
+
+def _forecast_headers(forecast: CachedForecast) -> dict[str, str]:
+    headers = {"age": str(int(forecast.age))}
+    if forecast.stale:
+        headers["warning"] = '110 - "Response is Stale"'
+    return headers
+
+
+FORECAST_RESPONSES = {
+    status.HTTP_400_BAD_REQUEST: {
+        "description": "Only one of lat and lon was given",
+        "model": str,
+    },
+    status.HTTP_503_SERVICE_UNAVAILABLE: {
+        "description": "No forecast is available",
+        "model": str,
+    },
+}
+
+
+@router.get("/", status_code=status.HTTP_200_OK, responses=FORECAST_RESPONSES)
+async def weather(
+    response: Response,
+    forecast: Annotated[CachedForecast, Depends(current_forecast)],
+) -> WeatherResponse:
+    """Current weather at the configured location, or at the given coordinates
+
+    Coordinates are snapped to a grid, so nearby locations share the same forecast. The forecast for the configured
+    location is refreshed in the background. If met.no is unavailable, the last known forecast is returned
+    with a Warning header, and the Age header tells how old it is."""
+    response.headers.update(_forecast_headers(forecast))
+    return forecast.weather
+
+
+@router.get(
+    "/forecast",
+    status_code=status.HTTP_200_OK,
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "model": ForecastSeriesResponse,
+            "content": {media_type: {} for media_type in SERIES_ENCODERS},
+        },
+        **FORECAST_RESPONSES,
+    },
+)
+async def forecast_series(
+    forecast: Annotated[CachedForecast, Depends(current_forecast)],
+    accept: Annotated[Optional[str], Header()] = None,
+):
+    """Upcoming forecast steps as parallel arrays
+
+    Takes the same parameters as the current weather. The response is JSON, or CBOR or MessagePack if requested in
+    the Accept header."""
+    media_type = negotiate(accept, SERIES_ENCODERS)
+    headers = _forecast_headers(forecast)
+    headers["vary"] = "accept"
+    return Response(forecast.encoded_series(media_type), media_type=media_type, headers=headers)
+
+
+@router.get(
+    "/stream",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {"content": {"text/event-stream": {}}},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Too many subscribers", "model": str},
+    },
+)
+@route_policy(bypass=True, timeout=None)
+async def weather_stream(broadcaster: Annotated[WeatherBroadcaster, Depends(broadcaster)]):
+    """Current weather at the configured location as Server-Sent Events
+
+    A `weather` event with the same data as the current weather is sent when subscribing, and then whenever the
+    icon or temperature changes. Comments are sent as heartbeats in between."""
+    if broadcaster.full:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many subscribers")
+    headers = {"cache-control": "no-cache", "x-accel-buffering": "no"}
+    return StreamingResponse(broadcaster.events(), media_type="text/event-stream", headers=headers)
+
+
+@router.get(
+    "/icon/{icon_name}",
+    status_code=status.HTTP_200_OK,
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {"content": {"image/png": {}, "application/octet-stream": {}}},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Icon has not changed"},
+        status.HTTP_404_NOT_FOUND: {"description": "No such icon"},
+    },
+)
+async def retrieve_icon(
+    icon_name: str,
+    icons: Annotated[IconCache, Depends(icons)],
+    renderer: Annotated[IconRenderer, Depends(icon_renderer)],
+    size: Annotated[Optional[int], Query(ge=8, le=512)] = None,
+    format: IconFormat = IconFormat.PNG,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    """Weather icon from the metno weathericons set
+
+    The icon can be scaled to `size` x `size` pixels, and rendered to a raw pixel format that devices can copy
+    straight to their display: `mono` (1 bit per pixel, rows padded to whole bytes, most significant bit first),
+    `gray8` (1 byte per pixel) or `rgb565` (2 bytes per pixel, big endian). Transparent areas are rendered as white
+    in raw formats.
+
+    Icons never change, so they carry a strong ETag and may be cached by clients."""
+    if size is None and format == IconFormat.PNG:
+        icon = await icons.get(icon_name)
+    else:
+        icon = await renderer.get(icon_name, size or ICON_SIZE, format)
+    if icon is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    headers = {
+        "etag": icon.etag,
+        "cache-control": f"public, max-age={get_settings().icon_max_age}, immutable",
     }
-    resp = await http_client.get(NOWCAST_URL, params=params)
-    resp.raise_for_status()
-    data = resp.json()
-    forecast = METJSONForecast.model_validate(data)
-    forecast_instant = forecast.properties.timeseries[0]
-    icon_name = forecast_instant.data.next_1_hours.summary.symbol_code
-    temperature = forecast_instant.data.instant.details.air_temperature
-    return WeatherResponse(icon_name=icon_name, temperature=temperature)
-
-
-@router.get("/icon/{icon_name}", status_code=status.HTTP_200_OK, response_class=FileResponse)
-async def retrieve_icon(icon_name, http_client: Annotated[AsyncCacheClient, Depends(http_client)]) -> Path:
-    icon_filename = f"{icon_name}.png"
-    icon_path = ICON_BASE_DIRECTORY / icon_filename
-    if not icon_path.exists():
-        icon_path.parent.mkdir(parents=True, exist_ok=True)
-        icon_url = f"{ICON_BASE_URL}/{icon_filename}"
-        resp = await http_client.get(icon_url)
-        if resp.status_code == status.HTTP_404_NOT_FOUND:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-        resp.raise_for_status()
-        tmp = tempfile.NamedTemporaryFile("wb", delete=False, dir=icon_path.parent)
-        tmp_path = Path(tmp.name)
-        with tmp as fobj:
-            async for chunk in resp.aiter_bytes():
-                fobj.write(chunk)
-        tmp_path.rename(icon_path)
-    return icon_path
+    if format != IconFormat.PNG:
+        headers["x-image-width"] = headers["x-image-height"] = str(size or ICON_SIZE)
+    if if_none_match is not None and (if_none_match.strip() == "*" or icon.etag in _etags(if_none_match)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(icon.content, media_type=format.media_type, headers=headers)
+
+
+def _etags(header: str) -> list[str]:
+    return [etag.strip().removeprefix("W/") for etag in header.split(",")]
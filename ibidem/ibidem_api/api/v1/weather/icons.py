@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+import re
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Iterator, Optional
+
+import httpx
+
+from ibidem.ibidem_api.core.cache import LRUCache, SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+ICON_BASE_URL = "https://raw.githubusercontent.com/metno/weathericons/refs/heads/main/weather/png"
+ICON_BASE_DIRECTORY = Path(tempfile.gettempdir()) / "weather_icons"
+ICON_NAME = re.compile(r"[a-z0-9_]{1,64}")
+
+
+@dataclass(frozen=True)
+class Icon:
+    content: bytes
+    etag: str
+
+    @classmethod
+    def from_content(cls, content: bytes) -> "Icon":
+        return cls(content, f'"{hashlib.sha256(content).hexdigest()[:32]}"')
+
+
+class IconCache:
+    """Weather icons, cached in memory in front of a cache on disk
+
+    Icons missing from both are downloaded from the metno weathericons repository. Concurrent requests for the same
+    missing icon share a single download.
+    """
+
+    def __init__(
+        self, client: httpx.AsyncClient, max_bytes: int, directory: Path = ICON_BASE_DIRECTORY, base_url=ICON_BASE_URL
+    ):
+        self._client = client
+        self._directory = directory
+        self._base_url = base_url
+        self._cache = LRUCache(max_bytes, weigher=lambda icon: len(icon.content))
+        self._downloads = SingleFlight()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    async def get(self, name: str) -> Optional[Icon]:
+        """Icon with the given name, or None if there is no such icon"""
+        if not ICON_NAME.fullmatch(name):
+            return None
+        icon = self._cache.get(name)
+        if icon is None:
+            icon = await self._downloads.do(name, lambda: self._load(name))
+        return icon
+
+    async def _load(self, name: str) -> Optional[Icon]:
+        icon_path = self._directory / f"{name}.png"
+        try:
+            content = await asyncio.to_thread(icon_path.read_bytes)
+        except OSError:
+            # Not on disk, or the disk cache is unusable, which is no reason to fail the request
+            content = await self._download(name, icon_path)
+            if content is None:
+                return None
+        icon = Icon.from_content(content)
+        self._cache.set(name, icon)
+        return icon
+
+    async def _download(self, name: str, icon_path: Path) -> Optional[bytes]:
+        resp = await self._client.get(f"{self._base_url}/{name}.png")
+        if resp.status_code == httpx.codes.NOT_FOUND:
+            return None
+        resp.raise_for_status()
+        try:
+            await asyncio.to_thread(write_atomic, icon_path, resp.content)
+        except OSError:
+            LOG.warning("Failed to store weather icon %s on disk", name, exc_info=True)
+        return resp.content
+
+    def prewarm(self, source: Path) -> int:
+        """Load all PNG icons from a directory, zip or tar archive into the disk and memory caches
+
+        Runs blocking IO, so it should be run in a thread."""
+        count = 0
+        for name, content in _read_icons(source):
+            if not ICON_NAME.fullmatch(name):
+                continue
+            write_atomic(self._directory / f"{name}.png", content)
+            self._cache.set(name, Icon.from_content(content))
+            count += 1
+        LOG.info("Prewarmed %d weather icons from %s", count, source)
+        return count
+
+
+def _read_icons(source: Path) -> Iterator[tuple[str, bytes]]:
+    if source.is_dir():
+        for path in source.rglob("*.png"):
+            yield path.stem, path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                path = PurePosixPath(info.filename)
+                if not info.is_dir() and path.suffix == ".png":
+                    yield path.stem, archive.read(info)
+    else:
+        with tarfile.open(source) as archive:
+            for member in archive:
+                path = PurePosixPath(member.name)
+                if member.isfile() and path.suffix == ".png":
+                    yield path.stem, archive.extractfile(member).read()
+
+
+def write_atomic(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=path.parent) as fobj:
+        fobj.write(content)
+    Path(fobj.name).replace(path)
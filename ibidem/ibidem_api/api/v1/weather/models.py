@@ -1,7 +1,9 @@
 import decimal
+from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel
+from typing_extensions import Required, TypedDict
 
 
 class WeatherResponse(BaseModel):
@@ -9,8 +11,18 @@ class WeatherResponse(BaseModel):
     temperature: decimal.Decimal
 
 
+class ForecastSeriesResponse(BaseModel):
+    """Upcoming forecast steps as parallel arrays, with timestamps in seconds since the epoch"""
+
+    timestamps: list[int]
+    temperatures: list[Optional[float]]
+    precipitation: list[Optional[float]]
+    symbol_codes: list[Optional[str]]
+
+
 class ForecastData(BaseModel):
     air_temperature: Optional[decimal.Decimal] = None
+    precipitation_rate: Optional[decimal.Decimal] = None
 
 
 class ForecastSummary(BaseModel):
@@ -25,9 +37,11 @@ class ForecastHour(BaseModel):
 class ForecastTimeStep(BaseModel):
     instant: Optional[ForecastHour] = None
     next_1_hours: Optional[ForecastHour] = None
+    next_6_hours: Optional[ForecastHour] = None
 
 
 class ForecastTimeStepWrapper(BaseModel):
+    time: Optional[datetime] = None
     data: ForecastTimeStep
 
 
@@ -37,3 +51,40 @@ class Forecast(BaseModel):
 
 class METJSONForecast(BaseModel):
     properties: Forecast
+
+
+# Only the parts of a METJSONForecast that make up a forecast series, as plain dicts and floats, which validate
+# several times faster than the models above when there are many time steps
+
+
+class SeriesData(TypedDict, total=False):
+    air_temperature: Optional[float]
+    precipitation_rate: Optional[float]
+
+
+class SeriesSummary(TypedDict):
+    symbol_code: str
+
+
+class SeriesHour(TypedDict, total=False):
+    details: Optional[SeriesData]
+    summary: Optional[SeriesSummary]
+
+
+class SeriesTimeStep(TypedDict, total=False):
+    instant: Optional[SeriesHour]
+    next_1_hours: Optional[SeriesHour]
+    next_6_hours: Optional[SeriesHour]
+
+
+class SeriesTimeStepWrapper(TypedDict, total=False):
+    time: Optional[datetime]
+    data: Required[SeriesTimeStep]
+
+
+class SeriesForecast(TypedDict):
+    timeseries: List[SeriesTimeStepWrapper]
+
+
+class METJSONSeries(TypedDict):
+    properties: SeriesForecast
@@ -0,0 +1,419 @@
+import asyncio
+import decimal
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field, replace
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+import cbor2
+import httpx
+import msgpack
+
+from pydantic import TypeAdapter
+
+from ibidem.ibidem_api.api.v1.weather.models import (
+    ForecastSeriesResponse,
+    ForecastTimeStepWrapper,
+    METJSONForecast,
+    METJSONSeries,
+    SeriesTimeStep,
+    SeriesTimeStepWrapper,
+    WeatherResponse,
+)
+from ibidem.ibidem_api.core.cache import LRUCache, SingleFlight
+from ibidem.ibidem_api.core.config import ForecastLocation
+from ibidem.ibidem_api.core.shared_cache import SharedCache
+
+LOG = logging.getLogger(__name__)
+
+NOWCAST_URL = "https://api.met.no/weatherapi/nowcast/2.0/complete"
+
+_TIMESERIES = re.compile(r'"timeseries"\s*:\s*\[')
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+_SERIES = TypeAdapter(METJSONSeries)
+
+SERIES_ENCODERS = {
+    "application/json": lambda series: series.model_dump_json().encode("utf-8"),
+    "application/cbor": lambda series: cbor2.dumps(series.model_dump()),
+    "application/msgpack": lambda series: msgpack.packb(series.model_dump()),
+}
+
+
+@dataclass(frozen=True)
+class CachedForecast:
+    weather: WeatherResponse
+    series: ForecastSeriesResponse
+    fetched_at: float
+    expires_at: float
+    last_modified: Optional[str] = None
+    _encoded_series: dict[str, bytes] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+    @property
+    def stale(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def encoded_series(self, media_type: str) -> bytes:
+        """The series encoded as one of the media types in SERIES_ENCODERS, encoded once per forecast"""
+        content = self._encoded_series.get(media_type)
+        if content is None:
+            content = self._encoded_series[media_type] = SERIES_ENCODERS[media_type](self.series)
+        return content
+
+    def to_json(self) -> bytes:
+        return json.dumps(
+            {
+                "weather": self.weather.model_dump(mode="json"),
+                "series": self.series.model_dump(mode="json"),
+                "fetched_at": self.fetched_at,
+                "expires_at": self.expires_at,
+                "last_modified": self.last_modified,
+            }
+        ).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "CachedForecast":
+        fields = json.loads(data)
+        return cls(
+            weather=WeatherResponse.model_validate(fields["weather"]),
+            series=ForecastSeriesResponse.model_validate(fields["series"]),
+            fetched_at=fields["fetched_at"],
+            expires_at=fields["expires_at"],
+            last_modified=fields["last_modified"],
+        )
+
+
+def _expires_at(resp: httpx.Response, default: float) -> float:
+    expires = resp.headers.get("expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            LOG.warning("Invalid Expires header from met.no: %r", expires)
+    return default
+
+
+def parse_time_steps(raw: bytes, count: int) -> list[ForecastTimeStepWrapper]:
+    """Parse the first `count` steps of the timeseries in a METJSONForecast document
+
+    Only the requested steps are decoded and validated, the rest of the document is never parsed. If the timeseries
+    can't be located, the whole document is parsed instead. Decoding step by step only pays off for the first few
+    steps, use `parse_series` for more.
+    """
+    text = raw.decode("utf-8")
+    match = _TIMESERIES.search(text)
+    if match is None:
+        forecast = METJSONForecast.model_validate_json(raw)
+        return forecast.properties.timeseries[:count]
+    steps = []
+    pos = match.end()
+    while len(steps) < count:
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith("]", pos):
+            break
+        step, pos = _DECODER.raw_decode(text, pos)
+        steps.append(ForecastTimeStepWrapper.model_validate(step))
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith(",", pos):
+            pos += 1
+    return steps
+
+
+def _symbol_code(step: ForecastTimeStepWrapper) -> Optional[str]:
+    """Symbol for the next hour, or the next six hours when the hour has none, such as at the end of the series"""
+    for period in (step.data.next_1_hours, step.data.next_6_hours):
+        if period is not None and period.summary is not None:
+            return period.summary.symbol_code
+    return None
+
+
+def _weather_response(forecast_instant: ForecastTimeStepWrapper) -> WeatherResponse:
+    icon_name = _symbol_code(forecast_instant)
+    if icon_name is None:
+        raise ValueError("Forecast has no symbol for the first time step")
+    instant = forecast_instant.data.instant
+    temperature = instant.details.air_temperature if instant is not None and instant.details is not None else None
+    if temperature is None:
+        raise ValueError("Forecast has no temperature for the first time step")
+    return WeatherResponse(icon_name=icon_name, temperature=temperature)
+
+
+def parse_series(raw: bytes, count: int) -> list[SeriesTimeStepWrapper]:
+    """Parse the first `count` steps of the timeseries in a METJSONForecast document, as far as a series needs them
+
+    The whole document is validated in one pass."""
+    return _SERIES.validate_json(raw)["properties"]["timeseries"][:count]
+
+
+def _series_symbol_code(data: SeriesTimeStep) -> Optional[str]:
+    """Same as `_symbol_code`, for a step parsed by `parse_series`"""
+    for period in (data.get("next_1_hours"), data.get("next_6_hours")):
+        if period is not None and period.get("summary") is not None:
+            return period["summary"]["symbol_code"]
+    return None
+
+
+def _forecast_series(steps: list[SeriesTimeStepWrapper]) -> ForecastSeriesResponse:
+    series = ForecastSeriesResponse(timestamps=[], temperatures=[], precipitation=[], symbol_codes=[])
+    for step in steps:
+        if step.get("time") is None:
+            continue
+        instant = step["data"].get("instant")
+        details = (instant.get("details") if instant is not None else None) or {}
+        series.timestamps.append(int(step["time"].timestamp()))
+        series.temperatures.append(details.get("air_temperature"))
+        series.precipitation.append(details.get("precipitation_rate"))
+        series.symbol_codes.append(_series_symbol_code(step["data"]))
+    return series
+
+
+def parse_forecast(raw: bytes, series_steps: int) -> tuple[WeatherResponse, ForecastSeriesResponse]:
+    """Derive the current weather and the series of the next `series_steps` steps from a METJSONForecast document"""
+    # The current weather keeps the exact temperature, so the first step is parsed on its own
+    steps = parse_time_steps(raw, 1)
+    if not steps:
+        raise ValueError("Forecast has no time steps")
+    series = _forecast_series(parse_series(raw, series_steps) if series_steps > 0 else [])
+    return _weather_response(steps[0]), series
+
+
+def _nowcast_params(location: ForecastLocation) -> dict:
+    params = {
+        "lat": round(location.latitude, 4),
+        "lon": round(location.longtitude, 4),
+    }
+    if location.altitude is not None:
+        params["altitude"] = location.altitude
+    return params
+
+
+async def fetch_nowcast(
+    client: httpx.AsyncClient,
+    location: ForecastLocation,
+    previous: Optional[CachedForecast] = None,
+    series_steps: int = 24,
+    default_ttl: float = 300,
+    url: str = NOWCAST_URL,
+) -> CachedForecast:
+    """Fetch the nowcast for a location, revalidating the previous forecast if there is one
+
+    Both the current weather and the series of the next `series_steps` steps are derived once per fetch."""
+    params = _nowcast_params(location)
+    headers = {}
+    if previous is not None and previous.last_modified:
+        headers["if-modified-since"] = previous.last_modified
+    resp = await client.get(url, params=params, headers=headers)
+    now = time.time()
+    if resp.status_code == httpx.codes.NOT_MODIFIED and previous is not None:
+        return replace(previous, fetched_at=now, expires_at=_expires_at(resp, now + default_ttl))
+    resp.raise_for_status()
+    weather, series = parse_forecast(resp.content, series_steps)
+    return CachedForecast(
+        weather=weather,
+        series=series,
+        fetched_at=now,
+        expires_at=_expires_at(resp, now + default_ttl),
+        last_modified=resp.headers.get("last-modified"),
+    )
+
+
+async def fetch_shared_nowcast(
+    shared: Optional[SharedCache],
+    client: httpx.AsyncClient,
+    location: ForecastLocation,
+    previous: Optional[CachedForecast] = None,
+    series_steps: int = 24,
+    url: str = NOWCAST_URL,
+    max_age: Optional[float] = None,
+) -> CachedForecast:
+    """Like `fetch_nowcast`, but reusing a forecast another worker has fetched, if it has not expired and is not
+    older than `max_age` seconds"""
+    if shared is None:
+        return await fetch_nowcast(client, location, previous, series_steps, url=url)
+
+    async def fetch():
+        forecast = await fetch_nowcast(client, location, previous, series_steps, url=url)
+        return forecast.to_json(), forecast.expires_at
+
+    key = str(httpx.URL(url, params=_nowcast_params(location)))
+    return CachedForecast.from_json(await shared.get_or_fetch("nowcast", key, fetch, max_age=max_age))
+
+
+class NowcastPrefetcher:
+    """Keeps the nowcast for a location up to date in the background
+
+    The forecast is refreshed when met.no says it expires, within the bounds of `min_interval` and `max_interval`.
+    If a refresh fails, the last good forecast is kept, and the refresh is retried after `retry_interval`.
+    With a shared cache, a forecast refreshed by another worker less than `min_interval` seconds ago is used instead.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        location: Optional[ForecastLocation],
+        min_interval: float,
+        max_interval: float,
+        retry_interval: float,
+        series_steps: int,
+        url: str = NOWCAST_URL,
+        shared: Optional[SharedCache] = None,
+    ):
+        self._client = client
+        self._shared = shared
+        self._location = location
+        self._series_steps = series_steps
+        self._url = url
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._retry_interval = retry_interval
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: list[Callable[[CachedForecast], None]] = []
+        self.current: Optional[CachedForecast] = None
+
+    def add_listener(self, listener: Callable[[CachedForecast], None]):
+        """Register a callback to be called with every refreshed forecast"""
+        self._listeners.append(listener)
+
+    @property
+    def location(self) -> Optional[ForecastLocation]:
+        return self._location
+
+    async def start(self):
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def set_location(self, location: Optional[ForecastLocation]):
+        self._location = location
+        self.current = None
+        self._wake.set()
+
+    async def get(self) -> CachedForecast:
+        """The last good forecast, fetching it first if there is none yet"""
+        if self.current is None:
+            await self.refresh(missing_only=True)
+        return self.current
+
+    async def refresh(self, missing_only: bool = False):
+        async with self._lock:
+            if missing_only and self.current is not None:
+                return
+            location = self._location
+            if location is None:
+                return
+            forecast = await fetch_shared_nowcast(
+                self._shared,
+                self._client,
+                location,
+                self.current,
+                self._series_steps,
+                url=self._url,
+                max_age=self._min_interval,
+            )
+            if location == self._location:
+                self.current = forecast
+                for listener in self._listeners:
+                    listener(forecast)
+
+    async def _refresh_loop(self):
+        while True:
+            self._wake.clear()
+            delay = None
+            if self._location is not None:
+                try:
+                    await self.refresh()
+                except Exception:
+                    # Keep serving the last good forecast, whatever went wrong with this one
+                    LOG.error("Failed to refresh nowcast", exc_info=True)
+                    delay = self._retry_interval
+                else:
+                    if self.current is not None:
+                        expires_in = self.current.expires_at - time.time()
+                        delay = min(max(expires_in, self._min_interval), self._max_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except TimeoutError:
+                pass
+
+
+def _snap(value: decimal.Decimal, grid: decimal.Decimal) -> decimal.Decimal:
+    return decimal.Decimal(round(value / grid)) * grid
+
+
+class ForecastCells:
+    """Nowcasts for arbitrary locations, snapped to a grid so nearby locations share a cache entry
+
+    Concurrent requests for the same cell share a single request to met.no. Cells are evicted `ttl` seconds after
+    they were fetched, or earlier when the cache is full and they are the least recently used.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        grid_size: decimal.Decimal,
+        altitude_grid_size: decimal.Decimal,
+        maxsize: int,
+        ttl: float,
+        series_steps: int,
+        url: str = NOWCAST_URL,
+        shared: Optional[SharedCache] = None,
+    ):
+        self._client = client
+        self._shared = shared
+        self._series_steps = series_steps
+        self._url = url
+        self._grid_size = grid_size
+        self._altitude_grid_size = altitude_grid_size
+        self._ttl = ttl
+        self._cache = LRUCache(maxsize)
+        self._requests = SingleFlight()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    def snap(
+        self, latitude: decimal.Decimal, longtitude: decimal.Decimal, altitude: Optional[decimal.Decimal]
+    ) -> ForecastLocation:
+        return ForecastLocation(
+            latitude=_snap(latitude, self._grid_size),
+            longtitude=_snap(longtitude, self._grid_size),
+            altitude=_snap(altitude, self._altitude_grid_size) if altitude is not None else None,
+        )
+
+    async def get(self, location: ForecastLocation) -> CachedForecast:
+        """Forecast for a snapped location, falling back to a stale forecast if met.no fails"""
+        key = (location.latitude, location.longtitude, location.altitude)
+        forecast = self._cache.get(key)
+        if forecast is not None and not forecast.stale:
+            return forecast
+        try:
+            return await self._requests.do(key, lambda: self._fetch(key, location, forecast))
+        except (httpx.HTTPError, ValueError):
+            if forecast is None:
+                raise
+            LOG.warning("Failed to refresh nowcast for %r, serving stale forecast", key, exc_info=True)
+            return forecast
+
+    async def _fetch(self, key, location: ForecastLocation, previous: Optional[CachedForecast]) -> CachedForecast:
+        forecast = await fetch_shared_nowcast(
+            self._shared, self._client, location, previous, self._series_steps, url=self._url
+        )
+        self._cache.set(key, forecast, time.time() + self._ttl)
+        return forecast
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from enum import Enum
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageChops
+
+from ibidem.ibidem_api.api.v1.weather.icons import ICON_BASE_DIRECTORY, ICON_NAME, Icon, IconCache, write_atomic
+from ibidem.ibidem_api.core.cache import LRUCache, SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+RENDERED_ICON_DIRECTORY = ICON_BASE_DIRECTORY / "rendered"
+
+
+class IconFormat(str, Enum):
+    PNG = "png"
+    MONO = "mono"
+    GRAY8 = "gray8"
+    RGB565 = "rgb565"
+
+    @property
+    def media_type(self) -> str:
+        return "image/png" if self == IconFormat.PNG else "application/octet-stream"
+
+
+def render_icon(content: bytes, size: int, icon_format: IconFormat) -> bytes:
+    """Scale a PNG icon to `size` x `size` pixels, and encode it in the given format
+
+    Transparent areas are flattened onto white for the raw formats. MONO is 1 bit per pixel, rows padded to whole
+    bytes, most significant bit first. GRAY8 is 1 byte per pixel. RGB565 is 2 bytes per pixel, big endian.
+
+    This is CPU bound, and is meant to be run in a process pool.
+    """
+    with Image.open(BytesIO(content)) as image:
+        image = image.convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
+    if icon_format == IconFormat.PNG:
+        out = BytesIO()
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+    image = Image.alpha_composite(background, image).convert("RGB")
+    if icon_format == IconFormat.MONO:
+        return image.convert("1").tobytes()
+    if icon_format == IconFormat.GRAY8:
+        return image.convert("L").tobytes()
+    # The 5-6-5 bits of each channel don't overlap, so adding them up per byte packs them
+    r, g, b = image.split()
+    high = ImageChops.add(r.point(lambda v: v & 0xF8), g.point(lambda v: v >> 5))
+    low = ImageChops.add(g.point(lambda v: (v & 0x1C) << 3), b.point(lambda v: v >> 3))
+    return Image.merge("LA", (high, low)).tobytes()
+
+
+class IconRenderer:
+    """Icons rendered to a given size and format, cached in memory and on disk"""
+
+    def __init__(self, icons: IconCache, executor: Executor, max_bytes: int, directory: Path = RENDERED_ICON_DIRECTORY):
+        self._icons = icons
+        self._executor = executor
+        self._directory = directory
+        self._cache = LRUCache(max_bytes, weigher=lambda icon: len(icon.content))
+        self._renders = SingleFlight()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    async def get(self, name: str, size: int, icon_format: IconFormat) -> Optional[Icon]:
+        """Icon with the given name rendered to size and format, or None if there is no such icon"""
+        if not ICON_NAME.fullmatch(name):
+            return None
+        key = (name, size, icon_format)
+        icon = self._cache.get(key)
+        if icon is None:
+            icon = await self._renders.do(key, lambda: self._load(name, size, icon_format))
+        return icon
+
+    async def _load(self, name: str, size: int, icon_format: IconFormat) -> Optional[Icon]:
+        path = self._directory / f"{name}_{size}.{icon_format.value}"
+        try:
+            content = await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            icon = await self._icons.get(name)
+            if icon is None:
+                return None
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(self._executor, render_icon, icon.content, size, icon_format)
+            await asyncio.to_thread(write_atomic, path, content)
+        rendered = Icon.from_content(content)
+        self._cache.set((name, size, icon_format), rendered)
+        return rendered
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from ibidem.ibidem_api.api.v1.weather.models import WeatherResponse
+
+LOG = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue[Optional[bytes]] = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def close(self):
+        """Drop any queued events, and wake the consumer so it ends the stream"""
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class WeatherBroadcaster:
+    """Fans out weather updates to subscribers as Server-Sent Events
+
+    An event is only sent when the weather actually changes. Each subscriber has a bounded queue, and a subscriber
+    that falls so far behind that its queue is full is dropped.
+    """
+
+    def __init__(self, queue_size: int, max_subscribers: int, heartbeat_interval: float):
+        self._queue_size = queue_size
+        self._max_subscribers = max_subscribers
+        self._heartbeat_interval = heartbeat_interval
+        self._subscribers: set[Subscription] = set()
+        self._last: Optional[WeatherResponse] = None
+        self._last_event: Optional[bytes] = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self._max_subscribers
+
+    def publish(self, weather: WeatherResponse):
+        if weather == self._last:
+            return
+        self._last = weather
+        self._last_event = f"event: weather\ndata: {weather.model_dump_json()}\n\n".encode("utf-8")
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(self._last_event)
+            except asyncio.QueueFull:
+                LOG.warning("Dropping slow weather stream subscriber")
+                self._subscribers.discard(subscription)
+                subscription.close()
+                self.dropped += 1
+
+    def close(self):
+        for subscription in self._subscribers:
+            subscription.close()
+        self._subscribers.clear()
+
+    async def events(self) -> AsyncIterator[bytes]:
+        """Stream of events for one subscriber, starting with the current weather if known"""
+        subscription = Subscription(self._queue_size)
+        self._subscribers.add(subscription)
+        try:
+            if self._last_event is not None:
+                yield self._last_event
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self._heartbeat_interval)
+                except TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.discard(subscription)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import cache
+from typing import Callable, Optional
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ibidem.ibidem_api.core.config import get_settings, subscribe
+from ibidem.ibidem_api.core.deadline import DEADLINE
+from ibidem.ibidem_api.core.metrics import REJECTED_REQUESTS
+
+LOG = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when there is no room for more work, neither in flight nor in the queue"""
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+
+
+class ConcurrencyLimiter:
+    """Caps the amount of work in flight, with a bounded queue in front
+
+    Work beyond `max_in_flight` waits in the queue for up to `queue_timeout` seconds. If the queue already holds
+    `max_queued` waiters, or the wait times out, Overloaded is raised, so bursts are turned away early instead of
+    piling up.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float):
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._max_queued = max_queued
+        self._queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = AdmissionStats()
+
+    async def acquire(self, queue_timeout: Optional[float] = None):
+        """Take a slot, waiting in the queue for at most `queue_timeout` seconds, if shorter than the default"""
+        if self._semaphore.locked():
+            if self.waiting >= self._max_queued:
+                self.stats.rejected += 1
+                raise Overloaded("Queue is full")
+            if queue_timeout is None or queue_timeout > self._queue_timeout:
+                queue_timeout = self._queue_timeout
+            self.stats.queued += 1
+            self.waiting += 1
+            try:
+                async with asyncio.timeout(max(queue_timeout, 0)):
+                    await self._semaphore.acquire()
+            except TimeoutError:
+                self.stats.timed_out += 1
+                raise Overloaded(f"Waited more than {queue_timeout:.3g}s in queue") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.stats.admitted += 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+DEFAULT_TIMEOUT = object()
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """How requests to a route are admitted
+
+    Routes that `bypass` admission control are never queued or shed. `timeout` is the default time requests to the
+    route have to complete, None for no deadline, or DEFAULT_TIMEOUT for the `request_timeout` setting.
+    """
+
+    bypass: bool = False
+    timeout: object = DEFAULT_TIMEOUT
+
+
+POLICIES: dict[Callable, RoutePolicy] = {}
+DEFAULT_POLICY = RoutePolicy()
+
+
+def route_policy(bypass: bool = False, timeout=DEFAULT_TIMEOUT):
+    """Decorator setting the RoutePolicy of an endpoint, applied below the route decorator"""
+
+    def decorator(endpoint: Callable) -> Callable:
+        POLICIES[endpoint] = RoutePolicy(bypass, timeout)
+        return endpoint
+
+    return decorator
+
+
+@cache
+def request_limiter() -> Optional[ConcurrencyLimiter]:
+    """Limiter of requests in flight, or None if disabled"""
+    settings = get_settings()
+    if settings.admission_max_in_flight <= 0:
+        return None
+    return ConcurrencyLimiter(
+        settings.admission_max_in_flight, settings.admission_max_queued, settings.admission_queue_timeout
+    )
+
+
+subscribe(
+    ["admission_max_in_flight", "admission_max_queued", "admission_queue_timeout"],
+    lambda _settings: request_limiter.cache_clear(),
+)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware shedding load, and giving every request a deadline
+
+    At most `admission_max_in_flight` requests are served at a time, with a short queue in front. Requests that find
+    the queue full, or wait too long, get a 503, so probes and cheap requests are not stuck behind a pile of slow
+    ones. Routes with a bypassing RoutePolicy, such as probes, are always served.
+
+    The deadline is the route's default timeout, shortened by the timeout in the `request_timeout_header` if a
+    client sends one. It is available to upstream calls through DEADLINE, and a request still running at its
+    deadline is cancelled, with a 504 if the response has not started.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        policy = self._policy(scope)
+        timeout = self._timeout(scope, policy)
+        deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+        limiter = None if policy.bypass else request_limiter()
+        if limiter is None:
+            await self._serve(scope, receive, send, deadline)
+            return
+        try:
+            await limiter.acquire(timeout)
+        except Overloaded as e:
+            LOG.warning("Shedding request to %s: %s", scope["path"], e)
+            REJECTED_REQUESTS.labels("requests", "overloaded").inc()
+            await _send_error(send, 503, "Server is overloaded", [(b"retry-after", b"1")])
+            return
+        try:
+            await self._serve(scope, receive, send, deadline)
+        finally:
+            limiter.release()
+
+    async def _serve(self, scope: Scope, receive: Receive, send: Send, deadline: Optional[float]):
+        if deadline is None:
+            await self.app(scope, receive, send)
+            return
+        started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = DEADLINE.set(deadline)
+        timeout = asyncio.timeout_at(deadline)
+        try:
+            async with timeout:
+                await self.app(scope, receive, send_wrapper)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            LOG.warning("Request to %s exceeded its deadline", scope["path"])
+            REJECTED_REQUESTS.labels("requests", "deadline").inc()
+            if not started:
+                await _send_error(send, 504, "Request deadline exceeded")
+        finally:
+            DEADLINE.reset(token)
+
+    @staticmethod
+    def _policy(scope: Scope) -> RoutePolicy:
+        # Routing happens after middleware, so find the route the router will pick
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                # Lets the metrics middleware label requests that are shed
+                scope["route"] = route
+                return POLICIES.get(getattr(route, "endpoint", None), DEFAULT_POLICY)
+        return DEFAULT_POLICY
+
+    @staticmethod
+    def _timeout(scope: Scope, policy: RoutePolicy) -> Optional[float]:
+        settings = get_settings()
+        timeout = settings.request_timeout if policy.timeout is DEFAULT_TIMEOUT else policy.timeout
+        if timeout is not None and timeout <= 0:
+            timeout = None
+        header = settings.request_timeout_header.lower().encode("latin-1")
+        for name, value in scope["headers"]:
+            if name == header:
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0 and (timeout is None or requested < timeout):
+                    timeout = requested
+                break
+        return timeout
+
+
+async def _send_error(send: Send, status: int, detail: str, headers: Optional[list[tuple[bytes, bytes]]] = None):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                *(headers or []),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
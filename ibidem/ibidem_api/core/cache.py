@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from ibidem.ibidem_api.core.deadline import detached_context
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache:
+    """Bounded cache with least-recently-used eviction
+
+    By default `maxsize` is the number of entries. If a `weigher` is given, it is the total weight of all entries,
+    such as their size in bytes. Entries can be given an absolute expiry time (as returned by `time.time()`), after
+    which they are treated as missing.
+    """
+
+    def __init__(self, maxsize: int, weigher: Optional[Callable[[Any], int]] = None):
+        self._maxsize = maxsize
+        self._weigher = weigher
+        self._weight = 0
+        self._data: OrderedDict[Hashable, tuple[Any, Optional[float]]] = OrderedDict()
+        self.stats = CacheStats()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    def _weigh(self, value: Any) -> int:
+        return self._weigher(value) if self._weigher else 1
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > time.time():
+                self._data.move_to_end(key)
+                self.stats.hits += 1
+                return value
+            self._remove(key)
+        self.stats.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, expires_at)
+        self._weight += self._weigh(value)
+        while self._weight > self._maxsize and self._data:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self._weight -= self._weigh(evicted)
+            self.stats.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self._weight = 0
+
+    def _remove(self, key: Hashable):
+        value, _ = self._data.pop(key)
+        self._weight -= self._weigh(value)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single call
+
+    Callers waiting on a call can be cancelled without cancelling the call itself, so the call does not inherit the
+    deadline of the caller that started it.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a call for the key is in flight"""
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn(), context=detached_context())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
@@ -1,9 +1,11 @@
 import decimal
 import logging
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Optional, Tuple, Type
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple, Type
 
-from pydantic import BaseModel, FilePath
+from pydantic import BaseModel, FilePath, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict, YamlConfigSettingsSource
 from pydantic_settings.sources import PydanticBaseSettingsSource
 from watchfiles import awatch
@@ -26,16 +28,69 @@ class Mode(str, Enum):
     RELEASE = "Release"
 
 
-class DeploySubject(BaseModel):
-    repository: str
+class EventLoop(str, Enum):
+    AUTO = "auto"
+    ASYNCIO = "asyncio"
+    UVLOOP = "uvloop"
+
+
+class HttpProtocol(str, Enum):
+    AUTO = "auto"
+    H11 = "h11"
+    HTTPTOOLS = "httptools"
+
+
+class LogFormat(str, Enum):
+    PLAIN = "plain"
+    JSON = "json"
+
+
+class DeployTarget(BaseModel):
     namespace: str
     service_account: str
 
 
+class DeploySubject(BaseModel):
+    repository: str
+    namespace: Optional[str] = None
+    service_account: Optional[str] = None
+    targets: list[DeployTarget] = []
+    ref: str = "refs/heads/main"
+    environment: Optional[str] = None
+    rate_limit: Optional[float] = None
+    rate_limit_burst: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _default_target(self) -> "DeploySubject":
+        """The namespace and service account are the first target, and the one single token requests are for
+
+        If they are not given, they are taken from the first of the targets."""
+        if (self.namespace is None) != (self.service_account is None):
+            raise ValueError("namespace and service_account must be given together")
+        if self.namespace is not None:
+            target = DeployTarget(namespace=self.namespace, service_account=self.service_account)
+            if target not in self.targets:
+                self.targets = [target, *self.targets]
+        elif self.targets:
+            self.namespace = self.targets[0].namespace
+            self.service_account = self.targets[0].service_account
+        else:
+            raise ValueError("A deploy subject needs a namespace and service_account, or a list of targets")
+        return self
+
+
+class SucResolver(BaseModel):
+    name: str
+    parser: str
+    url: str
+    interval: int = 900
+    options: dict[str, str] = {}
+
+
 class ForecastLocation(BaseModel):
     latitude: decimal.Decimal
     longtitude: decimal.Decimal
-    altitude: decimal.Decimal
+    altitude: Optional[decimal.Decimal] = None
 
 
 class Settings(BaseSettings):
@@ -45,17 +100,102 @@ class Settings(BaseSettings):
     advertised_cluster_address: str = "http://localhost:8001"
     root_path: str = ""
 
+    workers: int = 1
+    limit_concurrency: Optional[int] = None
+    backlog: int = 2048
+    loop: EventLoop = EventLoop.AUTO
+    http: HttpProtocol = HttpProtocol.AUTO
+    shared_cache_path: Optional[Path] = None
+
+    admission_max_in_flight: int = 100
+    admission_max_queued: int = 50
+    admission_queue_timeout: float = 0.5
+    request_timeout: float = 30.0
+    request_timeout_header: str = "x-request-timeout"
+
     forecast_location: Optional[ForecastLocation] = None
+    nowcast_url: Optional[str] = None
+    icon_base_url: Optional[str] = None
+    weather_timeout: float = 10.0
+    weather_max_connections: int = 10
+    weather_max_keepalive_connections: int = 5
+    forecast_min_refresh_interval: int = 60
+    forecast_max_refresh_interval: int = 900
+    forecast_retry_interval: int = 30
+    forecast_grid_size: decimal.Decimal = decimal.Decimal("0.01")
+    forecast_altitude_grid_size: decimal.Decimal = decimal.Decimal(10)
+    forecast_cell_cache_size: int = 256
+    forecast_cell_ttl: int = 3600
+    forecast_series_steps: int = 24
+    weather_stream_queue_size: int = 4
+    weather_stream_max_subscribers: int = 2000
+    weather_stream_heartbeat_interval: int = 15
+
+    icon_cache_size: int = 8 * 1024 * 1024
+    icon_max_age: int = 7 * 24 * 60 * 60
+    icon_archive_path: Optional[Path] = None
+    rendered_icon_cache_size: int = 4 * 1024 * 1024
+    icon_render_workers: int = 2
+
+    suc_resolvers: list[SucResolver] = [
+        SucResolver(
+            name="dietpi",
+            parser="dietpi",
+            url="https://raw.githubusercontent.com/MichaIng/DietPi/refs/heads/master/.update/version",
+        ),
+    ]
+    suc_timeout: float = 10.0
+    suc_retry_interval: int = 60
+    suc_poll_jitter: float = 0.1
 
     deploy_subjects_path: Optional[FilePath] = None
     deploy_subjects: list[DeploySubject] = []
 
-    model_config = SettingsConfigDict(env_nested_delimiter="__")
+    jwks_url: Optional[str] = None
+    jwks_refresh_interval: int = 3600
+    jwks_min_refetch_interval: int = 60
+
+    kube_timeout: float = 10.0
+    kube_max_connections: int = 20
+    kube_max_in_flight: int = 20
+    kube_max_queued: int = 200
+    kube_queue_timeout: float = 5.0
+
+    token_expiration_seconds: Optional[int] = None
+    token_cache_size: int = 0
+    token_cache_reuse_fraction: float = 0.5
+
+    verified_token_cache_size: int = 1024
+    token_replay_protection: bool = False
+    token_replay_cache_size: int = 10000
+
+    token_rate_limit: float = 1.0
+    token_rate_limit_burst: int = 60
+    token_client_rate_limit: float = 1.0
+    token_client_rate_limit_burst: int = 20
+
+    oidc_audience: str = "ibidem.no:deploy"
+
+    config_reload_debounce: int = 1600
+
+    log_format: LogFormat = LogFormat.PLAIN
+    log_rate_limit: float = 0.0
+    log_rate_limit_burst: int = 50
+    log_queue_size: int = 10000
+
+    warmup_timeout: float = 10.0
+
+    model_config = SettingsConfigDict(env_nested_delimiter="__", frozen=True)
 
     @property
     def debug(self):
         return self.mode == Mode.DEBUG
 
+    @property
+    def worker_processes(self) -> int:
+        """Number of worker processes started, always one in debug mode"""
+        return 1 if self.debug else self.workers
+
     @classmethod
     def settings_customise_sources(
         cls,
@@ -73,16 +213,65 @@ class Settings(BaseSettings):
         )
 
 
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    generation: int
+    settings: Settings
+
+
+_snapshot = ConfigSnapshot(0, Settings())
+_subscribers: list[tuple[frozenset[str], Callable[[Settings], None]]] = []
+
+
+def get_settings() -> Settings:
+    """The settings of the currently published configuration snapshot"""
+    return _snapshot.settings
+
+
+def current_snapshot() -> ConfigSnapshot:
+    return _snapshot
+
+
+def subscribe(sections: Iterable[str], callback: Callable[[Settings], None]):
+    """Register a callback to be called with the new settings when any of the named sections change"""
+    _subscribers.append((frozenset(sections), callback))
+
+
+def reload_config() -> bool:
+    """Load and validate the configuration, and publish it as a new snapshot if anything changed
+
+    If the configuration can't be loaded, the current snapshot is kept.
+    """
+    global _snapshot
+    old = _snapshot
+    try:
+        new_settings = Settings()
+    except Exception:
+        LOG.error("Failed to reload configuration, keeping generation %d", old.generation, exc_info=True)
+        return False
+    changed = {name for name in Settings.model_fields if getattr(old.settings, name) != getattr(new_settings, name)}
+    if not changed:
+        LOG.debug("Configuration unchanged after reload")
+        return False
+    _snapshot = ConfigSnapshot(old.generation + 1, new_settings)
+    LOG.info("Published configuration generation %d, changed sections: %s", _snapshot.generation, sorted(changed))
+    for sections, callback in _subscribers:
+        if sections & changed:
+            try:
+                callback(new_settings)
+            except Exception:
+                LOG.error("Error in configuration subscriber %r", callback, exc_info=True)
+    return True
+
+
 async def watch_config():
+    settings = get_settings()
     if settings.deploy_subjects_path:
-        async for _ in awatch(settings.deploy_subjects_path):
-            settings.__init__()
-            LOG.info(f"Reloaded configuration {settings}")
-
+        async for _ in awatch(settings.deploy_subjects_path, debounce=settings.config_reload_debounce):
+            reload_config()
 
-settings = Settings()
 
 if __name__ == "__main__":
     from pprint import pprint
 
-    pprint(settings.model_dump_json())
+    pprint(get_settings().model_dump_json())
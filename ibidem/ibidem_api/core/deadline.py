@@ -0,0 +1,53 @@
+import asyncio
+import contextvars
+from typing import Optional
+
+import httpx
+
+# Deadline of the request being served, in event loop time, or None if it has none
+DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised when an upstream request would outlive the deadline of the request being served"""
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the deadline of the request being served, or None if it has none"""
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def detached_context() -> contextvars.Context:
+    """A copy of the current context without a deadline, for work that outlives the request that started it"""
+    context = contextvars.copy_context()
+    context.run(DEADLINE.set, None)
+    return context
+
+
+class DeadlineTransport(httpx.AsyncBaseTransport):
+    """Transport cutting upstream requests short when the request being served reaches its deadline
+
+    Requests made outside of serving a request, such as background refreshes, only have their usual timeouts.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        deadline = DEADLINE.get()
+        if deadline is None:
+            return await self._transport.handle_async_request(request)
+        timeout = asyncio.timeout_at(deadline)
+        try:
+            async with timeout:
+                return await self._transport.handle_async_request(request)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            raise DeadlineExceeded("Request deadline exceeded", request=request) from None
+
+    async def aclose(self):
+        await self._transport.aclose()
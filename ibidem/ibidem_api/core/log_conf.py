@@ -1,3 +1,12 @@
+import atexit
+import copy
+import logging
+import queue
+import sys
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+
 LOGGING_CONFIG: dict = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -11,19 +20,127 @@ LOGGING_CONFIG: dict = {
             "()": "fiaas_logging.FiaasFormatter",
         },
     },
+    "filters": {
+        "rate_limit": {
+            "()": "ibidem.ibidem_api.core.log_conf.RateLimitFilter",
+            "rate": 0.0,
+            "burst": 50,
+        },
+    },
     "handlers": {
         "default": {
+            "()": "ibidem.ibidem_api.core.log_conf.QueueStreamHandler",
             "formatter": "plain",
-            "class": "logging.StreamHandler",
+            "filters": ["rate_limit"],
             "stream": "ext://sys.stdout",
+            "queue_size": 10000,
         },
     },
     "root": {"handlers": ["default"], "level": "INFO"},
 }
 
 
-def get_log_config(format, log_level):
-    config = LOGGING_CONFIG.copy()
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room to stop the listener, as the queue may be full when closing
+        self.queue.put(self._sentinel)
+
+
+class QueueStreamHandler(QueueHandler):
+    """Stream handler that only enqueues records, and leaves formatting and writing to a background thread
+
+    The queue is bounded. If the stream can't keep up, records are dropped rather than blocking the event loop,
+    and the number of dropped records is reported once the queue has room again.
+    """
+
+    def __init__(self, stream=sys.stdout, queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+        self._handler = logging.StreamHandler(stream)
+        self._listener = _Listener(self.queue, self._handler)
+        self._listener.start()
+        self._closed = False
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Records are formatted by the stream handler in the listener thread
+        self._handler.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, as they may change after the call, but keep exc_info for the formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self._dropped_record())
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _dropped_record(self) -> logging.LogRecord:
+        msg = f"Dropped {self.dropped} log records because the log stream could not keep up"
+        return logging.LogRecord(__name__, logging.WARNING, __file__, 0, msg, None, None)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._listener.stop()
+            self._handler.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """Limits how often each message may be logged, by logger and message template
+
+    Every message template gets a token bucket allowing `burst` records at once and `rate` records per second on
+    average. Records above that are dropped, and the number dropped is appended to the next record let through.
+    Warnings and errors are never dropped. A rate of 0 disables the limit, which is the default, as the token
+    endpoints log their audit trail at info level.
+    """
+
+    MAX_KEYS = 1024
+
+    def __init__(self, rate: float = 0.0, burst: int = 50):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets: OrderedDict[tuple, list] = OrderedDict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # tokens, last update, suppressed count
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+            if len(self._buckets) > self.MAX_KEYS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = f"{record.msg} ({bucket[2]} similar messages suppressed)"
+            bucket[2] = 0
+        return True
+
+
+def get_log_config(format, log_level, rate_limit: float = 0.0, rate_limit_burst: int = 50, queue_size: int = 10000):
+    config = copy.deepcopy(LOGGING_CONFIG)
     config["handlers"]["default"]["formatter"] = format
+    config["handlers"]["default"]["queue_size"] = queue_size
+    config["filters"]["rate_limit"]["rate"] = rate_limit
+    config["filters"]["rate_limit"]["burst"] = rate_limit_burst
     config["root"]["level"] = log_level
     return config
@@ -0,0 +1,151 @@
+import os
+import time
+from functools import cache
+from typing import Callable, Optional
+
+import httpx
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until the response starts, by route template",
+    ["method", "route", "status"],
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Duration of requests to upstream services",
+    ["upstream"],
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Requests to upstream services that failed, or got a server error response",
+    ["upstream", "reason"],
+)
+REJECTED_REQUESTS = Counter(
+    "rejected_requests_total",
+    "Requests turned away by rate limiting or admission control",
+    ["limiter", "reason"],
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of each request in REQUEST_DURATION
+
+    Requests are labelled with the template of the route that handled them, rather than the actual path, to keep
+    the number of series bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                self._observe(scope, str(message["status"]), start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not started:
+                self._observe(scope, "500", start)
+            raise
+
+    @staticmethod
+    def _observe(scope: Scope, status: str, start: float):
+        route = scope.get("route")
+        template = getattr(route, "path_format", None) or UNMATCHED_ROUTE
+        REQUEST_DURATION.labels(scope["method"], template, status).observe(time.perf_counter() - start)
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Transport recording latency and errors of requests to an upstream service
+
+    Requests are labelled with `upstream`, or with the host they are sent to if no upstream is given.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: Optional[str] = None):
+        self._transport = transport
+        self._upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = self._upstream or request.url.host
+        start = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            UPSTREAM_ERRORS.labels(upstream, type(e).__name__).inc()
+            raise
+        finally:
+            UPSTREAM_DURATION.labels(upstream).observe(time.perf_counter() - start)
+        if response.status_code >= 500:
+            UPSTREAM_ERRORS.labels(upstream, str(response.status_code)).inc()
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class CacheCollector(Collector):
+    """Collects hit, miss and eviction counts from the caches in the app when scraped
+
+    Caches keep plain counters in their stats, so the hot path pays nothing for being measured.
+    """
+
+    def __init__(self):
+        self._caches: dict[str, Callable[[], object]] = {}
+
+    def register(self, name: str, stats: Callable[[], object]):
+        self._caches[name] = stats
+
+    def collect(self):
+        counters = {
+            field: CounterMetricFamily(f"cache_{field}", f"Cache {field}", labels=["cache"])
+            for field in ("hits", "misses", "evictions")
+        }
+        for name, get_stats in self._caches.items():
+            stats = get_stats()
+            if stats is None:
+                continue
+            for field, counter in counters.items():
+                value = getattr(stats, field, None)
+                if value is not None:
+                    counter.add_metric([name], value)
+        yield from counters.values()
+
+
+CACHES = CacheCollector()
+REGISTRY.register(CACHES)
+
+
+def register_cache(name: str, stats: Callable[[], object]):
+    """Export the stats of a cache, as returned by `stats`, or nothing while it returns None"""
+    CACHES.register(name, stats)
+
+
+@cache
+def registry() -> CollectorRegistry:
+    """The registry to export metrics from
+
+    When running several workers, request and upstream metrics are aggregated over all workers from the files in
+    PROMETHEUS_MULTIPROC_DIR, while cache metrics are only those of the worker answering the scrape.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    multiprocess_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(multiprocess_registry)
+    multiprocess_registry.register(CACHES)
+    return multiprocess_registry
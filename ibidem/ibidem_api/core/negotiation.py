@@ -0,0 +1,29 @@
+from typing import Iterable, Optional
+
+MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": "application/msgpack",
+    "application/vnd.msgpack": "application/msgpack",
+    "application/x-yaml": "application/yaml",
+    "text/yaml": "application/yaml",
+    "text/x-yaml": "application/yaml",
+}
+
+
+def negotiate(accept: Optional[str], supported: Iterable[str]) -> str:
+    """The supported media type with the highest quality in the Accept header, defaulting to the first one"""
+    default = next(iter(supported))
+    best, best_quality = default, 0.0
+    for item in (accept or "").split(","):
+        media_type, _, params = item.partition(";")
+        media_type = MEDIA_TYPE_ALIASES.get(media_type.strip().lower(), media_type.strip().lower())
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in supported and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
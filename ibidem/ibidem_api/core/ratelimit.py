@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TokenBucketLimiter:
+    """Limits how often each key may do something, such as a repository requesting tokens
+
+    Every key gets a token bucket allowing `burst` requests at once and `rate` requests per second on average, unless
+    other limits are given for a request. Only the `max_keys` most recently used keys are tracked, so memory stays
+    bounded. A rate of 0 disables the limit.
+
+    Limits are kept in memory, so processes enforcing the same limits independently, such as the workers of a
+    server, split them into `shares` equal parts, each allowing at least one request at once.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000, shares: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._max_keys = max_keys
+        self._shares = max(shares, 1)
+        # tokens, last update
+        self._buckets: OrderedDict[Hashable, list[float]] = OrderedDict()
+
+    def acquire(self, key: Hashable, rate: Optional[float] = None, burst: Optional[int] = None) -> float:
+        """Take a token for `key`, returning 0 if there was one, or else the seconds until there will be one"""
+        return self._update(key, rate, burst, take=True)
+
+    def retry_after(self, key: Hashable, rate: Optional[float] = None, burst: Optional[int] = None) -> float:
+        """The seconds until `key` has a token, without taking it"""
+        return self._update(key, rate, burst, take=False)
+
+    def _update(self, key: Hashable, rate: Optional[float], burst: Optional[int], take: bool) -> float:
+        rate = self.rate if rate is None else rate
+        burst = self.burst if burst is None else burst
+        if rate <= 0:
+            return 0.0
+        rate = rate / self._shares
+        burst = max(burst / self._shares, 1.0)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(burst), now]
+            if take:
+                self._buckets[key] = bucket
+                if len(self._buckets) > self._max_keys:
+                    self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / rate
+        if take:
+            bucket[0] -= 1
+        return 0.0
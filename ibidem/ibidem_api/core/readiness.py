@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from pydantic import BaseModel
+
+LOG = logging.getLogger(__name__)
+
+
+class Health(str, Enum):
+    OK = "ok"
+    DEGRADED = "degraded"
+    DOWN = "down"
+
+
+@dataclass(frozen=True)
+class ComponentStatus:
+    health: Health
+    updated_at: Optional[float] = None
+    detail: Optional[str] = None
+
+
+class ComponentReport(BaseModel):
+    name: str
+    critical: bool
+    warm: bool
+    health: Health
+    age: Optional[float] = None
+    detail: Optional[str] = None
+
+
+class ReadinessReport(BaseModel):
+    status: str
+    warmed_up: bool
+    components: list[ComponentReport]
+
+
+@dataclass
+class Component:
+    name: str
+    warm_up: Callable[[], Awaitable[None]]
+    status: Callable[[], ComponentStatus]
+    critical: Callable[[], bool]
+    warm: bool = False
+    error: Optional[str] = None
+
+
+class Readiness:
+    """Dependencies the app needs to serve traffic, warmed up concurrently at startup
+
+    The app is not ready until warm-up has completed, and after that only while no critical component is down.
+    Components that are degraded, or down but not critical, are reported without making the app unready.
+    """
+
+    def __init__(self):
+        self._components: dict[str, Component] = {}
+        self.warmed_up = False
+
+    def register(
+        self,
+        name: str,
+        warm_up: Callable[[], Awaitable[None]],
+        status: Callable[[], ComponentStatus],
+        critical: Callable[[], bool] = lambda: False,
+    ):
+        self._components[name] = Component(name, warm_up, status, critical)
+
+    async def warm_up(self, timeout: float):
+        start = time.perf_counter()
+        await asyncio.gather(*(self._warm_up(component, timeout) for component in self._components.values()))
+        self.warmed_up = True
+        LOG.info("Warm-up completed in %.3fs", time.perf_counter() - start)
+
+    @staticmethod
+    async def _warm_up(component: Component, timeout: float):
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                await component.warm_up()
+        except TimeoutError:
+            component.error = f"Warm-up timed out after {timeout}s"
+            LOG.warning("Warm-up of %s timed out after %ss", component.name, timeout)
+        except Exception as e:
+            component.error = f"Warm-up failed: {e}"
+            LOG.error("Warm-up of %s failed", component.name, exc_info=True)
+        else:
+            component.warm = True
+            component.error = None
+            LOG.info("Warmed up %s in %.3fs", component.name, time.perf_counter() - start)
+
+    def reset(self):
+        self.warmed_up = False
+        for component in self._components.values():
+            component.warm = False
+            component.error = None
+
+    def report(self) -> ReadinessReport:
+        now = time.time()
+        components = []
+        ready = self.warmed_up
+        degraded = False
+        for component in self._components.values():
+            try:
+                status = component.status()
+            except Exception as e:
+                status = ComponentStatus(Health.DOWN, detail=str(e))
+            critical = component.critical()
+            if status.health == Health.DOWN and critical:
+                ready = False
+            elif status.health != Health.OK:
+                degraded = True
+            components.append(
+                ComponentReport(
+                    name=component.name,
+                    critical=critical,
+                    warm=component.warm,
+                    health=status.health,
+                    age=now - status.updated_at if status.updated_at is not None else None,
+                    detail=status.detail or component.error,
+                )
+            )
+        status = "not ready" if not ready else "degraded" if degraded else "ready"
+        return ReadinessReport(status=status, warmed_up=self.warmed_up, components=components)
+
+
+READINESS = Readiness()
+
+
+def register_component(
+    name: str,
+    warm_up: Callable[[], Awaitable[None]],
+    status: Callable[[], ComponentStatus],
+    critical: Callable[[], bool] = lambda: False,
+):
+    """Register a dependency to be warmed up at startup, and checked by the readiness probe"""
+    READINESS.register(name, warm_up, status, critical)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from ibidem.ibidem_api.core.cache import CacheStats
+from ibidem.ibidem_api.core.config import get_settings
+from ibidem.ibidem_api.core.metrics import register_cache
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Value and the time it expires at (as returned by `time.time()`), or None if it doesn't expire
+Fetched = tuple[bytes, Optional[float]]
+
+T = TypeVar("T")
+
+_NO_LEASE = ""
+
+
+@dataclass(frozen=True)
+class SharedEntry:
+    value: bytes
+    stored_at: float
+
+
+class SharedCache:
+    """Cache shared by all worker processes, stored in an SQLite database in WAL mode
+
+    Used as a second level behind the in-process caches, so a value fetched from an upstream by one worker is
+    reused by the others. Leases make sure only one caller at a time fetches a missing value, while the others
+    wait for it to appear.
+
+    The methods taking a database call are blocking, and the async methods run them in a thread. If the database
+    fails, such as when it stays locked for longer than `timeout` seconds, the async methods carry on as if the
+    value was missing, so the shared cache never makes a request fail.
+
+    The cache holds issued service account tokens, so the database is only readable by its owner.
+    """
+
+    POLL_INTERVAL = 0.05
+    PURGE_EVERY = 100
+
+    def __init__(self, path: Path, timeout: float = 5.0):
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(path, 0o600)
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._writes = 0
+        self.stats = CacheStats()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    async def _call(self, fn: Callable[..., T], *args, default: T) -> T:
+        """Run a blocking method in a thread, returning `default` if the database fails"""
+
+        def locked():
+            with self._lock:
+                return fn(*args)
+
+        try:
+            return await asyncio.to_thread(locked)
+        except sqlite3.Error:
+            LOG.warning("Shared cache failed in %s, carrying on without it", fn.__name__, exc_info=True)
+            return default
+
+    def get(self, namespace: str, key: str, max_age: Optional[float] = None) -> Optional[SharedEntry]:
+        """The entry for a key, unless it has expired or is older than `max_age` seconds"""
+        now = time.time()
+        row = self._db.execute(
+            "SELECT value, stored_at FROM entries WHERE namespace = ? AND key = ?"
+            " AND (expires_at IS NULL OR expires_at > ?) AND stored_at >= ?",
+            (namespace, key, now, now - max_age if max_age is not None else float("-inf")),
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return SharedEntry(row[0], row[1])
+
+    def set(self, namespace: str, key: str, value: bytes, expires_at: Optional[float] = None):
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, now, expires_at),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            cursor = self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            self.stats.evictions += cursor.rowcount
+
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        """Take the named lease for `ttl` seconds, returning its owner token, or None if it is already held"""
+        now = time.time()
+        owner = f"{self._pid}-{uuid.uuid4().hex}"
+        cursor = self._db.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE leases.expires_at <= ?",
+            (name, owner, now + ttl, now),
+        )
+        return owner if cursor.rowcount == 1 else None
+
+    def release(self, name: str, owner: str):
+        self._db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def add(self, namespace: str, key: str, value: bytes, expires_at: Optional[float] = None) -> bool:
+        """Store a value unless the key has one that has not expired, returning whether it was stored"""
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO entries (namespace, key, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, stored_at = excluded.stored_at,"
+            " expires_at = excluded.expires_at WHERE entries.expires_at <= ?",
+            (namespace, key, value, now, expires_at, now),
+        )
+        return cursor.rowcount == 1
+
+    async def add_once(self, namespace: str, key: str, expires_at: Optional[float] = None) -> bool:
+        """Mark a key as seen by any worker, returning False if it already was
+
+        If the database fails, the key is treated as not seen."""
+        return await self._call(self.add, namespace, key, b"", expires_at, default=True)
+
+    async def get_or_fetch(
+        self,
+        namespace: str,
+        key: str,
+        fetch: Callable[[], Awaitable[Fetched]],
+        max_age: Optional[float] = None,
+        lease_timeout: float = 10.0,
+    ) -> bytes:
+        """The value for a key, fetching and storing it if no worker has a fresh enough value
+
+        If another worker or task is already fetching the value, wait for it for up to `lease_timeout` seconds, and then
+        fetch it ourselves."""
+        entry = await self._call(self.get, namespace, key, max_age, default=None)
+        if entry is not None:
+            return entry.value
+        lease = f"{namespace}:{key}"
+        deadline = time.monotonic() + lease_timeout
+        # If the database fails, fetch without a lease
+        while (owner := await self._call(self.acquire, lease, lease_timeout, default=_NO_LEASE)) is None:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            entry = await self._call(self.get, namespace, key, max_age, default=None)
+            if entry is not None:
+                return entry.value
+            if time.monotonic() >= deadline:
+                LOG.warning("Timed out waiting for another fetch of %s, fetching it here", lease)
+                break
+        try:
+            # The worker holding the lease before us may have stored the value just before releasing it
+            entry = await self._call(self.get, namespace, key, max_age, default=None)
+            if entry is not None:
+                return entry.value
+            value, expires_at = await fetch()
+            await self._call(self.set, namespace, key, value, expires_at, default=None)
+            return value
+        finally:
+            if owner:
+                await self._call(self.release, lease, owner, default=None)
+
+
+@cache
+def shared_cache() -> Optional[SharedCache]:
+    """The cache shared by worker processes, or None if no shared cache is configured"""
+    path = get_settings().shared_cache_path
+    if path is None:
+        return None
+    LOG.info("Using shared cache at %s", path)
+    return SharedCache(path)
+
+
+register_cache("shared", lambda: getattr(shared_cache(), "stats", None))
@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 import asyncio
 import logging
+import os
 import signal
 import sys
-from contextlib import asynccontextmanager
+import tempfile
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from ibidem.ibidem_api import get_version, api, probes
-from ibidem.ibidem_api.core.config import settings, watch_config
+from ibidem.ibidem_api.core.admission import AdmissionMiddleware
+from ibidem.ibidem_api.core.config import Settings, get_settings, watch_config
 from ibidem.ibidem_api.core.log_conf import get_log_config
+from ibidem.ibidem_api.core.metrics import MetricsMiddleware
+from ibidem.ibidem_api.core.readiness import READINESS
 
 LOG = logging.getLogger(__name__)
 TITLE = "Ibidem micro APIs"
@@ -28,7 +34,16 @@ tags_metadata.extend(api.tags_metadata)
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     asyncio.create_task(watch_config())
-    yield
+    async with AsyncExitStack() as stack:
+        for api_lifespan in api.lifespans:
+            await stack.enter_async_context(api_lifespan())
+        # Warm up in the background, so the app can answer probes while it is not yet ready
+        warm_up = asyncio.create_task(READINESS.warm_up(get_settings().warmup_timeout))
+        try:
+            yield
+        finally:
+            READINESS.reset()
+            warm_up.cancel()
 
 
 app = FastAPI(
@@ -36,19 +51,42 @@ app = FastAPI(
     openapi_tags=tags_metadata,
     version=get_version(),
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
+# Middleware added last runs first, so metrics include shed requests
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(probes.router, prefix="/_")
 app.include_router(api.router, prefix="/api")
 
 
+def prepare_workers(settings: Settings, stack: ExitStack):
+    """Set up the environment shared by worker processes, which they read when importing the app
+
+    Metrics are aggregated over workers through files in a runtime directory, and unless configured otherwise,
+    the shared cache is kept in the same directory.
+    """
+    runtime_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="ibidem-api-"))
+    metrics_dir = os.path.join(runtime_dir, "metrics")
+    os.mkdir(metrics_dir)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    if settings.shared_cache_path is None:
+        os.environ["SHARED_CACHE_PATH"] = os.path.join(runtime_dir, "shared_cache.sqlite")
+
+
 def main():
+    settings = get_settings()
     log_level = logging.DEBUG if settings.debug else logging.INFO
-    log_format = "plain"
+    # Reloading requires a single worker
+    workers = settings.worker_processes
     exit_code = 0
     for sig in (signal.SIGTERM, signal.SIGINT):
         signal.signal(sig, signal_handler)
+    stack = ExitStack()
     try:
         print(f"Starting {app.title} ({app.version} with configuration {settings}")
+        if workers > 1:
+            prepare_workers(settings, stack)
         uvicorn.run(
             "ibidem.ibidem_api.main:app",
             host=settings.bind_address,
@@ -56,16 +94,29 @@ def main():
             proxy_headers=True,
             forwarded_allow_ips="*",
             root_path=settings.root_path,
-            log_config=get_log_config(log_format, log_level),
+            log_config=get_log_config(
+                settings.log_format.value,
+                log_level,
+                rate_limit=settings.log_rate_limit,
+                rate_limit_burst=settings.log_rate_limit_burst,
+                queue_size=settings.log_queue_size,
+            ),
             log_level=log_level,
             reload=settings.debug,
             access_log=settings.debug,
+            workers=workers,
+            limit_concurrency=settings.limit_concurrency,
+            backlog=settings.backlog,
+            loop=settings.loop.value,
+            http=settings.http.value,
         )
     except ExitOnSignal:
         pass
     except Exception as e:
         print(f"unwanted exception: {e}")
         exit_code = 113
+    finally:
+        stack.close()
     return exit_code
 
 
@@ -1,6 +1,12 @@
 import logging
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Response, status
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from ibidem.ibidem_api.core.admission import route_policy
+from ibidem.ibidem_api.core.metrics import registry
+from ibidem.ibidem_api.core.readiness import READINESS, ReadinessReport
 
 LOG = logging.getLogger(__name__)
 
@@ -15,10 +21,34 @@ router = APIRouter(
 
 
 @router.get("/healthy", status_code=status.HTTP_200_OK)
+@route_policy(bypass=True, timeout=None)
 def liveness():
     return "Healthy as a fish"
 
 
-@router.get("/ready", status_code=status.HTTP_200_OK)
-def readiness():
-    return "Ready as an egg"
+@router.get(
+    "/ready",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {"model": ReadinessReport},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Not ready", "model": ReadinessReport},
+    },
+)
+@route_policy(bypass=True, timeout=None)
+def readiness(detail: bool = False):
+    """Ready once warm-up has completed, and while no critical component is down
+
+    With `detail`, the state, health and age of each component is returned as JSON."""
+    report = READINESS.report()
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE if report.status == "not ready" else status.HTTP_200_OK
+    if detail:
+        return JSONResponse(report.model_dump(mode="json"), status_code=status_code)
+    message = "Ready as an egg" if status_code == status.HTTP_200_OK else "Not ready"
+    return JSONResponse(message, status_code=status_code)
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK, response_class=Response)
+@route_policy(bypass=True, timeout=None)
+def metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(generate_latest(registry()), media_type=CONTENT_TYPE_LATEST)
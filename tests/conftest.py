@@ -0,0 +1,41 @@
+import json
+
+import httpx
+import pytest
+
+from ibidem.ibidem_api.core.config import get_settings, reload_config
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Publish a configuration snapshot with the given settings, restoring the defaults afterwards"""
+
+    def configure(**values):
+        for name, value in values.items():
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            monkeypatch.setenv(name.upper(), value)
+        reload_config()
+        return get_settings()
+
+    yield configure
+    monkeypatch.undo()
+    reload_config()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route requests made through new `httpx.AsyncHTTPTransport`s to a handler set with `upstream.handler`"""
+
+    class Upstream:
+        def handler(self, request: httpx.Request) -> httpx.Response:
+            return httpx.Response(404)
+
+    stand_in = Upstream()
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **_: httpx.MockTransport(lambda r: stand_in.handler(r)))
+    return stand_in
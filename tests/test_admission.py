@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.core.admission import AdmissionMiddleware, ConcurrencyLimiter, Overloaded, route_policy
+
+
+@pytest.mark.anyio
+async def test_queued_work_is_admitted_when_a_slot_is_released():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queued=1, queue_timeout=1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0.01)
+    assert (limiter.in_flight, limiter.waiting) == (1, 1)
+    limiter.release()
+    await waiter
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+    assert (limiter.stats.admitted, limiter.stats.queued) == (2, 1)
+
+
+@pytest.mark.anyio
+async def test_work_is_rejected_when_the_queue_is_full():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queued=1, queue_timeout=1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0.01)
+    with pytest.raises(Overloaded, match="Queue is full"):
+        await limiter.acquire()
+    assert limiter.stats.rejected == 1
+    waiter.cancel()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(("queue_timeout", "waited"), [(None, 0.05), (0.01, 0.01), (10, 0.05)])
+async def test_queued_work_times_out(queue_timeout, waited):
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queued=1, queue_timeout=0.05)
+    async with limiter.slot():
+        start = asyncio.get_running_loop().time()
+        with pytest.raises(Overloaded, match="Waited more than"):
+            await limiter.acquire(queue_timeout)
+        assert asyncio.get_running_loop().time() - start == pytest.approx(waited, abs=0.03)
+    assert (limiter.in_flight, limiter.waiting, limiter.stats.timed_out) == (0, 0, 1)
+
+
+@pytest.fixture
+async def api(configure):
+    configure(admission_max_in_flight=1, admission_max_queued=0, request_timeout=0.5)
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/wait")
+    async def wait():
+        await release.wait()
+        return "Done"
+
+    @app.get("/sleep")
+    async def sleep():
+        await asyncio.sleep(5)
+
+    @app.get("/probe")
+    @route_policy(bypass=True, timeout=None)
+    async def probe():
+        return "Healthy"
+
+    app.add_middleware(AdmissionMiddleware)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+        yield client, release
+        release.set()
+
+
+@pytest.mark.anyio
+async def test_requests_over_the_limit_are_shed_but_probes_are_not(api):
+    client, release = api
+    busy = asyncio.create_task(client.get("/wait"))
+    await asyncio.sleep(0.05)
+    shed = await client.get("/wait")
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == "1"
+    assert (await client.get("/probe")).status_code == 200
+    release.set()
+    assert (await busy).status_code == 200
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("header", "waited"),
+    [(None, 0.5), ("0.05", 0.05), ("60", 0.5), ("soon", 0.5)],
+)
+async def test_requests_past_their_deadline_time_out(api, header, waited):
+    client, _ = api
+    start = time.perf_counter()
+    resp = await client.get("/sleep", headers={"x-request-timeout": header} if header else {})
+    assert resp.status_code == 504
+    assert resp.json() == {"detail": "Request deadline exceeded"}
+    assert time.perf_counter() - start == pytest.approx(waited, abs=0.1)
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from ibidem.ibidem_api.core import cache
+from ibidem.ibidem_api.core.cache import LRUCache, SingleFlight
+from ibidem.ibidem_api.core.deadline import DEADLINE
+
+
+def test_least_recently_used_entry_is_evicted():
+    lru = LRUCache(2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+    assert (lru.stats.hits, lru.stats.misses, lru.stats.evictions) == (3, 1, 1)
+
+
+def test_expired_entries_are_missing(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "time", lambda: now)
+    lru = LRUCache(2)
+    lru.set("a", 1, expires_at=now + 10)
+    assert lru.get("a") == 1
+    now += 10
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_weighted_entries_are_evicted_by_total_weight():
+    lru = LRUCache(10, weigher=len)
+    lru.set("a", b"12345")
+    lru.set("b", b"1234")
+    lru.set("a", b"123")
+    assert lru.weight == 7
+    lru.set("c", b"12345")
+    # Setting "a" again made "b" the least recently used
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (b"123", None, b"12345")
+    assert lru.weight == 8
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_are_coalesced():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    assert await asyncio.gather(*(flights.do("key", fetch) for _ in range(5))) == [1] * 5
+    assert "key" not in flights
+    assert await flights.do("key", fetch) == 2
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_cancel_the_call():
+    flights = SingleFlight()
+    deadlines = []
+
+    async def fetch():
+        deadlines.append(DEADLINE.get())
+        await asyncio.sleep(0.05)
+        return "done"
+
+    token = DEADLINE.set(asyncio.get_running_loop().time() + 1)
+    try:
+        impatient = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        assert "key" in flights
+        assert await flights.do("key", fetch) == "done"
+    finally:
+        DEADLINE.reset(token)
+    assert deadlines == [None]
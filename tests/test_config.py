@@ -0,0 +1,53 @@
+import pytest
+
+from ibidem.ibidem_api.core import config
+from ibidem.ibidem_api.core.config import current_snapshot, get_settings, reload_config, subscribe
+
+
+@pytest.fixture
+def subscribers(monkeypatch):
+    monkeypatch.setattr(config, "_subscribers", [])
+
+
+def test_changed_configuration_is_published_as_new_generation(configure):
+    before = current_snapshot()
+    settings = configure(token_cache_size=7)
+    after = current_snapshot()
+    assert after.generation == before.generation + 1
+    assert after.settings is settings
+    assert before.settings.token_cache_size == 0
+    assert not reload_config()
+    assert current_snapshot() is after
+
+
+def test_invalid_configuration_keeps_current_snapshot(configure, monkeypatch):
+    before = current_snapshot()
+    monkeypatch.setenv("TOKEN_CACHE_SIZE", "many")
+    assert not reload_config()
+    assert current_snapshot() is before
+
+
+def test_subscribers_are_called_for_changed_sections_only(configure, subscribers):
+    calls = []
+    subscribe(["token_cache_size"], lambda settings: calls.append(("cache", settings.token_cache_size)))
+    subscribe(["oidc_audience"], lambda settings: calls.append(("audience", settings.oidc_audience)))
+    configure(token_cache_size=7)
+    assert calls == [("cache", 7)]
+
+
+def test_failing_subscriber_does_not_stop_the_others(configure, subscribers):
+    calls = []
+
+    def fail(_settings):
+        raise RuntimeError("Subscriber failed")
+
+    subscribe(["token_cache_size"], fail)
+    subscribe(["token_cache_size"], lambda settings: calls.append(settings.token_cache_size))
+    configure(token_cache_size=7)
+    assert calls == [7]
+    assert get_settings().token_cache_size == 7
+
+
+@pytest.mark.parametrize(("mode", "workers", "expected"), [("Debug", 4, 1), ("Release", 4, 4), ("Release", 1, 1)])
+def test_worker_processes(configure, mode, workers, expected):
+    assert configure(mode=mode, workers=workers).worker_processes == expected
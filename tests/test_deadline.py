@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ibidem.ibidem_api.core.deadline import DEADLINE, DeadlineExceeded, DeadlineTransport, detached_context, remaining
+
+
+async def slow(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(0.2)
+    return httpx.Response(200)
+
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=DeadlineTransport(httpx.MockTransport(slow))) as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_upstream_requests_are_cut_short_at_the_deadline(client):
+    token = DEADLINE.set(asyncio.get_running_loop().time() + 0.05)
+    try:
+        assert 0 < remaining() <= 0.05
+        with pytest.raises(DeadlineExceeded):
+            await client.get("http://upstream.test/")
+    finally:
+        DEADLINE.reset(token)
+
+
+@pytest.mark.anyio
+async def test_upstream_requests_without_a_deadline_complete(client):
+    assert remaining() is None
+    assert (await client.get("http://upstream.test/")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_detached_work_has_no_deadline(client):
+    token = DEADLINE.set(asyncio.get_running_loop().time() + 0.05)
+    try:
+        task = asyncio.create_task(client.get("http://upstream.test/"), context=detached_context())
+        assert (await task).status_code == 200
+        assert DEADLINE.get() is not None
+    finally:
+        DEADLINE.reset(token)
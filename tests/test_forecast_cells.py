@@ -0,0 +1,73 @@
+import asyncio
+import decimal
+import json
+
+import httpx
+import pytest
+
+from ibidem.ibidem_api.api.v1.weather.nowcast import ForecastCells
+from tests.upstreams import nowcast_document
+
+URL = "https://met.test/weatherapi/nowcast/2.0/complete"
+
+
+@pytest.fixture
+async def cells(upstream):
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport()) as client:
+        yield ForecastCells(
+            client,
+            grid_size=decimal.Decimal("0.01"),
+            altitude_grid_size=decimal.Decimal(10),
+            maxsize=2,
+            ttl=3600,
+            series_steps=3,
+            url=URL,
+        )
+
+
+@pytest.mark.anyio
+async def test_nearby_locations_snap_to_same_cell(cells):
+    first = cells.snap(decimal.Decimal("59.9121"), decimal.Decimal("10.7479"), decimal.Decimal(14))
+    second = cells.snap(decimal.Decimal("59.9138"), decimal.Decimal("10.7452"), decimal.Decimal(6))
+    assert first == second
+    assert (first.latitude, first.longtitude, first.altitude) == (
+        decimal.Decimal("59.91"),
+        decimal.Decimal("10.75"),
+        decimal.Decimal(10),
+    )
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_for_a_cell_share_one_fetch(upstream, cells):
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=json.dumps(nowcast_document(steps=3)).encode())
+
+    upstream.handler = handler
+    location = cells.snap(decimal.Decimal("59.9"), decimal.Decimal("10.7"), None)
+    forecasts = await asyncio.gather(*(cells.get(location) for _ in range(10)))
+    assert len(requests) == 1
+    assert all(forecast is forecasts[0] for forecast in forecasts)
+    assert await cells.get(location) is forecasts[0]
+    assert cells.stats.hits == 1
+
+
+@pytest.mark.anyio
+async def test_stale_forecast_is_served_when_met_no_fails(upstream, cells):
+    responses = [
+        httpx.Response(
+            200,
+            content=json.dumps(nowcast_document(steps=3)).encode(),
+            headers={"expires": "Thu, 01 Jan 1970 00:00:00 GMT"},
+        ),
+        httpx.Response(503),
+    ]
+    upstream.handler = lambda request: responses.pop(0)
+    location = cells.snap(decimal.Decimal("59.9"), decimal.Decimal("10.7"), None)
+    stale = await cells.get(location)
+    assert stale.stale
+    assert await cells.get(location) is stale
+    assert not responses
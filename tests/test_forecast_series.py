@@ -0,0 +1,66 @@
+import decimal
+import json
+import time
+
+import cbor2
+import httpx
+import msgpack
+import pytest
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.api.v1 import weather
+from ibidem.ibidem_api.api.v1.weather.models import ForecastSeriesResponse, WeatherResponse
+from ibidem.ibidem_api.api.v1.weather.nowcast import CachedForecast
+
+SERIES = ForecastSeriesResponse(
+    timestamps=[1760427300, 1760427600],
+    temperatures=[8.3, None],
+    precipitation=[0.0, 0.4],
+    symbol_codes=["cloudy", None],
+)
+
+
+@pytest.fixture
+def forecast(request):
+    """Forecast fetched 30 seconds ago, expiring after the number of seconds given as parameter, or 300"""
+    expires_in = getattr(request, "param", 300)
+    weather_now = WeatherResponse(icon_name="cloudy", temperature=decimal.Decimal("8.3"))
+    return CachedForecast(weather_now, SERIES, fetched_at=time.time() - 30, expires_at=time.time() + expires_in)
+
+
+@pytest.fixture
+async def api(forecast):
+    app = FastAPI()
+    app.include_router(weather.router, prefix="/weather")
+    app.dependency_overrides[weather.current_forecast] = lambda: forecast
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("accept", "media_type", "decode"),
+    [
+        (None, "application/json", json.loads),
+        ("application/cbor", "application/cbor", cbor2.loads),
+        ("application/vnd.msgpack", "application/msgpack", msgpack.unpackb),
+    ],
+)
+async def test_series_is_encoded_as_requested(api, accept, media_type, decode):
+    resp = await api.get("/weather/forecast", headers={"accept": accept} if accept else {})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == media_type
+    assert resp.headers["vary"] == "accept"
+    assert ForecastSeriesResponse.model_validate(decode(resp.content)) == SERIES
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("forecast", [-1], indirect=True)
+async def test_stale_series_is_marked(api):
+    resp = await api.get("/weather/forecast")
+    assert resp.headers["warning"] == '110 - "Response is Stale"'
+    assert int(resp.headers["age"]) >= 30
+
+
+def test_series_is_encoded_once_per_forecast(forecast):
+    assert forecast.encoded_series("application/cbor") is forecast.encoded_series("application/cbor")
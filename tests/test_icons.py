@@ -0,0 +1,129 @@
+import asyncio
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from PIL import Image
+
+from ibidem.ibidem_api.api.v1 import weather
+from ibidem.ibidem_api.api.v1.weather.icons import IconCache
+from ibidem.ibidem_api.api.v1.weather.render import IconRenderer
+
+BASE_URL = "https://icons.test/png"
+
+
+def png(color=(255, 0, 0, 255), size=16) -> bytes:
+    out = BytesIO()
+    Image.new("RGBA", (size, size), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+CLEARSKY = png()
+
+
+@pytest.fixture
+def downloads(upstream):
+    paths = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        await asyncio.sleep(0.05)
+        if request.url.path == "/png/clearsky_day.png":
+            return httpx.Response(200, content=CLEARSKY)
+        return httpx.Response(404)
+
+    upstream.handler = handler
+    return paths
+
+
+@pytest.fixture
+async def client(upstream):
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport()) as client:
+        yield client
+
+
+@pytest.fixture
+def icons(client, tmp_path):
+    return IconCache(client, 1024 * 1024, directory=tmp_path, base_url=BASE_URL)
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_share_one_download(icons, downloads, tmp_path):
+    found = await asyncio.gather(*(icons.get("clearsky_day") for _ in range(10)))
+    assert {icon.content for icon in found} == {CLEARSKY}
+    assert downloads == ["/png/clearsky_day.png"]
+    assert await icons.get("clearsky_day") is found[0]
+    assert (tmp_path / "clearsky_day.png").read_bytes() == CLEARSKY
+
+
+@pytest.mark.anyio
+async def test_icons_on_disk_are_not_downloaded(client, downloads, tmp_path):
+    (tmp_path / "rain.png").write_bytes(CLEARSKY)
+    icons = IconCache(client, 1024 * 1024, directory=tmp_path, base_url=BASE_URL)
+    assert (await icons.get("rain")).content == CLEARSKY
+    assert downloads == []
+
+
+@pytest.mark.anyio
+async def test_missing_and_invalid_icons_are_none(icons, downloads):
+    assert await icons.get("nosuchicon") is None
+    assert await icons.get("../secrets") is None
+    assert await icons.get("a" * 300) is None
+    assert downloads == ["/png/nosuchicon.png"]
+
+
+@pytest.mark.anyio
+async def test_unusable_disk_cache_is_a_miss(client, downloads, tmp_path):
+    # A file where the cache directory should be makes every disk lookup and write fail
+    blocked = tmp_path / "blocked"
+    blocked.write_bytes(b"")
+    icons = IconCache(client, 1024 * 1024, directory=blocked, base_url=BASE_URL)
+    assert (await icons.get("clearsky_day")).content == CLEARSKY
+
+
+@pytest.mark.anyio
+async def test_prewarm_from_zip_archive(icons, downloads, tmp_path):
+    archive = tmp_path / "icons.zip"
+    with zipfile.ZipFile(archive, "w") as out:
+        out.writestr("weather/png/fog.png", CLEARSKY)
+        out.writestr("weather/png/README.md", "Not an icon")
+    assert icons.prewarm(archive) == 1
+    assert (await icons.get("fog")).content == CLEARSKY
+    assert downloads == []
+
+
+@pytest.fixture
+async def api(icons, downloads, tmp_path):
+    app = FastAPI()
+    app.include_router(weather.router, prefix="/weather")
+    app.dependency_overrides[weather.icons] = lambda: icons
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        renderer = IconRenderer(icons, executor, 1024 * 1024, directory=tmp_path / "rendered")
+        app.dependency_overrides[weather.icon_renderer] = lambda: renderer
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+            yield client
+
+
+@pytest.mark.anyio
+async def test_icon_is_served_with_etag(api):
+    resp = await api.get("/weather/icon/clearsky_day")
+    assert resp.status_code == 200
+    assert resp.content == CLEARSKY
+    assert resp.headers["content-type"] == "image/png"
+    assert "immutable" in resp.headers["cache-control"]
+    etag = resp.headers["etag"]
+
+    resp = await api.get("/weather/icon/clearsky_day", headers={"if-none-match": f'"other", W/{etag}'})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert resp.content == b""
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", ["nosuchicon", "a" * 300, "a%00b"])
+@pytest.mark.parametrize("params", [{}, {"format": "mono"}, {"size": 32}])
+async def test_unknown_icon_is_not_found(api, name, params):
+    assert (await api.get(f"/weather/icon/{name}", params=params)).status_code == 404
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import pytest
+from joserfc.jwk import KeySet, RSAKey
+
+from ibidem.ibidem_api.api.v1.token.keyset import KeySetCache
+from ibidem.ibidem_api.core.deadline import DEADLINE
+from ibidem.ibidem_api.core.readiness import Health
+
+URL = "https://jwks.test/.well-known/jwks"
+
+
+@pytest.fixture
+def key():
+    return RSAKey.generate_key(2048, parameters={"kid": "first"})
+
+
+@pytest.fixture
+async def keyset():
+    keyset = KeySetCache(URL, ttl=3600, min_refetch_interval=60)
+    await keyset.start()
+    yield keyset
+    await keyset.stop()
+
+
+def jwks(*keys) -> dict:
+    return KeySet(list(keys)).as_dict(private=False)
+
+
+@pytest.mark.anyio
+async def test_warm_up_indexes_keys_by_kid(upstream, keyset, key):
+    upstream.handler = lambda request: httpx.Response(200, json=jwks(key))
+    await keyset.warm_up()
+    assert (await keyset.get("first")).kid == "first"
+    assert keyset.stats.hits == 1
+    assert keyset.status().health == Health.OK
+
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetches_once(upstream, key):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=jwks(key))
+
+    upstream.handler = handler
+    keyset = KeySetCache(URL, ttl=3600, min_refetch_interval=0.1)
+    await keyset.start()
+    try:
+        await keyset.warm_up()
+        await asyncio.sleep(0.1)
+        for _ in range(3):
+            with pytest.raises(ValueError, match="Unknown key id"):
+                await keyset.get("rotated")
+    finally:
+        await keyset.stop()
+    assert len(calls) == 2
+    assert keyset.stats.misses == 3
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "response",
+    [
+        httpx.Response(200, json={"no-keys": []}),
+        httpx.Response(200, json=[]),
+        httpx.Response(200, content=b"not json"),
+        httpx.Response(500),
+    ],
+)
+async def test_failed_refresh_degrades(upstream, keyset, key, response):
+    upstream.handler = lambda request: httpx.Response(200, json=jwks(key))
+    await keyset.warm_up()
+    upstream.handler = lambda request: response
+    assert not await keyset._try_refresh()
+    assert keyset.status().health == Health.DEGRADED
+    assert keyset.stats.refresh_errors == 1
+    assert (await keyset.get("first")).kid == "first"
+
+
+@pytest.mark.anyio
+async def test_refresh_loop_survives_malformed_key_set(upstream, key):
+    responses = [httpx.Response(200, json={}), httpx.Response(200, json=jwks(key))]
+    upstream.handler = lambda request: responses.pop(0)
+    keyset = KeySetCache(URL, ttl=3600, min_refetch_interval=0.01)
+    await keyset.start()
+    try:
+        async with asyncio.timeout(1):
+            while keyset.status().health != Health.OK:
+                await asyncio.sleep(0.01)
+        assert keyset.stats.refresh_errors == 1
+    finally:
+        await keyset.stop()
+
+
+@pytest.mark.anyio
+async def test_refetch_outlives_short_request_deadline(upstream, key):
+    rotated = RSAKey.generate_key(2048, parameters={"kid": "rotated"})
+    responses = [jwks(key), jwks(key, rotated)]
+
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json=responses.pop(0))
+
+    upstream.handler = handler
+    keyset = KeySetCache(URL, ttl=3600, min_refetch_interval=0.1)
+    await keyset.start()
+    try:
+        await keyset.warm_up()
+        await asyncio.sleep(0.1)
+        token = DEADLINE.set(asyncio.get_running_loop().time() + 0.01)
+        try:
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.01):
+                    await keyset.get("rotated")
+        finally:
+            DEADLINE.reset(token)
+        # A request arriving during the refetch waits for it instead of giving up
+        assert (await keyset.get("rotated")).kid == "rotated"
+    finally:
+        await keyset.stop()
+    assert keyset.status().health == Health.OK
+    assert keyset.stats.refreshes == 2
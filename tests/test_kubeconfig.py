@@ -0,0 +1,45 @@
+import json
+
+import pytest
+import yaml
+
+from ibidem.ibidem_api.api.v1.token.kubeconfig import KUBECONFIG_ENCODERS, KubeConfigTemplate
+from ibidem.ibidem_api.api.v1.token.models import KubeConfig, TargetToken
+
+CA_CRT = b"-----BEGIN CERTIFICATE-----\nMIIB\n-----END CERTIFICATE-----\n"
+SERVER = "https://kubernetes.example.com:6443"
+TOKENS = ["eyJhbGciOiJSUzI1NiJ9.e30.c2ln", 'odd "token"\nwith: yaml: syntax', "#comment"]
+
+
+@pytest.fixture(scope="module")
+def template():
+    return KubeConfigTemplate.make(CA_CRT, SERVER)
+
+
+@pytest.mark.parametrize("token", TOKENS)
+@pytest.mark.parametrize(
+    ("media_type", "decode"), [("application/json", json.loads), ("application/yaml", yaml.safe_load)]
+)
+def test_rendered_template_matches_model(template, media_type, decode, token):
+    expected = KubeConfig.make(CA_CRT, token, SERVER).model_dump(by_alias=True)
+    assert decode(template.render(media_type, token)) == expected
+
+
+def test_template_renders_every_encoder(template):
+    assert set(template.parts) == set(template.context_parts) == set(KUBECONFIG_ENCODERS)
+
+
+def test_placeholder_in_configuration_is_rejected():
+    with pytest.raises(ValueError, match="exactly once"):
+        KubeConfigTemplate.make(CA_CRT, "https://kubeconfig-token-placeholder")
+
+
+@pytest.mark.parametrize(
+    ("media_type", "decode"), [("application/json", json.loads), ("application/yaml", yaml.safe_load)]
+)
+def test_rendered_contexts_match_model(template, media_type, decode):
+    issued = [
+        TargetToken(namespace=f"namespace-{i}", service_account="deploy", token=token) for i, token in enumerate(TOKENS)
+    ]
+    expected = KubeConfig.make_contexts(CA_CRT, SERVER, issued).model_dump(by_alias=True)
+    assert decode(template.render_contexts(media_type, issued)) == expected
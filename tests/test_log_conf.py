@@ -0,0 +1,126 @@
+import io
+import logging
+import threading
+
+import pytest
+
+from ibidem.ibidem_api.core import log_conf
+from ibidem.ibidem_api.core.log_conf import QueueStreamHandler, RateLimitFilter, get_log_config
+
+
+def record(msg="Request from %s", *args, level=logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(log_conf.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_rate_limit_drops_records_over_burst_and_reports_them(clock):
+    limit = RateLimitFilter(rate=1, burst=2)
+    assert [limit.filter(record()) for _ in range(5)] == [True, True, False, False, False]
+    clock.now += 1
+    let_through = record("Request from %s", "client")
+    assert limit.filter(let_through)
+    assert let_through.getMessage() == "Request from client (3 similar messages suppressed)"
+
+
+def test_rate_limit_is_per_message_template(clock):
+    limit = RateLimitFilter(rate=1, burst=1)
+    assert limit.filter(record("Request from %s", "client"))
+    assert not limit.filter(record("Request from %s", "other client"))
+    assert limit.filter(record("Another message"))
+
+
+def test_warnings_and_disabled_limit_are_never_dropped(clock):
+    limit = RateLimitFilter(rate=1, burst=1)
+    assert all(limit.filter(record(level=logging.WARNING)) for _ in range(10))
+    unlimited = RateLimitFilter(rate=0, burst=1)
+    assert all(unlimited.filter(record()) for _ in range(10))
+
+
+def test_logging_is_not_rate_limited_by_default():
+    config = get_log_config("plain", logging.INFO)
+    assert config["filters"]["rate_limit"]["rate"] == 0
+    limit = RateLimitFilter(burst=1)
+    assert all(limit.filter(record()) for _ in range(10))
+
+
+class BlockingStream(io.StringIO):
+    """Stream that blocks the first write until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.released = threading.Event()
+
+    def write(self, s):
+        self.writing.set()
+        self.released.wait(5)
+        return super().write(s)
+
+
+def test_queued_handler_drops_records_when_stream_is_slow():
+    stream = BlockingStream()
+    handler = QueueStreamHandler(stream, queue_size=2)
+    try:
+        handler.emit(record("first"))
+        assert stream.writing.wait(5)
+        for msg in ("queued", "queued too", "dropped", "dropped too"):
+            handler.emit(record(msg))
+        assert handler.dropped == 2
+        stream.released.set()
+        while not handler.queue.empty():
+            threading.Event().wait(0.01)
+        handler.emit(record("last"))
+    finally:
+        handler.close()
+    lines = stream.getvalue().splitlines()
+    assert lines == [
+        "first",
+        "queued",
+        "queued too",
+        "Dropped 2 log records because the log stream could not keep up",
+        "last",
+    ]
+
+
+def test_queued_handler_closes_with_full_queue():
+    stream = BlockingStream()
+    handler = QueueStreamHandler(stream, queue_size=1)
+    handler.emit(record("first"))
+    assert stream.writing.wait(5)
+    handler.emit(record("queued"))
+    threading.Timer(0.05, stream.released.set).start()
+    handler.close()
+    assert stream.getvalue().splitlines() == ["first", "queued"]
+
+
+def test_queued_handler_merges_arguments_when_logged():
+    stream = io.StringIO()
+    handler = QueueStreamHandler(stream)
+    args = ["before"]
+    try:
+        handler.emit(record("Value is %s", args))
+        args[0] = "after"
+    finally:
+        handler.close()
+    assert stream.getvalue() == "Value is ['before']\n"
+
+
+def test_get_log_config():
+    config = get_log_config("json", logging.DEBUG, rate_limit=5, rate_limit_burst=20, queue_size=100)
+    assert config["handlers"]["default"]["formatter"] == "json"
+    assert config["handlers"]["default"]["queue_size"] == 100
+    assert config["filters"]["rate_limit"] == {
+        "()": "ibidem.ibidem_api.core.log_conf.RateLimitFilter",
+        "rate": 5,
+        "burst": 20,
+    }
+    assert config["root"]["level"] == logging.DEBUG
+    assert log_conf.LOGGING_CONFIG["handlers"]["default"]["formatter"] == "plain"
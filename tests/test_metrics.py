@@ -0,0 +1,84 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from ibidem.ibidem_api.core.cache import CacheStats
+from ibidem.ibidem_api.core.metrics import UNMATCHED_ROUTE, InstrumentedTransport, MetricsMiddleware, register_cache
+
+
+def requests_seen(route: str, status: str) -> float:
+    labels = {"method": "GET", "route": route, "status": status}
+    return REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0.0
+
+
+def upstream_errors(upstream: str, reason: str) -> float:
+    labels = {"upstream": upstream, "reason": reason}
+    return REGISTRY.get_sample_value("upstream_errors_total", labels) or 0.0
+
+
+@pytest.fixture
+async def api():
+    app = FastAPI()
+
+    @app.get("/things/{name}")
+    async def thing(name: str):
+        return {"name": name}
+
+    @app.get("/broken")
+    async def broken():
+        raise RuntimeError("Broken")
+
+    app.add_middleware(MetricsMiddleware)
+    transport = httpx.ASGITransport(app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api.test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+async def test_requests_are_labelled_by_route_template(api):
+    before = requests_seen("/things/{name}", "200")
+    await api.get("/things/one")
+    await api.get("/things/two")
+    assert requests_seen("/things/{name}", "200") == before + 2
+
+
+@pytest.mark.anyio
+async def test_unrouted_requests_share_one_label(api):
+    before = requests_seen(UNMATCHED_ROUTE, "404")
+    await api.get("/nothing/here")
+    assert requests_seen(UNMATCHED_ROUTE, "404") == before + 1
+
+
+@pytest.mark.anyio
+async def test_failing_requests_are_counted(api):
+    before = requests_seen("/broken", "500")
+    assert (await api.get("/broken")).status_code == 500
+    assert requests_seen("/broken", "500") == before + 1
+
+
+@pytest.mark.anyio
+async def test_upstream_errors_are_counted_by_reason():
+    def handler(request):
+        if request.url.path == "/down":
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(503)
+
+    transport = InstrumentedTransport(httpx.MockTransport(handler), "test_upstream")
+    before_connect = upstream_errors("test_upstream", "ConnectError")
+    before_503 = upstream_errors("test_upstream", "503")
+    async with httpx.AsyncClient(transport=transport) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get("http://upstream.test/down")
+        assert (await client.get("http://upstream.test/up")).status_code == 503
+    assert upstream_errors("test_upstream", "ConnectError") == before_connect + 1
+    assert upstream_errors("test_upstream", "503") == before_503 + 1
+    assert REGISTRY.get_sample_value("upstream_request_duration_seconds_count", {"upstream": "test_upstream"}) == 2
+
+
+def test_cache_stats_are_collected_when_scraped():
+    stats = CacheStats(hits=3, misses=1)
+    register_cache("test_cache", lambda: stats)
+    assert REGISTRY.get_sample_value("cache_hits_total", {"cache": "test_cache"}) == 3
+    stats.misses += 1
+    assert REGISTRY.get_sample_value("cache_misses_total", {"cache": "test_cache"}) == 2
@@ -0,0 +1,25 @@
+import pytest
+
+from ibidem.ibidem_api.core.negotiation import negotiate
+
+SUPPORTED = ("application/json", "application/cbor", "application/msgpack")
+
+
+@pytest.mark.parametrize(
+    ("accept", "expected"),
+    [
+        (None, "application/json"),
+        ("", "application/json"),
+        ("*/*", "application/json"),
+        ("text/html", "application/json"),
+        ("application/cbor", "application/cbor"),
+        ("Application/CBOR", "application/cbor"),
+        ("application/x-msgpack", "application/msgpack"),
+        ("application/json;q=0.5, application/cbor", "application/cbor"),
+        ("application/cbor;q=0.2, application/msgpack;q=0.8", "application/msgpack"),
+        ("application/cbor;q=zero", "application/json"),
+        ("application/cbor;q=0", "application/json"),
+    ],
+)
+def test_negotiate(accept, expected):
+    assert negotiate(accept, SUPPORTED) == expected
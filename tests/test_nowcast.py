@@ -0,0 +1,109 @@
+import asyncio
+import decimal
+import json
+
+import httpx
+import pytest
+
+from ibidem.ibidem_api.api.v1.weather.nowcast import (
+    NowcastPrefetcher,
+    fetch_nowcast,
+    parse_series,
+    parse_time_steps,
+)
+from ibidem.ibidem_api.core.config import ForecastLocation
+from tests.upstreams import nowcast_document
+
+URL = "https://met.test/weatherapi/nowcast/2.0/complete"
+LOCATION = ForecastLocation(latitude=decimal.Decimal("59.9"), longtitude=decimal.Decimal("10.7"))
+
+
+def document(**first_step) -> bytes:
+    doc = nowcast_document(steps=3)
+    doc["properties"]["timeseries"][0]["data"] = first_step
+    return json.dumps(doc).encode("utf-8")
+
+
+@pytest.fixture
+async def client(upstream):
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport()) as client:
+        yield client
+
+
+def test_parse_time_steps_parses_only_requested_steps():
+    raw = json.dumps(nowcast_document(steps=10)).encode("utf-8")
+    steps = parse_time_steps(raw + b"trailing garbage is never parsed", 2)
+    assert len(steps) == 2
+    assert steps[1].data.instant.details.air_temperature == decimal.Decimal("12.4")
+
+
+def test_parse_time_steps_falls_back_to_whole_document():
+    # An escaped key hides the timeseries from the partial parser
+    raw = b'{"properties": {"time\\u0073eries": [{"data": {}}, {"data": {}}]}}'
+    assert len(parse_time_steps(raw, 1)) == 1
+
+
+def test_parse_series_parses_only_fields_a_series_needs():
+    steps = parse_series(json.dumps(nowcast_document(steps=30)).encode("utf-8"), 24)
+    assert len(steps) == 24
+    assert steps[1]["data"]["instant"]["details"] == {"air_temperature": 12.4, "precipitation_rate": 0.0}
+
+
+@pytest.mark.anyio
+async def test_fetch_derives_weather_and_series(upstream, client):
+    upstream.handler = lambda request: httpx.Response(200, content=json.dumps(nowcast_document(steps=5)).encode())
+    forecast = await fetch_nowcast(client, LOCATION, series_steps=3, url=URL)
+    assert forecast.weather.icon_name == "clearsky_day"
+    assert forecast.weather.temperature == decimal.Decimal("12.3")
+    assert forecast.series.temperatures == [12.3, 12.4, 12.5]
+
+
+@pytest.mark.anyio
+async def test_symbol_falls_back_to_next_six_hours(upstream, client):
+    upstream.handler = lambda request: httpx.Response(
+        200,
+        content=document(
+            instant={"details": {"air_temperature": 3.2}},
+            next_6_hours={"summary": {"symbol_code": "rain"}},
+        ),
+    )
+    forecast = await fetch_nowcast(client, LOCATION, url=URL)
+    assert forecast.weather.icon_name == "rain"
+    assert forecast.series.symbol_codes[0] == "rain"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "first_step",
+    [
+        {"instant": {"details": {"air_temperature": 3.2}}},
+        {"instant": {"details": {"air_temperature": 3.2}}, "next_1_hours": {"details": {}}},
+        {"next_1_hours": {"summary": {"symbol_code": "rain"}}},
+    ],
+)
+async def test_incomplete_first_step_is_a_value_error(upstream, client, first_step):
+    upstream.handler = lambda request: httpx.Response(200, content=document(**first_step))
+    with pytest.raises(ValueError):
+        await fetch_nowcast(client, LOCATION, url=URL)
+
+
+@pytest.mark.anyio
+async def test_prefetcher_keeps_refreshing_after_bad_documents(upstream, client):
+    responses = [
+        httpx.Response(200, content=document(instant={"details": {"air_temperature": 3.2}})),
+        httpx.Response(200, json=[]),
+        httpx.Response(200, content=json.dumps(nowcast_document()).encode()),
+    ]
+    upstream.handler = lambda request: responses.pop(0)
+    prefetcher = NowcastPrefetcher(
+        client, LOCATION, min_interval=60, max_interval=60, retry_interval=0.01, series_steps=3, url=URL
+    )
+    await prefetcher.start()
+    try:
+        async with asyncio.timeout(1):
+            while prefetcher.current is None:
+                await asyncio.sleep(0.01)
+    finally:
+        await prefetcher.stop()
+    assert prefetcher.current.weather.icon_name == "clearsky_day"
+    assert not responses
@@ -0,0 +1,56 @@
+import pytest
+
+from ibidem.ibidem_api.core.ratelimit import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr("ibidem.ibidem_api.core.ratelimit.time.monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_allows_burst_then_refills_at_rate(clock):
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.acquire("repo") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("repo") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.acquire("repo") == 0
+    assert limiter.acquire("other") == 0
+
+
+def test_retry_after_does_not_take_a_token(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.retry_after("client") == 0
+    assert limiter.retry_after("client") == 0
+    assert limiter.acquire("client") == 0
+    assert limiter.retry_after("client") == pytest.approx(1)
+
+
+def test_limits_given_per_request_override_defaults(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert [limiter.acquire("repo", rate=10, burst=2) for _ in range(3)] == [0, 0, pytest.approx(0.1)]
+
+
+def test_zero_rate_disables_limit(clock):
+    limiter = TokenBucketLimiter(rate=0, burst=0)
+    assert all(limiter.acquire("repo") == 0 for _ in range(100))
+
+
+def test_shares_split_limit(clock):
+    limiter = TokenBucketLimiter(rate=4, burst=8, shares=4)
+    assert [limiter.acquire("repo") for _ in range(3)] == [0, 0, pytest.approx(1)]
+    # Every share allows at least one request at once
+    limiter = TokenBucketLimiter(rate=1, burst=2, shares=4)
+    assert [limiter.acquire("repo") for _ in range(2)] == [0, pytest.approx(4)]
+
+
+def test_tracks_most_recently_used_keys(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+    # "a" was evicted, and gets a full bucket
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("c") > 0
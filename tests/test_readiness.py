@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from ibidem.ibidem_api import probes
+from ibidem.ibidem_api.core.readiness import ComponentStatus, Health, Readiness
+
+
+async def warm():
+    pass
+
+
+async def fail():
+    raise RuntimeError("Upstream unavailable")
+
+
+async def hang():
+    await asyncio.sleep(60)
+
+
+def status_of(health: Health):
+    return lambda: ComponentStatus(health)
+
+
+def component(report, name):
+    return next(component for component in report.components if component.name == name)
+
+
+def test_not_ready_until_warmed_up():
+    readiness = Readiness()
+    readiness.register("cache", warm, status_of(Health.OK))
+    assert readiness.report().status == "not ready"
+
+
+@pytest.mark.anyio
+async def test_failed_and_slow_warm_ups_are_reported():
+    readiness = Readiness()
+    readiness.register("good", warm, status_of(Health.OK))
+    readiness.register("failing", fail, status_of(Health.DEGRADED))
+    readiness.register("slow", hang, status_of(Health.DEGRADED))
+    await readiness.warm_up(timeout=0.05)
+    report = readiness.report()
+    assert report.warmed_up
+    assert report.status == "degraded"
+    assert component(report, "good").warm
+    assert component(report, "failing").detail == "Warm-up failed: Upstream unavailable"
+    assert component(report, "slow").detail == "Warm-up timed out after 0.05s"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("health", "critical", "expected"),
+    [
+        (Health.OK, True, "ready"),
+        (Health.DEGRADED, True, "degraded"),
+        (Health.DOWN, False, "degraded"),
+        (Health.DOWN, True, "not ready"),
+    ],
+)
+async def test_only_critical_components_that_are_down_make_app_unready(health, critical, expected):
+    readiness = Readiness()
+    readiness.register("component", warm, status_of(health), lambda: critical)
+    await readiness.warm_up(timeout=1)
+    assert readiness.report().status == expected
+
+
+@pytest.mark.anyio
+async def test_failing_status_is_down():
+    def broken():
+        raise RuntimeError("No status")
+
+    readiness = Readiness()
+    readiness.register("component", warm, broken, lambda: True)
+    await readiness.warm_up(timeout=1)
+    report = readiness.report()
+    assert report.status == "not ready"
+    assert component(report, "component").detail == "No status"
+
+
+@pytest.fixture
+async def api(monkeypatch):
+    readiness = Readiness()
+    readiness.register("component", warm, status_of(Health.DEGRADED))
+    monkeypatch.setattr(probes, "READINESS", readiness)
+    app = FastAPI()
+    app.include_router(probes.router, prefix="/_")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+        yield client, readiness
+
+
+@pytest.mark.anyio
+async def test_readiness_probe(api):
+    client, readiness = api
+    assert (await client.get("/_/ready")).status_code == 503
+    await readiness.warm_up(timeout=1)
+    resp = await client.get("/_/ready")
+    assert resp.status_code == 200
+    assert resp.json() == "Ready as an egg"
+    detail = (await client.get("/_/ready", params={"detail": True})).json()
+    assert detail["status"] == "degraded"
+    assert detail["components"][0]["health"] == "degraded"
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from ibidem.ibidem_api.api.v1.weather.icons import Icon
+from ibidem.ibidem_api.api.v1.weather.render import IconFormat, IconRenderer, render_icon
+
+
+def png(color, size=16) -> bytes:
+    out = BytesIO()
+    Image.new("RGBA", (size, size), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.mark.parametrize(
+    ("icon_format", "length"),
+    [(IconFormat.MONO, 2 * 10), (IconFormat.GRAY8, 10 * 10), (IconFormat.RGB565, 10 * 10 * 2)],
+)
+def test_raw_formats_have_expected_length(icon_format, length):
+    assert len(render_icon(png((0, 0, 0, 255)), 10, icon_format)) == length
+
+
+def test_png_is_scaled():
+    with Image.open(BytesIO(render_icon(png((0, 0, 0, 255)), 32, IconFormat.PNG))) as image:
+        assert image.size == (32, 32)
+
+
+def test_transparency_is_rendered_white():
+    transparent = png((0, 0, 0, 0))
+    assert render_icon(transparent, 8, IconFormat.GRAY8) == b"\xff" * 64
+    assert render_icon(transparent, 8, IconFormat.MONO) == b"\xff" * 8
+    assert render_icon(transparent, 1, IconFormat.RGB565) == b"\xff\xff"
+
+
+def test_rgb565_is_big_endian():
+    assert render_icon(png((255, 0, 0, 255)), 1, IconFormat.RGB565) == b"\xf8\x00"
+    assert render_icon(png((0, 0, 255, 255)), 1, IconFormat.RGB565) == b"\x00\x1f"
+    assert render_icon(png((0, 255, 0, 255)), 1, IconFormat.RGB565) == b"\x07\xe0"
+    assert render_icon(png((0x12, 0x34, 0x56, 255)), 1, IconFormat.RGB565) == b"\x11\xaa"
+
+
+class FakeIcons:
+    def __init__(self):
+        self.requested = []
+
+    async def get(self, name):
+        self.requested.append(name)
+        await asyncio.sleep(0.01)
+        return Icon.from_content(png((0, 0, 0, 255))) if name == "clearsky_day" else None
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield IconRenderer(FakeIcons(), executor, 1024 * 1024, directory=tmp_path)
+
+
+@pytest.mark.anyio
+async def test_concurrent_renders_of_one_icon_render_once(renderer, tmp_path):
+    rendered = await asyncio.gather(*(renderer.get("clearsky_day", 10, IconFormat.GRAY8) for _ in range(5)))
+    assert {icon.content for icon in rendered} == {b"\x00" * 100}
+    assert renderer._icons.requested == ["clearsky_day"]
+    assert (tmp_path / "clearsky_day_10.gray8").read_bytes() == b"\x00" * 100
+
+
+@pytest.mark.anyio
+async def test_rendering_unknown_icon_is_none(renderer):
+    assert await renderer.get("nosuchicon", 10, IconFormat.MONO) is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", ["a\x00b", "../clearsky_day", "a" * 300])
+async def test_rendering_invalid_name_is_none(renderer, tmp_path, name):
+    assert await renderer.get(name, 10, IconFormat.MONO) is None
+    assert renderer._icons.requested == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import stat
+import time
+
+import pytest
+
+from ibidem.ibidem_api.core.shared_cache import SharedCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "shared.sqlite"
+
+
+@pytest.fixture
+def workers(path):
+    """Caches of separate workers, sharing one database"""
+    caches = [SharedCache(path) for _ in range(4)]
+    yield caches
+    for cache in caches:
+        cache.close()
+
+
+def test_database_is_private(workers, path):
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_fetch_once(workers):
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.1)
+        return b"value", None
+
+    values = await asyncio.gather(*(cache.get_or_fetch("ns", "key", fetch) for cache in workers for _ in range(5)))
+    assert values == [b"value"] * 20
+    assert len(fetches) == 1
+
+
+@pytest.mark.anyio
+async def test_expired_and_old_entries_are_fetched_again(workers):
+    first, second = workers[:2]
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return f"value-{len(fetches)}".encode(), time.time() + 0.1
+
+    assert await first.get_or_fetch("ns", "key", fetch) == b"value-1"
+    assert await second.get_or_fetch("ns", "key", fetch) == b"value-1"
+    assert await second.get_or_fetch("ns", "key", fetch, max_age=0) == b"value-2"
+    await asyncio.sleep(0.1)
+    assert await first.get_or_fetch("ns", "key", fetch) == b"value-3"
+    assert second.stats.hits == 1
+
+
+@pytest.mark.anyio
+async def test_add_once_is_shared_and_expires(workers):
+    first, second = workers[:2]
+    assert await first.add_once("ids", "a", time.time() + 0.1)
+    assert not await second.add_once("ids", "a", time.time() + 0.1)
+    assert await second.add_once("ids", "b")
+    await asyncio.sleep(0.1)
+    assert await second.add_once("ids", "a")
+
+
+@pytest.mark.anyio
+async def test_locked_database_is_a_miss(path):
+    cache = SharedCache(path, timeout=0.01)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN EXCLUSIVE")
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return b"value", None
+
+    try:
+        assert await cache.get_or_fetch("ns", "key", fetch) == b"value"
+        assert await cache.get_or_fetch("ns", "key", fetch) == b"value"
+        assert await cache.add_once("ids", "a")
+    finally:
+        blocker.rollback()
+        blocker.close()
+        cache.close()
+    assert len(fetches) == 2
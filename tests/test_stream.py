@@ -0,0 +1,73 @@
+import asyncio
+import decimal
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.api.v1 import weather
+from ibidem.ibidem_api.api.v1.weather.models import WeatherResponse
+from ibidem.ibidem_api.api.v1.weather.stream import WeatherBroadcaster
+
+
+def weather_at(temperature) -> WeatherResponse:
+    return WeatherResponse(icon_name="clearsky_day", temperature=decimal.Decimal(temperature))
+
+
+def event(temperature) -> bytes:
+    return f"event: weather\ndata: {weather_at(temperature).model_dump_json()}\n\n".encode()
+
+
+@pytest.mark.anyio
+async def test_subscribers_get_current_weather_and_changes_only():
+    broadcaster = WeatherBroadcaster(queue_size=4, max_subscribers=10, heartbeat_interval=15)
+    broadcaster.publish(weather_at(1))
+    events = broadcaster.events()
+    assert await anext(events) == event(1)
+    broadcaster.publish(weather_at(1))
+    broadcaster.publish(weather_at(2))
+    assert await anext(events) == event(2)
+    assert len(broadcaster) == 1
+    await events.aclose()
+    assert len(broadcaster) == 0
+
+
+@pytest.mark.anyio
+async def test_heartbeats_are_sent_while_nothing_changes():
+    broadcaster = WeatherBroadcaster(queue_size=4, max_subscribers=10, heartbeat_interval=0.01)
+    events = broadcaster.events()
+    assert [await anext(events), await anext(events)] == [b": heartbeat\n\n"] * 2
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_slow_subscriber_is_dropped():
+    broadcaster = WeatherBroadcaster(queue_size=2, max_subscribers=10, heartbeat_interval=15)
+    slow, fast = broadcaster.events(), broadcaster.events()
+    # Start both subscriptions, waiting for their first event
+    waiting = [asyncio.create_task(anext(slow)), asyncio.create_task(anext(fast))]
+    await asyncio.sleep(0)
+    broadcaster.publish(weather_at(0))
+    await asyncio.gather(*waiting)
+    for temperature in range(1, 4):
+        broadcaster.publish(weather_at(temperature))
+        await anext(fast)
+    assert broadcaster.dropped == 1
+    assert len(broadcaster) == 1
+    with pytest.raises(StopAsyncIteration):
+        await anext(slow)
+    await fast.aclose()
+
+
+@pytest.mark.anyio
+async def test_stream_is_refused_when_full():
+    broadcaster = WeatherBroadcaster(queue_size=2, max_subscribers=1, heartbeat_interval=15)
+    subscriber = broadcaster.events()
+    waiting = asyncio.create_task(anext(subscriber))
+    await asyncio.sleep(0)
+    app = FastAPI()
+    app.include_router(weather.router, prefix="/weather")
+    app.dependency_overrides[weather.broadcaster] = lambda: broadcaster
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+        assert (await client.get("/weather/stream")).status_code == 503
+    waiting.cancel()
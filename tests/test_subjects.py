@@ -0,0 +1,62 @@
+import pytest
+
+from ibidem.ibidem_api.api.v1.token.subjects import SubjectIndex
+from ibidem.ibidem_api.core.config import DeploySubject
+
+
+def subject(repository, namespace="apps", **kwargs) -> DeploySubject:
+    return DeploySubject(repository=repository, namespace=namespace, service_account="deployer", **kwargs)
+
+
+def claims(repository, ref="refs/heads/main", environment=None) -> dict:
+    return {"repository": repository, "ref": ref, "environment": environment}
+
+
+def test_exact_match_takes_precedence_over_patterns():
+    index = SubjectIndex([subject("org/*", "org"), subject("org/app", "app"), subject("*", "any")])
+    assert index.match(claims("org/app")).namespace == "app"
+    assert index.match(claims("org/other")).namespace == "org"
+    assert index.match(claims("elsewhere/app")).namespace == "any"
+    assert len(index) == 3
+
+
+def test_longer_prefix_takes_precedence():
+    index = SubjectIndex([subject("org/*", "org"), subject("org/team-*", "team")])
+    assert index.match(claims("org/team-app")).namespace == "team"
+    assert index.match(claims("org/app")).namespace == "org"
+
+
+def test_prefix_is_not_enough_to_match():
+    index = SubjectIndex([subject("org/app-?")])
+    assert index.match(claims("org/app-1")) is not None
+    assert index.match(claims("org/app-10")) is None
+    assert index.match(claims("org/ap")) is None
+
+
+@pytest.mark.parametrize(
+    "token_claims, namespace",
+    [
+        (claims("org/app"), "main"),
+        (claims("org/app", ref="refs/tags/v1.0"), "release"),
+        (claims("org/app", ref="refs/heads/feature"), None),
+        (claims("org/app", ref="refs/heads/main", environment="production"), "production"),
+    ],
+)
+def test_first_subject_matching_ref_and_environment_is_selected(token_claims, namespace):
+    index = SubjectIndex(
+        [
+            subject("org/app", "production", environment="prod*"),
+            subject("org/app", "main"),
+            subject("org/*", "release", ref="refs/tags/v*"),
+        ]
+    )
+    match = index.match(token_claims)
+    assert (match.namespace if match else None) == namespace
+
+
+def test_lookup_among_many_subjects():
+    subjects = [subject(f"org-{i}/*" if i % 2 else f"org-{i}/repo", f"ns-{i}") for i in range(10000)]
+    index = SubjectIndex(subjects)
+    assert index.match(claims("org-4711/anything")).namespace == "ns-4711"
+    assert index.match(claims("org-4712/repo")).namespace == "ns-4712"
+    assert index.match(claims("org-4712/other")) is None
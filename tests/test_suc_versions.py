@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from ibidem.ibidem_api.api.v1 import suc
+from ibidem.ibidem_api.api.v1.suc.versions import (
+    VersionResolver,
+    VersionScheduler,
+    parse_dietpi,
+    parse_github_release,
+    parse_k3s_channel,
+    parse_regex,
+    parse_version,
+)
+from ibidem.ibidem_api.core.config import SucResolver
+
+DIETPI_VERSION = "G_REMOTE_VERSION_CORE=9\nG_REMOTE_VERSION_SUB=17\nG_REMOTE_VERSION_RC=2\nG_GITBRANCH=master\n"
+
+
+def test_parse_dietpi():
+    assert parse_dietpi(httpx.Response(200, text=DIETPI_VERSION), {}) == "9.17.2"
+    with pytest.raises(ValueError):
+        parse_dietpi(httpx.Response(200, text="G_GITBRANCH=master\n"), {})
+
+
+def test_parse_github_release():
+    resp = httpx.Response(200, json={"tag_name": "v1.2.3"})
+    assert parse_github_release(resp, {}) == "v1.2.3"
+    assert parse_github_release(resp, {"strip_prefix": "v"}) == "1.2.3"
+
+
+def test_parse_k3s_channel():
+    resp = httpx.Response(
+        200, json={"data": [{"id": "stable", "latest": "v1.30.4+k3s1"}, {"id": "latest", "latest": "v1.31.0+k3s1"}]}
+    )
+    assert parse_k3s_channel(resp, {}) == "v1.30.4+k3s1"
+    assert parse_k3s_channel(resp, {"channel": "latest"}) == "v1.31.0+k3s1"
+    with pytest.raises(ValueError, match="not found"):
+        parse_k3s_channel(resp, {"channel": "testing"})
+
+
+def test_parse_regex():
+    resp = httpx.Response(200, text="name: os\nversion: 2024.10\n")
+    assert parse_regex(resp, {"pattern": r"^version: (\S+)$"}) == "2024.10"
+    assert parse_regex(resp, {"pattern": r"\d+\.\d+"}) == "2024.10"
+    with pytest.raises(ValueError):
+        parse_regex(resp, {})
+
+
+@pytest.mark.parametrize("parse", [parse_github_release, parse_k3s_channel])
+@pytest.mark.parametrize(
+    "resp",
+    [
+        httpx.Response(200, json=[]),
+        httpx.Response(200, json="v1.2.3"),
+        httpx.Response(200, json={"tag_name": ["v1"], "data": {"id": "stable"}}),
+        httpx.Response(200, json={"data": ["stable"]}),
+        httpx.Response(200, text="<html>"),
+    ],
+)
+def test_json_parsers_reject_unexpected_shapes(parse, resp):
+    with pytest.raises(ValueError):
+        parse(resp, {})
+
+
+@pytest.mark.anyio
+async def test_poll_keeps_going_after_errors(upstream):
+    responses = [
+        httpx.Response(200, json=[]),
+        httpx.Response(500),
+        httpx.Response(200, json={"tag_name": "v1.2.3"}),
+    ]
+    upstream.handler = lambda request: responses.pop(0)
+    scheduler = VersionScheduler(retry_interval=0.01, jitter=0)
+    await scheduler.start([SucResolver(name="app", parser="github_release", url="https://api.github.test/latest")])
+    try:
+        async with asyncio.timeout(1):
+            while scheduler.cached("app") is None:
+                await asyncio.sleep(0.01)
+    finally:
+        await scheduler.stop()
+    assert scheduler.cached("app").version == "v1.2.3"
+    assert not responses
+
+
+@pytest.mark.anyio
+async def test_failed_poll_keeps_last_known_version(upstream):
+    responses = [httpx.Response(200, json={"tag_name": "v1.2.3"}), httpx.Response(200, json=[])]
+    upstream.handler = lambda request: responses.pop(0)
+    scheduler = VersionScheduler(retry_interval=3600, jitter=0)
+    config = SucResolver(name="app", parser="github_release", url="https://api.github.test/latest", interval=0)
+    await scheduler.start([config])
+    try:
+        async with asyncio.timeout(1):
+            while responses:
+                await asyncio.sleep(0.01)
+        assert (await scheduler.get("app")).version == "v1.2.3"
+        assert scheduler.stats.hits == 1
+    finally:
+        await scheduler.stop()
+
+
+def test_parse_version_defaults_missing_parts_to_zero():
+    assert parse_version("G_REMOTE_VERSION_CORE = 9\n") == "9.0.0"
+
+
+@pytest.mark.anyio
+async def test_resolver_revalidates_with_etag(upstream):
+    requests = []
+    versions = iter([(DIETPI_VERSION, '"a"'), (None, None), (DIETPI_VERSION.replace("=17", "=18"), '"b"')])
+
+    def handler(request):
+        requests.append(request.headers.get("if-none-match"))
+        text, etag = next(versions)
+        if text is None:
+            return httpx.Response(304)
+        return httpx.Response(200, text=text, headers={"etag": etag})
+
+    upstream.handler = handler
+    resolver = VersionResolver(
+        SucResolver(name="dietpi", parser="dietpi", url="https://dietpi.test/version"), parse_dietpi
+    )
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport()) as client:
+        first = await resolver.resolve(client, None)
+        unchanged = await resolver.resolve(client, first)
+        changed = await resolver.resolve(client, unchanged)
+    assert requests == [None, '"a"', '"a"']
+    assert (first.version, first.revision, first.etag) == ("9.17.2", 1, '"a"')
+    assert (unchanged.version, unchanged.revision, unchanged.etag) == ("9.17.2", 1, '"a"')
+    assert unchanged.fetched_at >= first.fetched_at
+    assert (changed.version, changed.revision, changed.etag) == ("9.18.2", 2, '"b"')
+
+
+@pytest.fixture
+async def api(upstream):
+    upstream.handler = lambda request: httpx.Response(200, text=DIETPI_VERSION)
+    scheduler = VersionScheduler(retry_interval=3600, jitter=0)
+    await scheduler.start([SucResolver(name="dietpi", parser="dietpi", url="https://dietpi.test/version")])
+    app = FastAPI()
+    app.include_router(suc.router, prefix="/suc")
+    app.dependency_overrides[suc.version_scheduler] = lambda: scheduler
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://api.test") as client:
+            yield client
+    finally:
+        await scheduler.stop()
+
+
+@pytest.mark.anyio
+async def test_resolve_redirects_to_current_version(api):
+    resp = await api.get("/suc/dietpi")
+    assert resp.status_code == 302
+    assert resp.headers["location"] == "http://api.test/suc/dietpi/9.17.2"
+    assert (await api.get("/suc/unknown")).status_code == 404
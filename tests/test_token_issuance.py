@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from lightkube import AsyncClient, KubeConfig
+from starlette.responses import JSONResponse
+
+from ibidem.ibidem_api.api.v1 import token as token_api
+from ibidem.ibidem_api.api.v1.token import _get_k8s_token, _get_k8s_tokens
+from ibidem.ibidem_api.core.config import DeployTarget
+from tests.upstreams import TokenSigner, upstream_app
+
+LATENCY = 0.2
+
+
+@pytest.fixture
+def kube():
+    stand_in = upstream_app(TokenSigner("test"), latency=LATENCY)
+
+    async def app(scope, receive, send):
+        if "/namespaces/broken/" in scope.get("path", ""):
+            status = {"kind": "Status", "status": "Failure", "message": "Broken namespace", "code": 500}
+            await JSONResponse(status, status_code=500)(scope, receive, send)
+        else:
+            await stand_in(scope, receive, send)
+
+    config = KubeConfig.from_dict(
+        {
+            "current-context": "test",
+            "clusters": [{"name": "test", "cluster": {"server": "http://kubernetes.test"}}],
+            "contexts": [{"name": "test", "context": {"cluster": "test", "user": "test"}}],
+            "users": [{"name": "test", "user": {"token": "test"}}],
+        }
+    )
+    return AsyncClient(config, transport=httpx.ASGITransport(app))
+
+
+@pytest.mark.anyio
+async def test_parallel_token_requests_take_one_round_trip(kube):
+    requests = 20
+    start = time.perf_counter()
+    tokens = await asyncio.gather(*(_get_k8s_token(kube, f"sa-{i}", "default") for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    assert len(set(tokens)) == requests
+    assert elapsed < 2 * LATENCY
+
+
+@pytest.fixture
+def token_cache(configure):
+    configure(token_cache_size=16, token_expiration_seconds=3600)
+    return token_api.issued_tokens()
+
+
+@pytest.mark.anyio
+async def test_issued_tokens_are_reused(kube, token_cache):
+    first = await _get_k8s_token(kube, "deployer", "apps")
+    assert await _get_k8s_token(kube, "deployer", "apps") == first
+    assert await _get_k8s_token(kube, "deployer", "other") != first
+    assert token_cache.stats.hits == 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_for_one_service_account_issue_one_token(kube, token_cache):
+    tokens = await asyncio.gather(*(_get_k8s_token(kube, "deployer", "apps") for _ in range(10)))
+    assert len(set(tokens)) == 1
+
+
+@pytest.mark.anyio
+async def test_tokens_are_issued_again_past_the_reuse_fraction(kube, configure):
+    configure(token_cache_size=16, token_expiration_seconds=3600, token_cache_reuse_fraction=0)
+    first = await _get_k8s_token(kube, "deployer", "apps")
+    assert await _get_k8s_token(kube, "deployer", "apps") != first
+
+
+@pytest.mark.anyio
+async def test_batch_reports_failed_targets(kube):
+    targets = [
+        DeployTarget(namespace="apps", service_account="deployer"),
+        DeployTarget(namespace="broken", service_account="deployer"),
+    ]
+    issued, failed = await _get_k8s_tokens(kube, targets)
+    assert (issued.namespace, issued.error) == ("apps", None)
+    assert issued.token is not None
+    assert (failed.namespace, failed.token) == ("broken", None)
+    assert "Broken namespace" in failed.error
+
+
+@pytest.mark.anyio
+async def test_batch_targets_over_the_kubernetes_call_limit_fail(kube, configure):
+    configure(kube_max_in_flight=1, kube_max_queued=0)
+    targets = [DeployTarget(namespace="apps", service_account=f"sa-{i}") for i in range(2)]
+    tokens = await _get_k8s_tokens(kube, targets)
+    assert sorted(str(target.error) for target in tokens) == ["None", "Too many token requests in progress"]
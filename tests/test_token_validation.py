@@ -0,0 +1,153 @@
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from joserfc import jwt
+from joserfc.jwk import RSAKey
+
+from ibidem.ibidem_api.api.v1 import token as token_api
+from ibidem.ibidem_api.api.v1.token import _validate_subject, _verified_claims
+from ibidem.ibidem_api.api.v1.token.keyset import StaticKeySet
+from ibidem.ibidem_api.api.v1.token.models import TokenRequest
+from ibidem.ibidem_api.api.v1.token.subjects import SubjectIndex
+from ibidem.ibidem_api.core.config import DeploySubject
+from ibidem.ibidem_api.core.shared_cache import shared_cache
+
+KEY = RSAKey.generate_key(2048, parameters={"kid": "test"})
+FORGER = RSAKey.generate_key(2048, parameters={"kid": "test"})
+CLIENT = "192.0.2.1"
+
+
+def sign(repository="org/repo", key=KEY, **claims) -> TokenRequest:
+    now = int(time.time()) - 10
+    claims = {
+        "iss": "https://token.actions.githubusercontent.com",
+        "aud": "ibidem.no:deploy",
+        "repository": repository,
+        "ref": "refs/heads/main",
+        "jti": str(uuid.uuid4()),
+        "iat": now,
+        "nbf": now,
+        "exp": now + 3600,
+        **claims,
+    }
+    return TokenRequest(token=jwt.encode({"alg": "RS256", "kid": "test"}, claims, key))
+
+
+@pytest.fixture(autouse=True)
+def limits(configure):
+    configure(token_rate_limit=1, token_rate_limit_burst=2, token_client_rate_limit=1, token_client_rate_limit_burst=2)
+    for factory in (token_api.client_limiter, token_api.repository_limiter, token_api.verified_tokens):
+        factory.cache_clear()
+    token_api.used_token_ids().clear()
+
+
+@pytest.fixture
+def subjects():
+    return SubjectIndex([DeploySubject(repository="org/*", namespace="apps", service_account="deployer")])
+
+
+async def validate(data, subjects):
+    return await _validate_subject(data, StaticKeySet(KEY), subjects, CLIENT)
+
+
+async def status_of(data, subjects):
+    with pytest.raises(HTTPException) as e:
+        await validate(data, subjects)
+    return e.value.status_code
+
+
+@pytest.mark.anyio
+async def test_valid_token_matches_subject(subjects):
+    subject = await validate(sign(), subjects)
+    assert (subject.namespace, subject.service_account) == ("apps", "deployer")
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "data",
+    [
+        pytest.param(sign(key=FORGER), id="forged signature"),
+        pytest.param(TokenRequest(token="a.b.c"), id="malformed"),
+        pytest.param(sign(exp=int(time.time()) - 60), id="expired"),
+    ],
+)
+async def test_unverifiable_tokens_are_rejected_and_charged_to_client(subjects, data):
+    assert await status_of(data, subjects) in (400, 401)
+    assert await status_of(data, subjects) in (400, 401)
+    assert await status_of(sign(), subjects) == 429
+
+
+@pytest.mark.anyio
+async def test_forged_signature_is_unauthorized(subjects):
+    assert await status_of(sign(key=FORGER), subjects) == 401
+
+
+@pytest.mark.anyio
+async def test_repository_is_rate_limited(subjects):
+    data = sign()
+    await validate(data, subjects)
+    await validate(data, subjects)
+    with pytest.raises(HTTPException) as e:
+        await validate(data, subjects)
+    assert e.value.status_code == 429
+    assert e.value.headers["retry-after"] == "1"
+
+
+@pytest.mark.anyio
+async def test_unknown_repository_is_not_found(subjects):
+    assert await status_of(sign(repository="other/repo"), subjects) == 404
+
+
+@pytest.mark.anyio
+async def test_replayed_token_is_rejected(configure, subjects):
+    configure(token_replay_protection=True)
+    data = sign()
+    await validate(data, subjects)
+    assert await status_of(data, subjects) == 401
+
+
+@pytest.mark.anyio
+async def test_token_replayed_to_another_worker_is_rejected(configure, subjects, tmp_path):
+    configure(token_replay_protection=True, shared_cache_path=str(tmp_path / "shared.sqlite"))
+    shared_cache.cache_clear()
+    try:
+        data = sign()
+        await validate(data, subjects)
+        # Another worker has neither verified the token nor seen its id
+        token_api.verified_tokens().clear()
+        token_api.used_token_ids().clear()
+        assert await status_of(data, subjects) == 401
+    finally:
+        shared_cache().close()
+        shared_cache.cache_clear()
+
+
+class CountingKeySet(StaticKeySet):
+    def __init__(self, key):
+        super().__init__(key)
+        self.lookups = 0
+
+    async def get(self, kid):
+        self.lookups += 1
+        return await super().get(kid)
+
+
+@pytest.mark.anyio
+async def test_verified_token_is_not_verified_again():
+    keyset = CountingKeySet(KEY)
+    data = sign()
+    first = await _verified_claims(data.token, keyset)
+    assert await _verified_claims(data.token, keyset) == first
+    assert keyset.lookups == 1
+
+
+@pytest.mark.anyio
+async def test_verified_tokens_are_forgotten_when_the_audience_changes(configure):
+    data = sign()
+    await _verified_claims(data.token, StaticKeySet(KEY))
+    configure(oidc_audience="elsewhere")
+    with pytest.raises(HTTPException) as e:
+        await _verified_claims(data.token, StaticKeySet(KEY))
+    assert e.value.status_code == 400
@@ -0,0 +1,17 @@
+import pytest
+
+from ibidem.ibidem_api.api.v1 import weather
+
+
+@pytest.mark.anyio
+async def test_weather_routes_share_one_client_for_the_lifetime_of_the_app(upstream, monkeypatch, tmp_path):
+    # The HTTP cache is stored below the working directory
+    monkeypatch.chdir(tmp_path)
+    async with weather.lifespan():
+        client = weather.http_client()
+        assert not client.is_closed
+        assert weather.icons()._client is client
+        assert weather.forecast_cells()._client is client
+        assert weather.nowcast()._client is client
+    assert client.is_closed
+    assert weather.http_client() is None
@@ -0,0 +1,139 @@
+"""Local stand-ins for the upstream services used by the app, shared by the tests and the benchmarks"""
+
+import asyncio
+import datetime
+import io
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request, Response
+from joserfc import jwt
+from joserfc.jwk import KeySet, RSAKey
+from PIL import Image
+
+GITHUB_ISSUER = "https://token.actions.githubusercontent.com"
+DIETPI_VERSION = "G_REMOTE_VERSION_CORE=9\nG_REMOTE_VERSION_SUB=17\nG_REMOTE_VERSION_RC=2\nG_GITBRANCH=master\n"
+
+
+def nowcast_document(steps: int = 100) -> dict:
+    """A METJSONForecast document shaped like the real nowcast, with `steps` five minute steps"""
+    start = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+    timeseries = []
+    for i in range(steps):
+        time_step = start + datetime.timedelta(minutes=5 * i)
+        timeseries.append(
+            {
+                "time": time_step.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "data": {
+                    "instant": {
+                        "details": {
+                            "air_temperature": round(12.3 + i * 0.1, 1),
+                            "precipitation_rate": 0.0,
+                            "relative_humidity": 80.1,
+                            "wind_from_direction": 200.2,
+                            "wind_speed": 3.4,
+                            "wind_speed_of_gust": 5.6,
+                        }
+                    },
+                    "next_1_hours": {
+                        "summary": {"symbol_code": "clearsky_day"},
+                        "details": {"precipitation_amount": 0.0},
+                    },
+                },
+            }
+        )
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [10.7, 59.9, 10]},
+        "properties": {
+            "meta": {"updated_at": timeseries[0]["time"], "units": {"air_temperature": "celsius"}},
+            "timeseries": timeseries,
+        },
+    }
+
+
+def _icon_png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGBA", (200, 200), (255, 200, 0, 255)).save(out, format="PNG")
+    return out.getvalue()
+
+
+class TokenSigner:
+    """Signs GitHub Actions style OIDC tokens with a key published by the fake JWKS endpoint"""
+
+    def __init__(self, audience: str):
+        self._audience = audience
+        self._key = RSAKey.generate_key(2048, parameters={"kid": "benchmark"})
+
+    def jwks(self) -> dict:
+        return KeySet([self._key]).as_dict(private=False)
+
+    def sign(self, repository: str, ref: str = "refs/heads/main", lifetime: int = 3600) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": GITHUB_ISSUER,
+            "aud": self._audience,
+            "repository": repository,
+            "ref": ref,
+            "jti": str(uuid.uuid4()),
+            "iat": now,
+            "nbf": now,
+            "exp": now + lifetime,
+        }
+        return jwt.encode({"alg": "RS256", "kid": "benchmark"}, claims, self._key)
+
+
+def upstream_app(signer: TokenSigner, latency: float = 0.0) -> FastAPI:
+    """A single app serving the met.no nowcast, GitHub JWKS, raw.githubusercontent.com files and the Kubernetes
+    TokenRequest API, each answering after `latency` seconds"""
+    app = FastAPI()
+    icon = _icon_png()
+    document = json.dumps(nowcast_document()).encode("utf-8")
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    nowcast_headers = {"expires": expires.strftime("%a, %d %b %Y %H:%M:%S GMT")}
+
+    async def delay():
+        if latency:
+            await asyncio.sleep(latency)
+
+    @app.get("/weatherapi/nowcast/2.0/complete")
+    async def nowcast():
+        await delay()
+        return Response(content=document, media_type="application/json", headers=nowcast_headers)
+
+    @app.get("/.well-known/jwks")
+    async def jwks():
+        await delay()
+        return signer.jwks()
+
+    @app.get("/dietpi/version")
+    async def dietpi_version(request: Request):
+        await delay()
+        if request.headers.get("if-none-match") == '"dietpi"':
+            return Response(status_code=304, headers={"etag": '"dietpi"'})
+        return Response(DIETPI_VERSION, media_type="text/plain", headers={"etag": '"dietpi"'})
+
+    @app.get("/weathericons/{name}.png")
+    async def weather_icon(name: str):
+        await delay()
+        return Response(icon, media_type="image/png")
+
+    @app.post("/api/v1/namespaces/{namespace}/serviceaccounts/{name}/token")
+    async def token_request(namespace: str, name: str, request: Request):
+        await delay()
+        body = await request.json()
+        expiration_seconds = body.get("spec", {}).get("expirationSeconds") or 3600
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expiration_seconds)
+        return {
+            "apiVersion": "authentication.k8s.io/v1",
+            "kind": "TokenRequest",
+            "metadata": {"name": name, "namespace": namespace},
+            "spec": body.get("spec", {}),
+            "status": {
+                "token": f"benchmark-{uuid.uuid4()}",
+                "expirationTimestamp": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+        }
+
+    return app